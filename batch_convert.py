@@ -0,0 +1,132 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os.path import basename, dirname, exists, isdir, join, splitext
+
+from nml_to_rekord import Traktor2Rekordbox
+from rekord_to_nml import Rekordbox2Traktor
+from xml_backend import BACKENDS, backend, use_backend
+
+CONVERSIONS = {
+    # extension: (original, target, output extension)
+    ".nml": ("traktor", "rekordbox", ".xml"),
+    ".xml": ("rekordbox", "traktor", ".nml"),
+}
+
+
+def list_files(source):
+    """
+    List the files to convert from a directory (all .nml and .xml files it contains)
+    or from a manifest (one path per line, relative to the manifest, # for comments).
+    """
+    if isdir(source):
+        return sorted(
+            join(source, name) for name in os.listdir(source)
+            if splitext(name)[1].lower() in CONVERSIONS
+        )
+
+    with open(source, encoding="utf-8") as manifest:
+        lines = [line.strip() for line in manifest]
+    return [join(dirname(source), line) for line in lines if line and not line.startswith("#")]
+
+
+def output_path(input_file, output_dir):
+    name, ext = splitext(basename(input_file))
+    if ext.lower() == ".xml":
+        name = name.replace(".rekordbox", "")
+    return join(output_dir, f"{name}{CONVERSIONS[ext.lower()][2]}")
+
+
+def convert_file(input_file, output_file):
+    """
+    Convert a single file, in the direction given by its extension.
+    Runs in the worker processes, which are reused (with their warm mapping caches) for all files.
+
+    Returns:
+        tuple: (number of converted tracks, error message or None)
+    """
+    try:
+        original = CONVERSIONS[splitext(input_file)[1].lower()][0]
+
+        if original == "traktor":
+            converter = Traktor2Rekordbox()
+            converter.convert_nml_to_xml(input_file, output_file)
+        else:
+            converter = Rekordbox2Traktor()
+            converter.convert_xml_to_nml(input_file, output_file)
+        return converter.track_index, None
+    except Exception as e:
+        return 0, f"{type(e).__name__}: {e}"
+
+
+def convert_batch(files, output_dir, jobs=None):
+    """
+    Convert many files with a pool of worker processes.
+
+    Returns:
+        dict: Aggregate summary of the batch
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    failures = {}
+    # Files with the same name (e.g. listed from several directories) would overwrite each other's output:
+    # only the first one is converted
+    first_files = {}
+    converted, outputs = [], []
+    for file in files:
+        output = output_path(file, output_dir)
+        first_file = first_files.setdefault(os.path.normcase(os.path.abspath(output)), file)
+        if first_file is file:
+            converted.append(file)
+            outputs.append(output)
+        else:
+            failures[file] = f"Same output file as {first_file} ({output})"
+    start = time.perf_counter()
+
+    if jobs == 1:
+        results = [convert_file(file, output) for file, output in zip(converted, outputs)]
+    else:
+        # Small files: send them by chunks to limit inter-process round trips
+        chunksize = max(1, len(converted) // (4 * (jobs or os.cpu_count() or 1)))
+        with ProcessPoolExecutor(jobs, initializer=use_backend, initargs=(backend.name,)) as pool:
+            results = list(pool.map(convert_file, converted, outputs, chunksize=chunksize))
+
+    duration = time.perf_counter() - start
+    tracks = sum(track_count for track_count, _ in results)
+    failures.update((file, error) for file, (_, error) in zip(converted, results) if error)
+
+    return {
+        "files": len(files),
+        "tracks": tracks,
+        "failures": failures,
+        "seconds": duration,
+        "files_per_sec": len(files) / duration if duration else 0.0,
+        "tracks_per_sec": tracks / duration if duration else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a directory (or a manifest) of NML and Rekordbox XML files")
+    parser.add_argument("source", help="directory of .nml / .xml files, or manifest listing one file per line")
+    parser.add_argument("-o", "--output-dir", help="where converted files are written (default: <source>/converted)")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes (0: one per CPU)")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not exists(args.source):
+        print(f"Error: {args.source} does not exist")
+    else:
+        output_dir = args.output_dir or join(args.source if isdir(args.source) else dirname(args.source), "converted")
+        summary = convert_batch(list_files(args.source), output_dir, jobs=args.jobs or None)
+
+        for file, error in summary["failures"].items():
+            print(f"❌ {file}: {error}")
+        print(
+            f"☕️ {summary['files'] - len(summary['failures'])}/{summary['files']} files converted to {output_dir} "
+            f"in {summary['seconds']:.2f}s ({summary['files_per_sec']:.1f} files/s, "
+            f"{summary['tracks_per_sec']:.0f} tracks/s, {len(summary['failures'])} failures)"
+        )
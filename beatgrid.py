@@ -0,0 +1,49 @@
+BPM_TOLERANCE = 0.001
+PHASE_TOLERANCE = 0.001  # Seconds
+
+
+class GridCompactor:
+    """
+    Drop the beatgrid markers that don't change the grid: a marker is redundant when it has the BPM and
+    time signature of the last kept marker, and falls on one of its beats (within the tolerances).
+    Markers are compared with the last kept one, not the previous one, so that small differences don't add up:
+    every beat of a kept marker stays where it was.
+    """
+
+    def __init__(self, bpm_tolerance=BPM_TOLERANCE, phase_tolerance=PHASE_TOLERANCE):
+        """
+        Args:
+            bpm_tolerance: Largest BPM difference between merged markers
+            phase_tolerance: Largest distance in seconds between a dropped marker and the closest beat of the grid
+        """
+        self.bpm_tolerance = bpm_tolerance
+        self.phase_tolerance = phase_tolerance
+        self.dropped = 0
+
+    def is_redundant(self, anchor, marker):
+        """Whether the grid of `anchor` already puts a beat on `marker`, at its BPM."""
+        if marker.metro != anchor.metro or anchor.bpm <= 0 or abs(marker.bpm - anchor.bpm) > self.bpm_tolerance:
+            return False
+
+        beat = 60 / anchor.bpm
+        beats = (marker.start - anchor.start) / beat
+        return abs(beats - round(beats)) * beat <= self.phase_tolerance
+
+    def compact(self, tempos):
+        """
+        Args:
+            tempos: TempoMarkers of a track, in grid order
+
+        Returns:
+            list: Markers left once the redundant ones are dropped
+        """
+        if len(tempos) < 2:
+            return tempos
+
+        kept = [tempos[0]]
+        for marker in tempos[1:]:
+            if not self.is_redundant(kept[-1], marker):
+                kept.append(marker)
+
+        self.dropped += len(tempos) - len(kept)
+        return kept
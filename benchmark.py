@@ -0,0 +1,173 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from os.path import join
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported
+    resource = None
+
+from generate_collection import CollectionGenerator
+from nml_custom_loops import TraktorCustomLoops
+from nml_to_rekord import Traktor2Rekordbox
+from rekord_to_nml import Rekordbox2Traktor
+from xml_backend import BACKENDS, backend, use_backend
+
+
+def convert_nml_to_xml(nml_file, xml_file, output):
+    Traktor2Rekordbox().convert_nml_to_xml(nml_file, output)
+
+
+def stream_nml_to_xml(nml_file, xml_file, output):
+    Traktor2Rekordbox().stream_nml_to_xml(nml_file, output)
+
+
+def convert_xml_to_nml(nml_file, xml_file, output):
+    Rekordbox2Traktor().convert_xml_to_nml(xml_file, output)
+
+
+def stream_xml_to_nml(nml_file, xml_file, output):
+    Rekordbox2Traktor().stream_xml_to_nml(xml_file, output)
+
+
+def process_loops(nml_file, xml_file, output):
+    # The collection is modified in place
+    shutil.copyfile(nml_file, output)
+    TraktorCustomLoops().process_loops(output)
+
+
+CASES = {
+    "convert_nml_to_xml": convert_nml_to_xml,
+    "stream_nml_to_xml": stream_nml_to_xml,
+    "convert_xml_to_nml": convert_xml_to_nml,
+    "stream_xml_to_nml": stream_xml_to_nml,
+    "process_loops": process_loops,
+}
+
+
+def peak_rss():
+    """Peak resident memory of the current process, in bytes (None when unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case, nml_file, xml_file, output, backend_name):
+    """Time a case in the current process (a fresh one, so that its peak memory is its own)."""
+    function = CASES[case]
+    use_backend(backend_name)
+
+    start = time.perf_counter()
+    function(nml_file, xml_file, output)
+    return time.perf_counter() - start, peak_rss()
+
+
+def benchmark(sizes, cases, repeat=1, work_dir=None, **collection):
+    """
+    Generate collections of each size, then time each case on them, in a new process per run.
+
+    Args:
+        sizes: Number of tracks of the generated collections
+        cases: Names of the cases to run (keys of CASES)
+        repeat: Runs of each case, the fastest one is kept
+        work_dir: Where collections are generated (a temporary directory by default)
+        collection: CollectionGenerator options (cues, grid_markers, playlist_depth, ...)
+
+    Returns:
+        list: One result dict per size and case
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as directory:
+        for tracks in sizes:
+            nml_file, xml_file = join(directory, f"{tracks}.nml"), join(directory, f"{tracks}.xml")
+            generator = CollectionGenerator(tracks, **collection)
+            generator.write_nml(nml_file)
+            generator.write_rekordbox(xml_file)
+
+            for case in cases:
+                runs = []
+                for _ in range(repeat):
+                    with context.Pool(1) as pool:
+                        runs.append(pool.apply(run_case, (case, nml_file, xml_file, join(directory, "output"), backend.name)))
+                seconds = min(duration for duration, _ in runs)
+                peaks = [peak for _, peak in runs if peak is not None]
+
+                results.append({
+                    "case": case,
+                    "tracks": tracks,
+                    "seconds": seconds,
+                    "tracks_per_sec": tracks / seconds if seconds else 0.0,
+                    "peak_rss_bytes": max(peaks) if peaks else None,
+                })
+                print(
+                    f"⏱️ {case} {tracks} tracks: {seconds:.2f}s ({results[-1]['tracks_per_sec']:.0f} tracks/s"
+                    + (f", {max(peaks) / 2 ** 20:.0f} MiB peak)" if peaks else ")")
+                )
+    return results
+
+
+def compare(results, previous):
+    """Print the throughput of each result relative to the same case in a previous run."""
+    baseline = {(result["case"], result["tracks"]): result for result in previous["results"]}
+    for result in results:
+        before = baseline.get((result["case"], result["tracks"]))
+        if before and before["tracks_per_sec"]:
+            print(f"📈 {result['case']} {result['tracks']} tracks: x{result['tracks_per_sec'] / before['tracks_per_sec']:.2f} throughput")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the conversions on synthetic collections")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000], help="collection sizes")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES), help="conversions to time")
+    parser.add_argument("--cues", type=int, default=8, help="average number of cues and loops per track")
+    parser.add_argument("--grid-markers", type=int, default=0, help="flexible beatgrid markers per track, besides the first one")
+    parser.add_argument("--playlist-depth", type=int, default=2, help="depth of the playlist folder tree")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each case, the fastest one is kept")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    parser.add_argument("--work-dir", help="where collections are generated (default: temporary directory)")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON file the results are saved to")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = benchmark(
+        args.tracks,
+        args.cases,
+        repeat=args.repeat,
+        work_dir=args.work_dir,
+        cues=args.cues,
+        grid_markers=args.grid_markers,
+        playlist_depth=args.playlist_depth,
+    )
+
+    report = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "backend": backend.name,
+        "parameters": {"cues": args.cues, "grid_markers": args.grid_markers, "playlist_depth": args.playlist_depth},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"☕️ results were saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
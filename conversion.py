@@ -0,0 +1,107 @@
+from datetime import datetime
+
+from consts import DATE_FORMAT
+from dates import DateTranscoder
+from locations import LocationCodec
+from mappings import (
+    rekordbox_cue_color,
+    rekordbox_cue_type,
+    rekordbox_tonality,
+    rekordbox_track_color,
+    traktor_cue_color,
+    traktor_cue_type,
+    traktor_key,
+    traktor_track_color,
+)
+from stats import NO_STATS
+
+# Shared by all conversions: its caches don't depend on the direction
+location_codec = LocationCodec()
+
+
+class ConversionContext:
+    """
+    Direction of a conversion, with its settings and the state of its helpers (date memo, counters).
+
+    Helpers depending on the direction are methods of the context instead of functions reading
+    module globals, so that conversions in both directions can run at the same time in one process
+    (e.g. in threads), each with its own context.
+    """
+
+    def __init__(self, original, target, stats=None, grid=None):
+        """
+        Args:
+            original: Software of the source collection ("traktor" or "rekordbox")
+            target: Software of the converted collection
+            stats: ConversionStats collecting stage timings and counters (None to disable them)
+            grid: GridCompactor dropping redundant beatgrid markers (None to keep them all)
+        """
+        self.original = original
+        self.target = target
+        self.stats = stats if stats is not None else NO_STATS
+        self.grid = grid
+        self.dates = DateTranscoder(DATE_FORMAT.get(original), DATE_FORMAT.get(target))
+        self.locations = location_codec
+
+    def format_date(self, date):
+        """Convert a date to the target format (returned as is if it can't be parsed), see DateTranscoder."""
+        return self.dates.transcode(date)
+
+    def today(self):
+        """Get today's date in the target format."""
+        return datetime.now().strftime(DATE_FORMAT.get(self.target))
+
+    def count_dates(self):
+        """Add the date conversion counters to the stats."""
+        self.stats.count("date_fallbacks", self.dates.fallbacks)
+        self.stats.count("date_failures", self.dates.failures)
+
+    def take_counters(self):
+        """
+        Counters collected since the last call (date counters included), reset for the next item:
+        workers return them with each converted item, to be merged into the stats of the main process.
+        """
+        self.count_dates()
+        self.dates.fallbacks = self.dates.failures = 0
+        counters, self.stats.counters = self.stats.counters, {}
+        return {name: number for name, number in counters.items() if number}
+
+    def get_track_color(self, color):
+        if self.target == "traktor":
+            return traktor_track_color(color)
+        elif self.target == "rekordbox":
+            return rekordbox_track_color(color)
+        return ""
+
+    def get_cue_type(self, ctype):
+        if self.target == "traktor":
+            return traktor_cue_type(ctype)
+        elif self.target == "rekordbox":
+            return rekordbox_cue_type(ctype)
+        return "0"
+
+    def get_tonalikey(self, tonalikey):
+        if self.target == "rekordbox":
+            return rekordbox_tonality(tonalikey)
+        elif self.target == "traktor":
+            return traktor_key(tonalikey)
+        return ""
+
+    def get_location(self, location):
+        """Convert a location: Rekordbox URL to TraktorLocation, or Traktor LOCATION element to Rekordbox URL."""
+        if self.target == "traktor":
+            return self.locations.to_traktor(location)
+        elif self.target == "rekordbox":
+            return self.locations.to_rekordbox(location)
+        return ""
+
+    def get_cue_color(self, **kwargs):
+        """Get the color attributes of a cue in the target format (empty when it has none)."""
+        if self.target == "traktor":
+            color = traktor_cue_color(kwargs.get("r"), kwargs.get("g"), kwargs.get("b"))
+            return {"COLOR": color} if color else {}
+        elif self.target == "rekordbox":
+            rgb = rekordbox_cue_color(kwargs.get("ctype"), kwargs.get("cname"))
+            if rgb:
+                return {"Red": rgb[0], "Green": rgb[1], "Blue": rgb[2]}
+        return {}
@@ -0,0 +1,88 @@
+from datetime import date, datetime
+
+MEMO_SIZE = 4096  # Distinct dates remembered: a whole library only has a few thousand
+
+
+def ymd_separator(date_format):
+    """Separator of a "%Y<sep>%m<sep>%d" format, None for other formats."""
+    if len(date_format) == 8 and date_format[:2] == "%Y" and date_format[3:5] == "%m" and date_format[6:] == "%d" \
+            and date_format[2] == date_format[5]:
+        return date_format[2]
+    return None
+
+
+class DateTranscoder:
+    """
+    Convert dates from a format to another, like `strptime(...).strftime(...)` would.
+
+    Year/month/day formats (Traktor "2025/4/16", Rekordbox "2025-04-16") are split and reformatted
+    without strptime, which is only the fallback for other formats and unusual values.
+    Results are memoized, as collections share a few thousand distinct dates between all their tracks.
+    Dates that can't be parsed are returned as they are.
+    """
+
+    def __init__(self, source_format, target_format, memo_size=MEMO_SIZE):
+        """
+        Args:
+            source_format: strptime format of the dates to convert
+            target_format: strftime format of the converted dates
+            memo_size: Number of distinct dates remembered, the memo is emptied when it is full
+        """
+        self.source_format = source_format
+        self.target_format = target_format
+        self.source_separator = ymd_separator(source_format)
+        self.target_separator = ymd_separator(target_format)
+        self.memo = {}
+        self.memo_size = memo_size
+        self.hits = 0
+        self.fallbacks = 0  # Distinct dates converted by strptime / strftime
+        self.failures = 0  # Distinct dates that could not be parsed
+
+    def transcode(self, value):
+        if not value:
+            return value
+
+        result = self.memo.get(value)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        result = self.fast_transcode(value)
+        if result is None:
+            result = self.slow_transcode(value)
+
+        if len(self.memo) >= self.memo_size:
+            self.memo.clear()
+        self.memo[value] = result
+        return result
+
+    def fast_transcode(self, value):
+        """Split and reformat a year/month/day date, None when it is not a plain one."""
+        if self.source_separator is None or self.target_separator is None:
+            return None
+
+        parts = value.split(self.source_separator)
+        if len(parts) != 3:
+            return None
+        year, month, day = parts
+        # strptime takes 4-digit years and 1 or 2-digit months and days, of ASCII digits only
+        digits = year + month + day
+        if len(year) != 4 or year[0] == "0" or not 0 < len(month) <= 2 or not 0 < len(day) <= 2 \
+                or not digits.isascii() or not digits.isdecimal():
+            return None
+
+        try:
+            parsed = date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+        separator = self.target_separator
+        return f"{parsed.year}{separator}{parsed.month:02d}{separator}{parsed.day:02d}"
+
+    def slow_transcode(self, value):
+        try:
+            result = datetime.strptime(value, self.source_format).strftime(self.target_format)
+        except (TypeError, ValueError):
+            self.failures += 1
+            return value
+        self.fallbacks += 1
+        return result
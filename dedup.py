@@ -0,0 +1,202 @@
+import os
+import re
+from typing import NamedTuple
+
+from conversion import location_codec
+from expat_reader import iter_collection_expat
+from fields import get_file_path
+from locations import EMPTY_LOCATION
+from playlist_index import PlaylistKeyIndex
+from streaming import iter_collection
+
+DEDUP_POLICIES = ("first", "newest", "most-cues")
+DATE_SEPARATORS = re.compile(r"[/-]")
+NML_CUE_TYPES = ("0", "5")  # Cue (hot cue or memory cue), loop: not fades, loads or grid markers
+REKORDBOX_CUE_TYPES = ("0", "4")  # Cue (hot cue or memory cue), loop
+
+
+class TrackProbe(NamedTuple):
+    """What a collection track is matched and ranked on, read from its source element."""
+
+    path: str  # Traktor PRIMARYKEY of its file ("VOLUME/:DIR/:FILE"), empty when unknown
+    track_id: str  # Rekordbox TrackID, empty for Traktor entries
+    title: str
+    artist: str
+    duration: str
+    modified: tuple  # Modification date (and time) as integers, empty when unknown
+    cues: int
+
+
+def date_key(date):
+    """Comparable (year, month, day) of a Traktor or Rekordbox date, empty if it can't be read."""
+    try:
+        return tuple(int(part) for part in DATE_SEPARATORS.split(date))
+    except ValueError:
+        return ()
+
+
+def count_cues(marks, type_attribute, name_attribute, cue_types):
+    """Number of cues and loops among the cue elements of a track."""
+    # The converters write the first grid marker as an "AutoGrid" cue as well, which isn't a cue of the user
+    return sum(
+        1 for mark in marks if mark.get(type_attribute) in cue_types and mark.get(name_attribute) != "AutoGrid"
+    )
+
+
+def probe_nml_entry(entry):
+    """Read the TrackProbe of a Traktor collection ENTRY."""
+    info = entry.find("INFO")
+    modified = date_key(entry.get("MODIFIED_DATE", ""))
+    if modified:
+        modified += (int(entry.get("MODIFIED_TIME") or 0),)
+    return TrackProbe(
+        get_file_path(entry.find("LOCATION")),
+        "",
+        entry.get("TITLE", ""),
+        entry.get("ARTIST", ""),
+        info.get("PLAYTIME", "") if info is not None else "",
+        modified,
+        count_cues(entry.iterfind("CUE_V2"), "TYPE", "NAME", NML_CUE_TYPES),
+    )
+
+
+def probe_rekordbox_track(track):
+    """Read the TrackProbe of a Rekordbox collection TRACK."""
+    location = location_codec.to_traktor(track.get("Location", ""))
+    return TrackProbe(
+        location.key if location is not EMPTY_LOCATION else "",
+        track.get("TrackID", ""),
+        track.get("Name", ""),
+        track.get("Artist", ""),
+        track.get("TotalTime", ""),
+        date_key(track.get("DateModified", "")),
+        count_cues(track.iterfind("POSITION_MARK"), "Type", "Name", REKORDBOX_CUE_TYPES),
+    )
+
+
+class Deduplicator:
+    """
+    Drop the copies of collection tracks that appear several times, keeping one survivor per group.
+
+    Tracks are grouped through a hash index on their normalized location (see PlaylistKeyIndex.normalize),
+    and optionally on their title, artist and duration: a track joins the group of the first of its keys
+    already indexed. The survivor of a group is chosen by the policy:
+        - "first": the first copy, decided while the collection is converted
+        - "newest": the copy modified last, "most-cues": the copy with the most hot cues, memory cues and loops,
+          which need the whole collection to be scanned first (ties keep the first copy)
+    Dropped copies are remembered with their survivor, so that playlist references can be redirected.
+    """
+
+    def __init__(self, policy="first", match_metadata=False):
+        """
+        Args:
+            policy: How the survivor of a group is chosen, one of DEDUP_POLICIES
+            match_metadata: Also match tracks with the same title, artist and duration
+        """
+        if policy not in DEDUP_POLICIES:
+            raise ValueError(f"Unknown dedup policy {policy!r}, expected one of {DEDUP_POLICIES}")
+        self.policy = policy
+        self.match_metadata = match_metadata
+        self.groups = {}  # Match key -> group
+        self.survivors = []  # Group -> (position in the collection, score, TrackProbe) of its survivor
+        self.item_groups = []  # Position in the collection -> group, once scanned
+        self.position = 0
+        self.aliases = []  # (dropped TrackProbe, survivor TrackProbe)
+
+    @property
+    def needs_scan(self):
+        return self.policy != "first"
+
+    @property
+    def dropped(self):
+        return len(self.aliases)
+
+    def match_keys(self, probe):
+        keys = []
+        if probe.path:
+            keys.append(PlaylistKeyIndex.normalize(probe.path))
+        if self.match_metadata and probe.title and probe.duration:
+            keys.append((probe.title.casefold(), probe.artist.casefold(), probe.duration))
+        return keys
+
+    def group(self, probe):
+        """Group of a track: the group of the first of its keys already indexed, else a new one."""
+        keys = self.match_keys(probe)
+        group = next((self.groups[key] for key in keys if key in self.groups), None)
+        if group is None:
+            group = len(self.survivors)
+            self.survivors.append(None)
+        for key in keys:
+            self.groups.setdefault(key, group)
+        return group
+
+    def score(self, probe):
+        if self.policy == "newest":
+            return probe.modified
+        if self.policy == "most-cues":
+            return probe.cues
+        return 0
+
+    def scan(self, probes):
+        """
+        Choose the survivor of every group before the conversion.
+
+        Args:
+            probes: TrackProbe of every collection track, in collection order
+
+        Returns:
+            int: Number of tracks that will be dropped
+        """
+        for position, probe in enumerate(probes):
+            group = self.group(probe)
+            self.item_groups.append(group)
+            score = self.score(probe)
+            survivor = self.survivors[group]
+            if survivor is None or score > survivor[1]:
+                self.survivors[group] = (position, score, probe)
+        return len(self.item_groups) - len(self.survivors)
+
+    def keep(self, probe):
+        """Whether the next track of the collection survives (called in collection order)."""
+        position = self.position
+        self.position += 1
+        if self.item_groups:
+            survivor = self.survivors[self.item_groups[position]]
+        elif self.needs_scan:
+            raise ValueError(f"The {self.policy!r} dedup policy needs the collection to be scanned first")
+        else:
+            group = self.group(probe)
+            survivor = self.survivors[group]
+            if survivor is None:
+                self.survivors[group] = survivor = (position, 0, probe)
+
+        if survivor[0] == position:
+            return True
+        self.aliases.append((probe, survivor[2]))
+        return False
+
+
+def scan_collection(dedup, source, item_tag, probe, expat=False):
+    """
+    Scan the collection of a document for a Deduplicator before it is streamed, with a first reading pass.
+
+    Args:
+        dedup: Deduplicator to plan
+        source: Path or seekable binary file object of the document (rewound after the scan)
+        item_tag: Tag of the collection items ("ENTRY" for NML, "TRACK" for Rekordbox)
+        probe: Function reading the TrackProbe of an item
+        expat: Read the document with the expat reader
+    """
+    if isinstance(source, (str, os.PathLike)):
+        start = None
+    elif source.seekable():
+        start = source.tell()
+    else:
+        raise ValueError(
+            f"The {dedup.policy!r} dedup policy reads streamed collections twice: "
+            "give a path, bytes or a seekable stream, or use the 'first' policy"
+        )
+    reader = iter_collection_expat if expat else iter_collection
+    dedup.scan(probe(element) for kind, element in reader(source, item_tag) if kind == "item")
+    if start is not None:
+        source.seek(start)
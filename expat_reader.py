@@ -0,0 +1,176 @@
+import mmap
+import os
+import re
+from xml.parsers import expat
+
+from streaming import BUFFER_SIZE
+
+# Tags read in place: quoted attribute values may hold ">"
+START_TAG = re.compile(rb"""<[^\s/>]+(?:\s+[^\s=]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*(/?)>""")
+END_TAG = re.compile(rb"</[^>]*>")
+
+
+class AttributeNode:
+    """
+    Element read by the expat reader: a tag, its attributes and its children, without text
+    (NML and Rekordbox documents only hold attributes).
+
+    Implements the part of the ElementTree API read by the converters: `tag`, `attrib`, `get`, and
+    `find`, `findall`, `iterfind` with a child tag (no paths).
+    """
+
+    __slots__ = ("tag", "attrib", "get", "children")
+
+    def __init__(self, tag, attrib):
+        self.tag = tag
+        self.attrib = attrib
+        self.get = attrib.get  # Read for every field: the dict method is called without going through Python
+        self.children = []
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return len(self.children)
+
+    def find(self, tag):
+        for child in self.children:
+            if child.tag == tag:
+                return child
+        return None
+
+    def findall(self, tag):
+        return [child for child in self.children if child.tag == tag]
+
+    def iterfind(self, tag):
+        return (child for child in self.children if child.tag == tag)
+
+
+def feed_chunks(parser, source, chunk_size):
+    """
+    Feed a document to an expat parser chunk by chunk, yielding after each chunk.
+    Files are memory-mapped, so chunks are views of the page cache instead of copies read into Python.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                parser.Parse(b"", True)
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                view = memoryview(data)
+                try:
+                    for start in range(0, len(view), chunk_size):
+                        parser.Parse(view[start:start + chunk_size], False)
+                        yield
+                finally:
+                    view.release()
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            parser.Parse(view[start:start + chunk_size], False)
+            yield
+    else:
+        while chunk := source.read(chunk_size):
+            parser.Parse(chunk, False)
+            yield
+    parser.Parse(b"", True)
+
+
+def iter_collection_expat(source, item_tag, chunk_size=BUFFER_SIZE):
+    """
+    Parse a Traktor NML or Rekordbox XML document with expat, yielding the same events as iter_collection.
+
+    No element tree is built: start tags are handled straight from expat's attribute dicts, and
+    collection items (with their children) and top-level sections are read into AttributeNodes.
+    Items are dropped once the consumer moves on, the rest of the document is never kept.
+
+    Args:
+        source: Path (memory-mapped), bytes or readable binary file object of the document
+        item_tag: Tag of the collection items ("ENTRY" for NML, "TRACK" for Rekordbox)
+        chunk_size: Bytes parsed between two batches of events
+    """
+    events = []
+    # Open elements below the root, which never holds its sections
+    stack = [None]
+    push, pop = stack.append, stack.pop
+    collection = [None]  # COLLECTION node, once it is open
+
+    def start(tag, attrib):
+        node = AttributeNode(tag, attrib)
+        parent = stack[-1]
+        if parent is None:
+            if tag == "COLLECTION":
+                collection[0] = node
+        elif len(stack) != 2 or parent is not collection[0]:
+            # Items aren't attached to the COLLECTION, they are yielded on their own
+            parent.children.append(node)
+        push(node)
+
+    def end(tag):
+        node = pop()
+        depth = len(stack)
+        if depth == 2:
+            if tag == item_tag and stack[1] is collection[0]:
+                events.append(("item", node))
+        elif depth == 1 and node is not collection[0]:
+            events.append(("section", node))
+
+    def start_root(tag, attrib):
+        # Every other start tag is below the root
+        parser.StartElementHandler = start
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_root
+    parser.EndElementHandler = end
+
+    for _ in feed_chunks(parser, source, chunk_size):
+        if events:
+            yield from events
+            events.clear()
+    yield from events
+
+
+def index_collection(data, item_tag, chunk_size=BUFFER_SIZE):
+    """
+    Byte spans of the collection items of a Traktor NML or Rekordbox XML document, read with expat.
+
+    Args:
+        data: Bytes-like document (e.g. a memoryview of a memory-mapped file)
+        item_tag: Tag of the collection items ("ENTRY" for NML, "TRACK" for Rekordbox)
+        chunk_size: Bytes parsed at once
+
+    Returns:
+        list: (start, end) offsets of every item element, its start tag to its end tag included
+    """
+    spans = []
+    depth = [0]  # Of the element being parsed: 1 for the root, 2 for its sections, 3 for their children
+    in_collection = [False]
+    item_start = [0]
+
+    def start(tag, attrib):
+        depth[0] += 1
+        if depth[0] == 2:
+            in_collection[0] = tag == "COLLECTION"
+        elif depth[0] == 3 and in_collection[0] and tag == item_tag:
+            item_start[0] = parser.CurrentByteIndex
+
+    def end(tag):
+        if depth[0] == 3 and in_collection[0] and tag == item_tag:
+            start_tag = START_TAG.match(data, item_start[0])
+            if start_tag[1]:
+                # Empty element, without end tag
+                spans.append((item_start[0], start_tag.end()))
+            else:
+                spans.append((item_start[0], END_TAG.match(data, parser.CurrentByteIndex).end()))
+        depth[0] -= 1
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    try:
+        for _ in feed_chunks(parser, data, chunk_size):
+            pass
+    finally:
+        # The handlers hold the document: drop them now, so that its memory map can be closed
+        parser.StartElementHandler = parser.EndElementHandler = None
+    return spans
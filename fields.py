@@ -0,0 +1,190 @@
+import uuid
+from sys import intern
+from typing import Callable, NamedTuple, Optional
+
+from conversion import ConversionContext, location_codec
+from mappings import rekordbox_tonality, rekordbox_track_color, traktor_key, traktor_track_color
+from model import Cue, TempoMarker, Track
+from utils import get_attribute
+
+BEATGRID_NAMES = ("AutoGrid", "Beat Marker")
+
+
+class Field(NamedTuple):
+    tag: Optional[str]  # Child holding the attribute, None for the element itself
+    attribute: Optional[str]  # None to give the whole child element (or None if missing) to the converter
+    convert: Callable = str
+    contextual: bool = False  # Converter called as convert(context, value), e.g. a ConversionContext method
+
+
+def as_float(default):
+    return lambda value: float(value or default)
+
+
+def ms_2_sec(time_ms):
+    """Convert time from milliseconds to seconds."""
+    return float(time_ms) / 1000 if time_ms else 0
+
+
+def get_file_path(location):
+    """
+    Construct the full file path from LOCATION element to match PRIMARYKEY format.
+    Format: "VOLUME/DIR/FILE" (without the VOLUMEID)
+    """
+    if location is None:
+        return ""
+    # Example: "Macintosh HD/:Users/:username/:Music/:new_library/:file.mp3"
+    return f"{location.get('VOLUME', '')}{location.get('DIR', '')}{location.get('FILE', '')}"
+
+
+# Traktor ENTRY metadata
+NML_FIELDS = {
+    "id": Field(None, "AUDIO_ID"),
+    "title": Field(None, "TITLE"),
+    "artist": Field(None, "ARTIST", intern),
+    "album": Field("ALBUM", "TITLE", intern),
+    "key": Field("MUSICAL_KEY", "VALUE", rekordbox_tonality),
+    "bpm": Field("TEMPO", "BPM", as_float(0.0)),
+    "color": Field("INFO", "COLOR", rekordbox_track_color),
+    "genre": Field("INFO", "GENRE", intern),
+    "playtime": Field("INFO", "PLAYTIME"),
+    "playcount": Field("INFO", "PLAYCOUNT"),
+    "bitrate": Field("INFO", "BITRATE", lambda value: float(value or 0.0) / 1000),
+    "import_date": Field("INFO", "IMPORT_DATE", ConversionContext.format_date, contextual=True),
+    "modif_date": Field(None, "MODIFIED_DATE", ConversionContext.format_date, contextual=True),
+    "last_played": Field("INFO", "LAST_PLAYED", ConversionContext.format_date, contextual=True),
+    "ranking": Field("INFO", "RANKING"),
+    "file_path": Field("LOCATION", None, get_file_path),  # Full file path for playlist matching
+    "location": Field("LOCATION", None, location_codec.to_rekordbox),
+}
+
+# Rekordbox TRACK metadata
+REKORDBOX_FIELDS = {
+    "id": Field(None, "TrackId", lambda value: value or uuid.uuid4().hex[:8]),
+    "title": Field(None, "Name"),
+    "artist": Field(None, "Artist", intern),
+    "album": Field(None, "Album", intern),
+    "key": Field(None, "Tonality", traktor_key),
+    "bpm": Field(None, "AverageBpm", as_float("120.0")),
+    "color": Field(None, "Colour", traktor_track_color),
+    "genre": Field(None, "Genre", intern),
+    "playtime": Field(None, "TotalTime"),
+    "playcount": Field(None, "PlayCount"),
+    "bitrate": Field(None, "BitRate", lambda value: float(value or "320") * 1000),
+    "import_date": Field(None, "DateAdded", ConversionContext.format_date, contextual=True),
+    "modif_date": Field(None, "DateModified", ConversionContext.format_date, contextual=True),
+    "last_played": Field(None, "LastPlayed", ConversionContext.format_date, contextual=True),
+    "ranking": Field(None, "Rating"),
+    "filesize": Field(None, "Size"),
+    "location": Field(None, "Location", location_codec.to_traktor),
+    "comments": Field(None, "Comments"),
+}
+
+
+def _missing(attribute, default):
+    return default
+
+
+class FieldExtractor:
+    """
+    Extract all the fields of a table from an element, into a Track.
+
+    The table is compiled once into a dedicated function: each child holding fields is looked up
+    once (with the C-accelerated find, cheaper than walking the children in Python), then every field
+    is read with a bound get() and converted, without going through generic helpers for each field.
+    `extract(element, context)` takes the ConversionContext of the conversion, for contextual fields.
+    """
+
+    def __init__(self, fields, factory=Track):
+        """
+        Args:
+            fields: Field of each attribute of the result
+            factory: Called with the fields as keyword arguments to build the result
+        """
+        self.fields = fields
+        self.extract = self.compile(fields, factory)
+
+    @staticmethod
+    def compile(fields, factory):
+        namespace = {"_missing": _missing, "_factory": factory}
+        lines = ["def extract(element, context):", "    get = element.get"]
+        holders = {None: ("element", "get")}
+
+        for index, (name, (tag, attribute, convert, contextual)) in enumerate(fields.items()):
+            if tag not in holders:
+                holder = f"child_{len(holders)}"
+                holders[tag] = (holder, f"{holder}_get")
+                lines.append(f"    {holder} = element.find({tag!r})")
+                lines.append(f"    {holder}_get = {holder}.get if {holder} is not None else _missing")
+            namespace[f"convert_{index}"] = convert
+
+        lines.append("    return _factory(")
+        for index, (name, (tag, attribute, convert, contextual)) in enumerate(fields.items()):
+            holder, holder_get = holders[tag]
+            value = holder if attribute is None else f"{holder_get}({attribute!r}, '')"
+            if contextual:
+                value = f"convert_{index}(context, {value})"
+            elif convert is not str:
+                value = f"convert_{index}({value})"
+            lines.append(f"        {name}={value},")
+        lines.append("    )")
+
+        exec("\n".join(lines), namespace)
+        return namespace["extract"]
+
+
+nml_extractor = FieldExtractor(NML_FIELDS)
+rekordbox_extractor = FieldExtractor(REKORDBOX_FIELDS)
+
+
+def read_nml_marks(entry, track):
+    """
+    Read the cues and the beatgrid of a Traktor ENTRY into a track.
+    Tracks without flexible beatgrid get their grid from the AutoGrid cue, at the track BPM.
+    """
+    cues = entry.findall("CUE_V2")
+    for cue in cues:
+        name = get_attribute(cue, "NAME")
+        grid = cue.find("GRID")
+        if grid is not None and name in BEATGRID_NAMES:
+            bpm = get_attribute(grid, "BPM")
+            if bpm:
+                start = ms_2_sec(get_attribute(cue, "START"))
+                track.tempos.append(TempoMarker(start, float(bpm), "4/4", len(track.cues)))
+            continue
+
+        start = ms_2_sec(get_attribute(cue, "START"))
+        length = get_attribute(cue, "LEN")
+        end = start + ms_2_sec(length) if length and float(length) != 0 else None
+        track.cues.append(Cue(name, get_attribute(cue, "TYPE"), start, end, get_attribute(cue, "HOTCUE")))
+
+    if not track.tempos:
+        for cue in cues:
+            if get_attribute(cue, "NAME") == "AutoGrid":
+                # Written after the cues
+                start = ms_2_sec(get_attribute(cue, "START"))
+                track.tempos.append(TempoMarker(start, track.bpm, None, len(track.cues)))
+                break
+    return track
+
+
+def read_rekordbox_marks(element, track):
+    """Read the cues (POSITION_MARK) and the beatgrid (TEMPO) of a Rekordbox TRACK into a track."""
+    for tempo in element.findall("TEMPO"):
+        start = float(get_attribute(tempo, "Inizio") or "0")
+        bpm = float(get_attribute(tempo, "Bpm") or str(track.bpm))
+        track.tempos.append(TempoMarker(start, bpm, get_attribute(tempo, "Metro") or None))
+
+    for position_mark in element.findall("POSITION_MARK"):
+        start = get_attribute(position_mark, "Start")
+        end = get_attribute(position_mark, "End")
+        color = tuple(get_attribute(position_mark, channel) for channel in ("Red", "Green", "Blue"))
+        track.cues.append(Cue(
+            get_attribute(position_mark, "Name"),
+            get_attribute(position_mark, "Type"),
+            float(start) if start else 0.0,
+            float(end) if end else None,
+            get_attribute(position_mark, "Num"),
+            color if all(color) else None,
+        ))
+    return track
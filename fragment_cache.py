@@ -0,0 +1,124 @@
+import hashlib
+import pickle
+import sqlite3
+
+from xml_backend import backend
+
+CACHE_VERSION = b"2"  # Bump when the conversion output changes, to invalidate existing caches
+MAX_BYTES = 256 * 1024 * 1024
+EVICTED_RATIO = 0.9  # Share of max_bytes left once fragments are evicted, so that eviction doesn't run on every put
+KEY_MODES = ("content", "modified")
+
+
+class FragmentCache:
+    """
+    On-disk cache of converted collection items, keyed on the content of the source item.
+
+    Values are any picklable object (e.g. a serialized output fragment). The cache is bounded
+    to `max_bytes` of stored values: least recently used fragments are evicted as soon as it grows past it.
+    """
+
+    def __init__(self, path, namespace, max_bytes=MAX_BYTES, key_mode="content"):
+        """
+        Args:
+            path: Path of the cache database, created if needed
+            namespace: Conversion the fragments belong to (e.g. "traktor>rekordbox")
+            max_bytes: Size of stored fragments above which the oldest ones are evicted
+            key_mode: "content" to key entries on a hash of their whole content,
+                "modified" to key them on their LOCATION + AUDIO_ID + MODIFIED_DATE + MODIFIED_TIME when present (cheaper)
+        """
+        if key_mode not in KEY_MODES:
+            raise ValueError(f"Unknown cache key mode {key_mode!r}, expected one of {KEY_MODES}")
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fragments "
+            "(key BLOB PRIMARY KEY, value BLOB, size INTEGER, used INTEGER)"
+        )
+        self.namespace = namespace.encode("utf-8") + b":" + CACHE_VERSION + b":"
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.clock, self.size = self.db.execute(
+            "SELECT COALESCE(MAX(used), 0), COALESCE(SUM(size), 0) FROM fragments"
+        ).fetchone()
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key(self, element):
+        """Compute the cache key of a source element (ENTRY or TRACK)."""
+        if self.key_mode == "modified":
+            stamp = [element.get(attr) for attr in ("AUDIO_ID", "MODIFIED_DATE", "MODIFIED_TIME")]
+            location = element.find("LOCATION")
+            # The stamp alone isn't unique: converted collections share AUDIO_ID and MODIFIED_TIME
+            if all(stamp) and location is not None and location.get("FILE"):
+                stamp += [location.get(attr) or "" for attr in ("VOLUME", "DIR", "FILE")]
+                return hashlib.blake2b(self.namespace + "\0".join(stamp).encode("utf-8"), digest_size=16).digest()
+
+        # The tail is the whitespace following the element in the document: not part of its content
+        tail, element.tail = element.tail, None
+        content = backend.tostring(element)
+        element.tail = tail
+        return hashlib.blake2b(self.namespace + content, digest_size=16).digest()
+
+    def get(self, key):
+        """Return the fragment stored for a key, or None."""
+        row = self.db.execute("SELECT value FROM fragments WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.clock += 1
+        self.used[key] = self.clock
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.clock += 1
+        self.db.execute(
+            "INSERT OR REPLACE INTO fragments (key, value, size, used) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), self.clock),
+        )
+        # A replaced fragment is still counted: the size is recomputed by the next eviction
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def save_used(self):
+        """Write the last use of the fragments read since the last save."""
+        self.db.executemany("UPDATE fragments SET used = ? WHERE key = ?", [(used, key) for key, used in self.used.items()])
+        self.used = {}
+
+    def evict(self):
+        """Delete least recently used fragments until the cache fits in EVICTED_RATIO of max_bytes."""
+        self.save_used()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM fragments").fetchone()[0]
+        if self.size <= self.max_bytes:
+            return
+
+        excess = self.size - int(self.max_bytes * EVICTED_RATIO)
+        evicted = []
+        for key, size in self.db.execute("SELECT key, size FROM fragments ORDER BY used"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self.size -= size
+
+        self.db.executemany("DELETE FROM fragments WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def close(self):
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import random
+import urllib.parse
+
+from consts import COLOR_MAP, TONALITY_MAP
+from streaming import ElementTemplate, XmlStreamWriter
+
+ARTISTS = ["Régine", "Blondie", "TakaTuka", "Loud & Clear", 'The "Books"', "Ø<Ω>", "Reflex Blue", "Ünïcødé"]
+WORDS = ["Night", "Atomic", "Bass", "Junkie", "Reine", "Nuit", "Dream", "Fever", "Tekno", "Love", "Acid", "Sun"]
+GENRES = ["Tekno", "House", "Variété", "Rock", "Techno", "Disco", ""]
+CUE_NAMES = ["n.n.", "Intro", "Drop", "Break", "Outro", "Build-Up", "cue1", "Verse"]
+PLAYLIST_FANOUT = 2  # Sub-folders of each playlist folder
+
+# Traktor NML
+NML_ENTRY = ElementTemplate("ENTRY", ("MODIFIED_DATE", "MODIFIED_TIME", "AUDIO_ID", "TITLE", "ARTIST"), short_empty_elements=False)
+NML_LOCATION = ElementTemplate("LOCATION", ("DIR", "FILE", "VOLUME", "VOLUMEID"), short_empty_elements=False)
+NML_ALBUM = ElementTemplate("ALBUM", ("TRACK", "TITLE"), short_empty_elements=False)
+NML_MODIFICATION_INFO = ElementTemplate("MODIFICATION_INFO", ("AUTHOR_TYPE",), short_empty_elements=False)
+NML_INFO = ElementTemplate(
+    "INFO",
+    ("BITRATE", "GENRE", "PLAYCOUNT", "PLAYTIME", "PLAYTIME_FLOAT", "RANKING", "IMPORT_DATE", "LAST_PLAYED", "FLAGS", "COLOR"),
+    optional=("LAST_PLAYED", "COLOR"),
+    short_empty_elements=False,
+)
+NML_TEMPO = ElementTemplate("TEMPO", ("BPM", "BPM_QUALITY"), short_empty_elements=False)
+NML_MUSICAL_KEY = ElementTemplate("MUSICAL_KEY", ("VALUE",), short_empty_elements=False)
+NML_CUE_V2 = ElementTemplate(
+    "CUE_V2",
+    ("NAME", "DISPL_ORDER", "TYPE", "START", "LEN", "REPEATS", "HOTCUE", "COLOR"),
+    optional=("COLOR",),
+    short_empty_elements=False,
+)
+NML_GRID = ElementTemplate("GRID", ("BPM",), short_empty_elements=False)
+NML_NODE = ElementTemplate("NODE", ("TYPE", "NAME"), short_empty_elements=False)
+NML_SUBNODES = ElementTemplate("SUBNODES", ("COUNT",), short_empty_elements=False)
+NML_PLAYLIST = ElementTemplate("PLAYLIST", ("ENTRIES", "TYPE", "UUID"), short_empty_elements=False)
+NML_PLAYLIST_ENTRY = ElementTemplate("ENTRY", (), short_empty_elements=False)
+NML_PRIMARYKEY = ElementTemplate("PRIMARYKEY", ("TYPE", "KEY"), short_empty_elements=False)
+
+# Rekordbox XML
+REKORDBOX_TRACK = ElementTemplate(
+    "TRACK",
+    (
+        "TrackID", "Name", "Artist", "Album", "Genre", "Kind", "Size", "TotalTime", "DiscNumber", "TrackNumber",
+        "Year", "AverageBpm", "DateModified", "DateAdded", "BitRate", "SampleRate", "Comments", "PlayCount",
+        "LastPlayed", "Rating", "Location", "Tonality", "Colour",
+    ),
+    optional=("Colour",),
+)
+REKORDBOX_TEMPO = ElementTemplate("TEMPO", ("Inizio", "Bpm", "Metro", "Battito"))
+REKORDBOX_POSITION_MARK = ElementTemplate(
+    "POSITION_MARK",
+    ("Name", "Type", "Start", "End", "Num", "Red", "Green", "Blue"),
+    optional=("End",),
+)
+REKORDBOX_NODE = ElementTemplate("NODE", ("Type", "Name", "Count", "KeyType", "Entries"), optional=("Count", "KeyType", "Entries"))
+REKORDBOX_KEY = ElementTemplate("TRACK", ("Key",))
+
+
+class CollectionGenerator:
+    """
+    Generate realistic synthetic collections, to measure how conversions scale.
+
+    The same tracks are generated for both formats (for a given seed): each track has a main beatgrid,
+    `grid_markers` extra markers of a flexible beatgrid (tempo changes), around `cues` hot cues and loops,
+    and is referenced by playlists nested `playlist_depth` folders deep.
+    """
+
+    def __init__(self, tracks, cues=8, grid_markers=0, playlist_depth=2, playlist_size=100, seed=0):
+        """
+        Args:
+            tracks: Number of tracks in the collection
+            cues: Average number of cues and loops per track
+            grid_markers: Number of beatgrid markers per track, besides the first one
+            playlist_depth: Depth of the playlist folder tree (0 for a single playlist)
+            playlist_size: Maximum number of tracks per playlist
+            seed: Seed of the random generator
+        """
+        self.tracks = tracks
+        self.cues = cues
+        self.grid_markers = grid_markers
+        self.playlist_depth = playlist_depth
+        self.playlist_size = playlist_size
+        self.seed = seed
+
+    def iter_tracks(self):
+        """Yield the metadata of each track, as plain dicts."""
+        rng = random.Random(self.seed)
+        tonalities = list(TONALITY_MAP)
+        colors = list(COLOR_MAP)
+
+        for index in range(self.tracks):
+            artist = rng.choice(ARTISTS)
+            title = " ".join(rng.sample(WORDS, rng.randint(1, 3))) + f" {index}"
+            bpm = rng.uniform(80, 175)
+            playtime = rng.randint(120, 600)
+            grid_start = rng.uniform(0, 2000)
+
+            cues = []
+            for number in range(rng.randint(0, 2 * self.cues)):
+                kind = rng.choice(["cue", "cue", "loop", "load"])
+                cues.append({
+                    "name": rng.choice(CUE_NAMES),
+                    "kind": kind,
+                    "start": rng.uniform(0, playtime * 1000),
+                    "length": rng.uniform(1000, 20000) if kind == "loop" else 0.0,
+                    "hotcue": number if number < 8 else -1,
+                })
+
+            yield {
+                "index": index,
+                "title": title,
+                "artist": artist,
+                "album": f"Album {artist}" if index % 3 else "",
+                "genre": rng.choice(GENRES),
+                "bpm": bpm,
+                "playtime": playtime,
+                "bitrate": rng.choice([320000, 256000, 192000]),
+                "playcount": rng.randint(0, 20),
+                "ranking": rng.choice([0, 51, 102, 153, 204, 255]),
+                "date": (2020 + index % 6, index % 12 + 1, index % 28 + 1),
+                "played": (2025, index % 12 + 1, index % 28 + 1) if index % 4 else None,
+                "tonality": rng.choice(tonalities),
+                "color": rng.choice(colors) if index % 2 else None,
+                "folder": ["Users", "DJ", "Music", f"folder {index % 50}"],
+                "file": f"{artist} - {title}.mp3",
+                "grid": [(grid_start + 8000 * marker, bpm + rng.choice([0.0, 0.5, -1.0])) for marker in range(self.grid_markers + 1)],
+                "cues": cues,
+            }
+
+    def iter_playlists(self, rng):
+        """
+        Yield the playlist tree depth-first, as ("folder", name, children count), ("end", None, None)
+        once a folder is complete, and ("playlist", name, track indices) for each playlist.
+        """
+        def walk(depth, path):
+            if depth == self.playlist_depth:
+                size = min(self.tracks, self.playlist_size)
+                yield "playlist", f"Playlist {path}", sorted(rng.sample(range(self.tracks), rng.randint(0, size)))
+                return
+            yield "folder", f"Folder {path}", PLAYLIST_FANOUT + 1
+            yield "playlist", f"Playlist {path}", sorted(rng.sample(range(self.tracks), min(self.tracks, self.playlist_size)))
+            for child in range(PLAYLIST_FANOUT):
+                yield from walk(depth + 1, f"{path}.{child}" if path else f"{child}")
+            yield "end", None, None
+
+        yield from walk(0, "")
+
+    def write_nml(self, path):
+        """Write the collection as a Traktor NML file."""
+        keys = []
+        with XmlStreamWriter(path) as writer:
+            writer.write_declaration()
+            writer.write('<NML VERSION="20"><HEAD COMPANY="www.native-instruments.com" PROGRAM="Traktor Pro 4"></HEAD>')
+            writer.write(f'<COLLECTION ENTRIES="{self.tracks}">')
+
+            for track in self.iter_tracks():
+                directory = "/:" + "/:".join(track["folder"]) + "/:"
+                keys.append(f"Macintosh HD{directory}{track['file']}")
+                writer.write(self.nml_entry(track, directory))
+
+            writer.write('</COLLECTION><SETS ENTRIES="0"></SETS><PLAYLISTS>')
+            writer.write('<NODE TYPE="FOLDER" NAME="$ROOT"><SUBNODES COUNT="1">')
+            for kind, name, content in self.iter_playlists(random.Random(self.seed + 1)):
+                if kind == "folder":
+                    writer.write(NML_NODE.start_tag("FOLDER", name) + ">" + NML_SUBNODES.start_tag(f"{content}") + ">")
+                elif kind == "end":
+                    writer.write("</SUBNODES></NODE>")
+                else:
+                    playlist = NML_PLAYLIST.open(f"{len(content)}", "LIST", hashlib.md5(name.encode("utf-8")).hexdigest())
+                    for index in content:
+                        entry = NML_PLAYLIST_ENTRY.open()
+                        entry.append(NML_PRIMARYKEY.empty("TRACK", keys[index]))
+                        playlist.append(entry.close())
+                    node = NML_NODE.open("PLAYLIST", name)
+                    node.append(playlist.close())
+                    writer.write(node.close())
+            writer.write("</SUBNODES></NODE></PLAYLISTS><INDEXING></INDEXING></NML>")
+
+    @staticmethod
+    def nml_entry(track, directory):
+        year, month, day = track["date"]
+        entry = NML_ENTRY.open(f"{year}/{month}/{day}", f"{track['index'] * 7 % 86400}", f"AAAA{track['index']:08X}", track["title"], track["artist"])
+        entry.append(NML_LOCATION.empty(directory, track["file"], "Macintosh HD", "Macintosh HD"))
+        if track["album"]:
+            entry.append(NML_ALBUM.empty("1", track["album"]))
+        entry.append(NML_MODIFICATION_INFO.empty("user"))
+        entry.append(NML_INFO.empty(
+            f"{track['bitrate']}",
+            track["genre"],
+            f"{track['playcount']}",
+            f"{track['playtime']}",
+            f"{track['playtime']:.6f}",
+            f"{track['ranking']}",
+            f"{year}/{month}/{day}",
+            "%d/%d/%d" % track["played"] if track["played"] else None,
+            "12",
+            COLOR_MAP[track["color"]] if track["color"] else None,
+        ))
+        entry.append(NML_TEMPO.empty(f"{track['bpm']:.6f}", "100.000000"))
+        entry.append(NML_MUSICAL_KEY.empty(TONALITY_MAP[track["tonality"]]))
+
+        for marker, (start, bpm) in enumerate(track["grid"]):
+            cue = NML_CUE_V2.open("AutoGrid" if marker == 0 else "Beat Marker", "0", "4", f"{start:.6f}", "0.000000", "-1", "-1", None)
+            cue.append(NML_GRID.empty(f"{bpm:.6f}"))
+            entry.append(cue.close())
+        entry.append(NML_CUE_V2.empty("AutoGrid", "0", "0", f"{track['grid'][0][0]:.6f}", "0.000000", "-1", "0", "#FFFFFF"))
+
+        for cue in track["cues"]:
+            cue_type = {"cue": "0", "loop": "5", "load": "3"}[cue["kind"]]
+            entry.append(NML_CUE_V2.empty(cue["name"], "0", cue_type, f"{cue['start']:.6f}", f"{cue['length']:.6f}", "-1", f"{cue['hotcue']}", None))
+        return entry.close()
+
+    def write_rekordbox(self, path):
+        """Write the collection as a Rekordbox XML file."""
+        with XmlStreamWriter(path) as writer:
+            writer.write_declaration()
+            writer.write('<DJ_PLAYLISTS Version="1.0.0"><PRODUCT Name="rekordbox" Version="6.8.5" Company="AlphaTheta" />')
+            writer.write(f'<COLLECTION Entries="{self.tracks}">')
+            for track in self.iter_tracks():
+                writer.write(self.rekordbox_track(track))
+            writer.write("</COLLECTION><PLAYLISTS>")
+
+            writer.write(REKORDBOX_NODE.start_tag("0", "ROOT", "1", None, None) + ">")
+            for kind, name, content in self.iter_playlists(random.Random(self.seed + 1)):
+                if kind == "folder":
+                    writer.write(REKORDBOX_NODE.start_tag("0", name, f"{content}", None, None) + ">")
+                elif kind == "end":
+                    writer.write("</NODE>")
+                else:
+                    node = REKORDBOX_NODE.open("1", name, None, "0", f"{len(content)}")
+                    for index in content:
+                        node.append(REKORDBOX_KEY.empty(f"{index + 1}"))
+                    writer.write(node.close())
+            writer.write("</NODE></PLAYLISTS></DJ_PLAYLISTS>")
+
+    @staticmethod
+    def rekordbox_track(track):
+        location = "/".join(track["folder"] + [track["file"]])
+        played = "%04d-%02d-%02d" % track["played"] if track["played"] else ""
+        element = REKORDBOX_TRACK.open(
+            f"{track['index'] + 1}",
+            track["title"],
+            track["artist"],
+            track["album"],
+            track["genre"],
+            "MP3 File",
+            f"{track['playtime'] * track['bitrate'] // 8}",
+            f"{track['playtime']}",
+            "0",
+            "0",
+            "0",
+            f"{track['bpm']:.2f}",
+            "%04d-%02d-%02d" % track["date"],
+            "%04d-%02d-%02d" % track["date"],
+            f"{track['bitrate'] // 1000}",
+            "44100",
+            "",
+            f"{track['playcount']}",
+            played,
+            f"{track['ranking']}",
+            "file://localhost/" + urllib.parse.quote(location),
+            track["tonality"],
+            track["color"],
+        )
+
+        for start, bpm in track["grid"]:
+            element.append(REKORDBOX_TEMPO.empty(f"{start / 1000:.3f}", f"{bpm:.2f}", "4/4", "1"))
+        for cue in track["cues"]:
+            start = cue["start"] / 1000
+            end = f"{start + cue['length'] / 1000:.3f}" if cue["kind"] == "loop" else None
+            red, green, blue = ("224", "100", "27") if end else ("48", "90", "255")
+            element.append(REKORDBOX_POSITION_MARK.empty(
+                cue["name"], "4" if end else "0", f"{start:.3f}", end, f"{cue['hotcue']}", red, green, blue,
+            ))
+        return element.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Traktor NML or Rekordbox XML collection")
+    parser.add_argument("output", help="output file: .nml for Traktor, .xml for Rekordbox")
+    parser.add_argument("--tracks", type=int, default=1000, help="number of tracks")
+    parser.add_argument("--cues", type=int, default=8, help="average number of cues and loops per track")
+    parser.add_argument("--grid-markers", type=int, default=0, help="flexible beatgrid markers per track, besides the first one")
+    parser.add_argument("--playlist-depth", type=int, default=2, help="depth of the playlist folder tree")
+    parser.add_argument("--playlist-size", type=int, default=100, help="maximum number of tracks per playlist")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    args = parser.parse_args()
+
+    generator = CollectionGenerator(
+        args.tracks, args.cues, args.grid_markers, args.playlist_depth, args.playlist_size, args.seed,
+    )
+    if args.output.lower().endswith(".nml"):
+        generator.write_nml(args.output)
+    else:
+        generator.write_rekordbox(args.output)
+    print(f"☕️ {args.tracks} tracks were generated in {args.output}!")
@@ -0,0 +1,66 @@
+from nml_to_rekord import Traktor2Rekordbox
+from rekord_to_nml import Rekordbox2Traktor
+from streaming import iter_written, open_source
+
+
+def convert(converter_class, method, stream_method, source, output, stream, jobs, stats, grid, dedup):
+    if output is None:
+        if stream or jobs != 1:
+            raise ValueError("Streamed conversions back-patch the collection count: give them a seekable output")
+        return iter_written(
+            lambda pipe: convert(converter_class, method, stream_method, source, pipe, False, 1, stats, grid, dedup)
+        )
+
+    converter = converter_class(stats=stats, grid=grid, dedup=dedup)
+    source = open_source(source)
+    if stream or jobs != 1:
+        getattr(converter, stream_method)(source, output, jobs=jobs)
+    else:
+        getattr(converter, method)(source, output)
+    return converter
+
+
+def traktor_to_rekordbox(source, output=None, stream=False, jobs=1, stats=None, grid=None, dedup=None):
+    """
+    Convert a Traktor NML collection without going through files.
+
+    Args:
+        source: NML document as bytes, str, or readable binary stream (e.g. an upload)
+        output: Writable binary stream of the Rekordbox XML, None to iterate over its chunks
+        stream: Convert entry by entry with bounded memory (the output must then be seekable,
+            and the source too with the "newest" and "most-cues" dedup policies, which read it twice)
+        jobs: Number of processes converting entries by shards (None for one per CPU), streamed conversions only
+        stats: ConversionStats collecting stage timings and counters
+        grid: GridCompactor dropping redundant beatgrid markers
+        dedup: Deduplicator dropping the copies of tracks found several times
+
+    Returns:
+        Traktor2Rekordbox: Converter used when writing to an output (track_index, context, ...),
+        else an iterator of bytes chunks converting while it is consumed
+    """
+    return convert(
+        Traktor2Rekordbox, "convert_nml_to_xml", "stream_nml_to_xml", source, output, stream, jobs, stats, grid, dedup
+    )
+
+
+def rekordbox_to_traktor(source, output=None, stream=False, jobs=1, stats=None, grid=None, dedup=None):
+    """
+    Convert a Rekordbox XML collection without going through files.
+
+    Args:
+        source: XML document as bytes, str, or readable binary stream (e.g. an upload)
+        output: Writable binary stream of the Traktor NML, None to iterate over its chunks
+        stream: Convert track by track with bounded memory (the output must then be seekable,
+            and the source too with the "newest" and "most-cues" dedup policies, which read it twice)
+        jobs: Number of processes converting tracks by shards (None for one per CPU), streamed conversions only
+        stats: ConversionStats collecting stage timings and counters
+        grid: GridCompactor dropping redundant beatgrid markers
+        dedup: Deduplicator dropping the copies of tracks found several times
+
+    Returns:
+        Rekordbox2Traktor: Converter used when writing to an output (track_index, context, ...),
+        else an iterator of bytes chunks converting while it is consumed
+    """
+    return convert(
+        Rekordbox2Traktor, "convert_xml_to_nml", "stream_xml_to_nml", source, output, stream, jobs, stats, grid, dedup
+    )
@@ -0,0 +1,120 @@
+import urllib.parse
+from sys import intern
+from typing import NamedTuple
+
+URL_PREFIX = "file://localhost"
+DEFAULT_VOLUME = "Macintosh HD"  # TODO fix here for Windows
+MAX_DIRECTORIES = 65536  # Distinct directories remembered, the cache is emptied when it is full
+
+
+class TraktorLocation(NamedTuple):
+    """LOCATION of a Traktor ENTRY. Instances are shared, DIR and VOLUME strings are interned."""
+
+    dir: str
+    file: str
+    volume: str
+
+    @property
+    def key(self):
+        """PRIMARYKEY of the track in Traktor playlists."""
+        return f"{self.volume}{self.dir}{self.file}"
+
+
+EMPTY_LOCATION = TraktorLocation("/:", "", DEFAULT_VOLUME)
+
+
+def parse_rekordbox_location(location):
+    """Parse a Rekordbox Location URL to get directory, file and volume."""
+    if not location or not location.startswith(URL_PREFIX):
+        return EMPTY_LOCATION
+
+    path = location.replace(URL_PREFIX, "")
+    path = urllib.parse.unquote(path)
+
+    # Check if it's a Windows path (contains drive letter like /D:/ or /C:/)
+    if len(path) > 3 and path[0] == "/" and path[2] == ":":
+        # Windows path: /D:/folder/file.mp3
+        drive_letter = path[1].upper()
+        parts = [p for p in path[3:].split("/") if p]  # Remove empty parts
+        dir_parts = [f"{drive_letter}:"] + parts[:-1]
+    else:
+        # Mac/Unix path: /Users/DJ/file.mp3
+        parts = [p for p in path.split("/") if p]  # Remove empty parts
+        if not parts:
+            return EMPTY_LOCATION
+        dir_parts = parts[:-1]
+
+    file_name = parts[-1] if parts else ""
+    return TraktorLocation(intern("/:".join([""] + dir_parts + [""])), file_name, DEFAULT_VOLUME)
+
+
+class LocationCodec:
+    """
+    Convert track locations between Rekordbox URLs and Traktor LOCATION elements.
+
+    Tracks of a folder share their directory: it is parsed (or formatted) once, and only the file name
+    is decoded (or encoded) for each track. Results are the same as parsing the whole location each time.
+    """
+
+    def __init__(self, max_directories=MAX_DIRECTORIES):
+        self.max_directories = max_directories
+        self.traktor_directories = {}
+        self.rekordbox_directories = {}
+
+    def to_traktor(self, location):
+        """
+        Args:
+            location: Rekordbox Location URL ("file://localhost/Users/DJ/My%20Track.mp3")
+
+        Returns:
+            TraktorLocation: Directory, file and volume of the track
+        """
+        if not location or not location.startswith(URL_PREFIX):
+            return EMPTY_LOCATION
+
+        head, _, name = location.rpartition("/")
+        # A file name that would be split further once decoded
+        if not name or "%2F" in name or "%2f" in name:
+            return parse_rekordbox_location(location)
+
+        directory = self.traktor_directories.get(head)
+        if directory is None:
+            if len(self.traktor_directories) >= self.max_directories:
+                self.traktor_directories.clear()
+            directory = self.traktor_directories[head] = self.parse_directory(head)
+        if not directory:
+            return parse_rekordbox_location(location)
+        return TraktorLocation(directory.dir, urllib.parse.unquote(name), directory.volume)
+
+    @staticmethod
+    def parse_directory(head):
+        """
+        Parse the directory part of a location URL (without its last "/"),
+        False when the file name could change how it is parsed.
+        """
+        # Too short to tell a Windows drive letter without the file name, or "file://localhost" split at the "/"
+        if len(urllib.parse.unquote(head.replace(URL_PREFIX, ""))) < 3 or head.endswith("file:/"):
+            return False
+        return parse_rekordbox_location(f"{head}/_")
+
+    def to_rekordbox(self, location):
+        """
+        Args:
+            location: LOCATION element of a Traktor ENTRY
+
+        Returns:
+            str: Rekordbox Location URL, "" without location
+        """
+        if location is None:
+            return ""
+
+        dir_path = location.get("DIR")
+        volume = location.get("VOLUME") or ""
+        prefix = self.rekordbox_directories.get((dir_path, volume))
+        if prefix is None:
+            if len(self.rekordbox_directories) >= self.max_directories:
+                self.rekordbox_directories.clear()
+            disk = f"/{volume}" if "Mac" not in volume else ""
+            prefix = f"{URL_PREFIX}{disk}{dir_path.replace('/:', '/')}".replace(" ", "%20")
+            self.rekordbox_directories[(dir_path, volume)] = prefix
+        return prefix + f"{location.get('FILE')}".replace(" ", "%20")
@@ -0,0 +1,96 @@
+from consts import COLOR_MAP, COLOR_NAME_TO_RGB, CUE_COLORS, KEY_TO_CODE, TONALITY_MAP
+
+MEMO_SIZE = 4096  # Distinct cues remembered, the memo is emptied when it is full
+
+
+class BidirectionalMap:
+    """
+    Table of consts.py compiled for lookups in both directions.
+    The reverse table keeps the first key of values shared by several keys, like a scan of the table would.
+    """
+
+    __slots__ = ("forward", "reverse")
+
+    def __init__(self, table):
+        self.forward = dict(table)
+        self.reverse = {}
+        for key, value in table.items():
+            self.reverse.setdefault(value, key)
+
+
+TRACK_COLORS = BidirectionalMap(COLOR_MAP)  # Rekordbox RGB <-> Traktor color number
+TONALITIES = BidirectionalMap(TONALITY_MAP)  # Rekordbox tonality <-> Traktor musical key
+KEY_CODES = BidirectionalMap(KEY_TO_CODE)  # Traktor musical key <-> Open Key code
+CUE_COLOR_NAMES = BidirectionalMap(CUE_COLORS)  # Normalized cue type or name <-> color name
+COLOR_NAMES = BidirectionalMap({name: (rgb["R"], rgb["G"], rgb["B"]) for name, rgb in COLOR_NAME_TO_RGB.items()})
+
+_cue_colors = {}
+
+
+def traktor_track_color(rgb_color):
+    """Convert Rekordbox RGB color to Traktor color number."""
+    return TRACK_COLORS.forward.get(rgb_color, "")
+
+
+def rekordbox_track_color(color_nb):
+    """Convert Traktor color number to Rekordbox RGB color."""
+    return TRACK_COLORS.reverse.get(color_nb, "")
+
+
+def traktor_key(tonality):
+    """Convert Rekordbox tonality to Traktor musical key."""
+    return TONALITIES.forward.get(tonality, "0")
+
+
+def rekordbox_tonality(musical_key):
+    """Convert Traktor musical key to Rekordbox tonality."""
+    return TONALITIES.reverse.get(musical_key, "")
+
+
+def traktor_cue_type(rekordbox_type):
+    """Convert Rekordbox cue type to Traktor cue type."""
+    # Rekordbox: Cue = "0", Loop = "4"
+    # Traktor: Cue = "0", Fade-In = "1", Fade-Out = "2", Load = "3", AutoGrid / Grid = "4", Loop = "5"
+    return "5" if rekordbox_type == "4" else "0"
+
+
+def rekordbox_cue_type(traktor_type):
+    """Convert Traktor cue type to Rekordbox cue type."""
+    # Traktor: Cue = "0", Fade-In = "1", Fade-Out = "2", Load = "3", AutoGrid / Grid = "4", Loop = "5"
+    # Rekordbox: Cue = "0", Loop = "4" (Fade-In "1", Fade-Out "2", Load "3" DON'T WORK)
+    return "4" if traktor_type == "5" else "0"
+
+
+def traktor_cue_color(r, g, b):
+    """COLOR attribute of a Traktor cue from a Rekordbox cue color, None when it has none."""
+    # Traktor cues don't keep a color: only fade-in/fade-out cues would need one,
+    # which could be told by the cue type of the closest color (utils.get_cue_color_values)
+    return None
+
+
+def color_name(ctype):
+    """Color name of a cue type or name, normalized (case, spaces and dashes ignored)."""
+    return CUE_COLOR_NAMES.forward.get(str(ctype).lower().replace(" ", "").replace("-", ""), "blue")
+
+
+def rekordbox_cue_color(ctype, cname):
+    """
+    Rekordbox color of a Traktor cue, from its name for named hot cues, from its type otherwise.
+
+    Returns:
+        tuple: (Red, Green, Blue) strings, None when it has no color
+    """
+    key = (ctype, cname)
+    try:
+        return _cue_colors[key]
+    except KeyError:
+        pass
+
+    if ctype == "0" and cname != "n.n.":
+        ctype = cname
+    rgb = COLOR_NAMES.forward.get(color_name(ctype))
+
+    if len(_cue_colors) >= MEMO_SIZE:
+        _cue_colors.clear()
+    _cue_colors[key] = rgb
+    return rgb
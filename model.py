@@ -0,0 +1,79 @@
+from sys import intern
+
+
+class TempoMarker:
+    """
+    Beatgrid marker: the grid has `bpm` from `start` (in seconds) on.
+
+    `cue_index` is the number of cues read before the marker, so that writers can keep
+    the source order of formats mixing markers and cues (Traktor CUE_V2).
+    """
+
+    __slots__ = ("start", "bpm", "metro", "cue_index")
+
+    def __init__(self, start, bpm, metro=None, cue_index=0):
+        self.start = start
+        self.bpm = bpm
+        self.metro = metro
+        self.cue_index = cue_index
+
+
+class Cue:
+    """
+    Cue point, or loop when `end` is set (times in seconds).
+
+    `type` and `hotcue` are the values of the source format (Traktor TYPE / HOTCUE, Rekordbox Type / Num),
+    mapped by writers. `color` is the (R, G, B) strings of a Rekordbox cue, None if it has none.
+    """
+
+    __slots__ = ("name", "type", "start", "end", "hotcue", "color")
+
+    def __init__(self, name, type, start, end=None, hotcue="", color=None):
+        self.name = intern(name)
+        self.type = intern(type)
+        self.start = start
+        self.end = end
+        self.hotcue = hotcue
+        self.color = color
+
+
+class Track:
+    """
+    Track of a collection, shared by the readers and writers of both formats.
+
+    Metadata attributes hold the values already converted to the target format (see fields.py),
+    attributes that the source format doesn't have are empty strings.
+    """
+
+    __slots__ = (
+        "id", "title", "artist", "album", "key", "bpm", "color", "genre", "playtime", "playcount", "bitrate",
+        "import_date", "modif_date", "last_played", "ranking", "file_path", "location", "filesize", "comments",
+        "cues", "tempos",
+    )
+
+    def __init__(
+        self, id="", title="", artist="", album="", key="", bpm=0.0, color="", genre="", playtime="", playcount="",
+        bitrate=0.0, import_date="", modif_date="", last_played="", ranking="", file_path="", location="",
+        filesize="", comments="",
+    ):
+        self.id = id
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.key = key
+        self.bpm = bpm
+        self.color = color
+        self.genre = genre
+        self.playtime = playtime
+        self.playcount = playcount
+        self.bitrate = bitrate
+        self.import_date = import_date
+        self.modif_date = modif_date
+        self.last_played = last_played
+        self.ranking = ranking
+        self.file_path = file_path
+        self.location = location
+        self.filesize = filesize
+        self.comments = comments
+        self.cues = []
+        self.tempos = []
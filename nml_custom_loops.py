@@ -1,251 +1,231 @@
-import xml.etree.ElementTree as ET
-import sys
+import argparse
+import mmap
+import os
+from functools import partial
 from os.path import exists
 
-from utils import (
-    get_attribute,
-    format_date,
-    get_element,
-    get_tonalikey,
-    get_track_color,
-    get_cue_type,
-    set_conversion,
-    get_location,
-    set_cue_color
-)
+from conversion import ConversionContext
+from expat_reader import index_collection
+from fields import nml_extractor, read_nml_marks
+from parallel import ShardPool
+from stats import ConversionStats
+from streaming import write_patched
+from utils import get_element
+from xml_backend import BACKENDS, backend, use_backend
 
 
 class TraktorCustomLoops:
-    def __init__(self):
-        """Initialize the converter with default values."""
+    def __init__(self, stats=None):
+        """
+        Initialize the converter with default values.
+
+        Args:
+            stats: ConversionStats collecting stage timings and counters (None to disable them)
+        """
+        self.context = ConversionContext("traktor", "rekordbox", stats)
+        self.stats = self.context.stats
         self.root = None
-        self.track = None
         self.tracks = []
-        self.cues = []
         self.track_index = 0
-        self.cue_index = 0
         self.added_loops = 0
 
-    def set_track_info(self, entry):
-        """Extract track metadata from NML entry."""
-        info = get_element(entry, "INFO")
-
-        self.track_info = {
-            'id': get_attribute(entry, "AUDIO_ID"),
-            'title': get_attribute(entry, "TITLE"),
-            'artist': get_attribute(entry, "ARTIST"),
-            'album': get_attribute(get_element(entry, "ALBUM"), "TITLE"),
-            'key': get_tonalikey(get_attribute(get_element(entry, "MUSICAL_KEY"), "VALUE")),
-            'bpm': float(get_attribute(get_element(entry, "TEMPO"), "BPM")),
-            'color': get_track_color(get_attribute(info, "COLOR")),
-            'genre': get_attribute(info, "GENRE"),
-            'playtime': get_attribute(info, "PLAYTIME"),
-            'playcount': get_attribute(info, "PLAYCOUNT"),
-            'bitrate': float(get_attribute(info, "BITRATE")) / 1000,
-            'import_date': format_date(get_attribute(info, "IMPORT_DATE")),
-            'modif_date': format_date(get_attribute(entry, "MODIFIED_DATE")),
-            'last_played': format_date(get_attribute(info, "LAST_PLAYED")),
-            'ranking': get_attribute(info, "RANKING")
-        }
-
-        return self.track_info
-
-    @staticmethod
-    def is_beatgrid(cue):
-        """
-        Check if a CUE_V2 element is a beatgrid marker (AutoGrid or Beat Marker with GRID element)
-        """
-        cue_name = get_attribute(cue, "NAME")
-        grid_element = cue.find("GRID")
-        return (cue_name in ["AutoGrid", "Beat Marker"]) and grid_element is not None
-
     @staticmethod
-    def ms_2_sec(time_ms):
-        """Convert time from milliseconds to seconds."""
-        return float(time_ms) / 1000 if time_ms else 0
-
-    def add_tempo(self, start, bpm, metro=None):
-        bpm_value = round(float(bpm), 2)
-        if metro:
-            ET.SubElement(self.track, "TEMPO", Inizio=f"{start}", Bpm=f"{bpm_value}", Metro=metro, Battito="1")
-        else:
-            ET.SubElement(self.track, "TEMPO", Inizio=f"{start}", Bpm=f"{bpm_value}", Battito="1")
-        self.added_tempos += 1
-
-    def add_beatgrid(self, cue):
-        start_seconds = self.ms_2_sec(get_attribute(cue, "START"))
-        grid_element = cue.find("GRID")
-        grid_bpm = get_attribute(grid_element, "BPM")
-
-        if grid_bpm:
-            self.add_tempo(start_seconds, grid_bpm, metro="4/4")
+    def is_playlist(entry):
+        return get_element(entry, "PRIMARYKEY") is not None
 
-    def add_cue(self, cue):
+    def process_entry(self, entry):
         """
-        Create a POSITION_MARK element from a regular cue/loop.
+        Process a single NML entry, read with its cues and beatgrid.
 
         Args:
-            cue: CUE_V2 XML element containing cue/loop information
-        """
-        cue_type = get_attribute(cue, "TYPE")
-        cue_name = get_attribute(cue, "NAME")
-        start_seconds = self.ms_2_sec(get_attribute(cue, "START"))
-        length = get_attribute(cue, "LEN")
-        hotcue_no = get_attribute(cue, "HOTCUE")
-
-        # Use hotcue number if available, otherwise use current index
-        c_num = hotcue_no if hotcue_no and hotcue_no != "-1" else str(self.cue_index)
-
-        position_mark = ET.SubElement(
-            self.track,
-            "POSITION_MARK",
-            Type=get_cue_type(cue_type),
-            Num=c_num,
-            Start=f"{start_seconds}",
-            Name=cue_name
-        )
-
-        set_cue_color(position_mark, ctype=cue_type, cname=cue_name)
+            entry: NML ENTRY element
 
-        # Add end time for loops (when length > 0)
-        if length and float(length) != 0:
-            end_seconds = start_seconds + self.ms_2_sec(length)
-            position_mark.set("End", f"{end_seconds}")
+        Returns:
+            tuple: (Track read from the entry, whether the entry element was modified), None if skipped
+        """
+        if self.is_playlist(entry):
+            # TODO: Handle playlist entries
+            return None
 
-        # Num="-1" allows the cue to be indexed but not displayed in the pad / useful for grid
+        with self.stats.stage("metadata"):
+            info = nml_extractor.extract(entry, self.context)
 
-        # hidden_cue = ET.SubElement(self.track, "POSITION_MARK",  Type=get_cue_type(cue_type), Num="-1", Start=f"{start_seconds}", Name=cue_name)
-        # set_cue_color(hidden_cue, ctype=cue_type, cname=cue_name)
-        # if length and float(length) != 0:
-        #     hidden_cue.set("End", f"{end_seconds}")
+        with self.stats.stage("cues"):
+            read_nml_marks(entry, info)
+            self.stats.count("tempos", len(info.tempos))
+            self.stats.count("cues", len(info.cues))
 
-        self.cue_index += 1
+        # Loops aren't defined yet: entries are only read
+        return info, False
 
-    def process_cue(self, cue):
+    def process_loops(self, nml_file, jobs=1):
         """
-        Process a single CUE_V2 element and add appropriate elements to the track.
-
-        Args:
-            cue: CUE_V2 XML element from NML
+        nml_file: Path to input NML file
+        jobs: Number of processes analysing entries by shards (None for one per CPU)
         """
-        if self.is_beatgrid(cue):
-            self.add_beatgrid(cue)
+        with self.stats.stage("parse"):
+            self.root = backend.parse(nml_file)
+            self.tracks = self.root.findall(".//ENTRY")
+        track_index = self.track_index
+
+        if jobs == 1:
+            for track in self.tracks:
+                if self.process_entry(track) is not None:
+                    self.track_index += 1
         else:
-            self.add_cue(cue)
-
-    def default_tempo(self):
+            entries = [track for track in self.tracks if not self.is_playlist(track)]
+            # Workers process entries with the same class (e.g. a subclass defining loops)
+            with ShardPool(partial(process_loops_shard, type(self)), jobs, self.track_index) as pool:
+                # Time spent sending entries and waiting for processed shards (workers aren't timed)
+                with self.stats.stage("shards"):
+                    results = []
+                    for entry in entries:
+                        results.extend(pool.add(entry))
+                    results.extend(pool.flush())
+            self.add_processed_loops(loops for loops, _ in results)
+
+            # Entries modified by the workers are replaced in the document
+            for entry, (_, replacement) in zip(entries, results):
+                if replacement is not None:
+                    self.replace_entry(entry, backend.fromstring(replacement))
+        self.stats.count("tracks", self.track_index - track_index)
+        self.stats.count("loops", self.added_loops)
+
+        with self.stats.stage("write"):
+            backend.write(self.root, nml_file, short_empty_elements=False)
+
+    def patch_entry(self, data):
         """
-        Add a default TEMPO element if no beatgrid markers were processed
-        for tracks that don't have flexible beatgrids.
-        """
-        if self.added_tempos == 0:
-            # Look for AutoGrid cue to get the start position
-            autogrid_start = None
-            for cue in self.cues:
-                if get_attribute(cue, "NAME") == "AutoGrid":
-                    autogrid_start = self.ms_2_sec(get_attribute(cue, "START"))
-                    break
-
-            if autogrid_start is not None:
-                self.add_tempo(autogrid_start, self.track_info['bpm'])
-
-    def add_track(self, collection, location):
-        """
-        Create the main TRACK element with all metadata.
+        Process a collection entry read from its bytes in the NML.
 
         Args:
-            collection: Parent COLLECTION element
-            location: Track file location
+            data: Serialized ENTRY element
 
         Returns:
-            ET.Element: Created TRACK element
+            bytes: Entry serialized again if it was modified, else None (its bytes are kept)
         """
-        kind = "3"
-        creation_date = "0"
-        size = "0"
-
-        info = self.track_info
-        return ET.SubElement(collection, "TRACK",
-             TrackID=f"{self.track_index:09d}", Name=info['title'], Artist=info['artist'],
-             Album=info['album'], Genre=info['genre'], Kind=kind, Size=size,
-             TotalTime=info['playtime'], DiscNumber="0", TrackNumber=f"{self.track_index}",
-             Year=creation_date, AverageBpm=f"{info['bpm']}", BitRate=f"{info['bitrate']}",
-             DateModified=info['modif_date'], DateAdded=info['import_date'],
-             SampleRate="0", PlayCount=info['playcount'], LastPlayed=info['last_played'],
-             Rating=info['ranking'], Tonality=info['key'], Location=location,
-             Colour=info['color'])
-
-    def reset_track(self):
-        """Reset internal state for processing a new track."""
-        self.track = None
-        self.cues = []
-        self.cue_index = 0
-        self.added_tempos = 0
-        self.track_info = {}
-
-    @staticmethod
-    def is_playlist(entry):
-        return get_element(entry, "PRIMARYKEY") is not None
-
-    def process_cues(self, entry):
-        self.cues = entry.findall("CUE_V2")
-        for cue in self.cues:
-            self.process_cue(cue)
-
-    def process_entry(self, entry):
+        with self.stats.stage("parse"):
+            entry = backend.fromstring(data)
+        processed = self.process_entry(entry)
+        if processed is None:
+            return None
+        self.track_index += 1
+        if not processed[1]:
+            return None
+        with self.stats.stage("write"):
+            return backend.tostring(entry, short_empty_elements=False)
+
+    def patch_loops(self, nml_file, jobs=1):
         """
-        Process a single NML entry and convert it to Rekordbox format.
+        Define the custom loops without rewriting the whole NML: collection entries are located by their
+        byte offsets, and only the modified ones are serialized again into a copy of the file where every
+        other byte is kept as it is. The copy then replaces the file atomically (untouched if nothing changed).
 
         Args:
-            entry: NML ENTRY element
+            nml_file: Path to the NML file, patched in place
+            jobs: Number of processes analysing entries by shards (None for one per CPU)
 
         Returns:
-            bool: True if track was processed, False if skipped
+            int: Number of entries rewritten
         """
-        if self.is_playlist(entry):
-            # TODO: Handle playlist entries
-            return False
-
-        self.reset_track()
-
-        self.set_track_info(entry)
+        track_index = self.track_index
+        with open(nml_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            with memoryview(data) as view:
+                with self.stats.stage("index"):
+                    spans = index_collection(view, "ENTRY")
+
+                if jobs == 1:
+                    replacements = [self.patch_entry(bytes(view[start:end])) for start, end in spans]
+                else:
+                    # Workers process entries with the same class (e.g. a subclass defining loops)
+                    with ShardPool(partial(process_loops_shard, type(self)), jobs, self.track_index) as pool:
+                        # Entries are sent as they are in the file, without being parsed here
+                        with self.stats.stage("shards"):
+                            results = []
+                            for start, end in spans:
+                                results.extend(pool.add_serialized(bytes(view[start:end])))
+                            results.extend(pool.flush())
+                    self.add_processed_loops(loops for loops, _ in results)
+                    replacements = [replacement for _, replacement in results]
+
+                patches = [
+                    (start, end, replacement)
+                    for (start, end), replacement in zip(spans, replacements)
+                    if replacement is not None
+                ]
+                if patches:
+                    with self.stats.stage("write"):
+                        patched_file = write_patched(view, patches, nml_file)
+        self.stats.count("tracks", self.track_index - track_index)
+        self.stats.count("loops", self.added_loops)
+        self.stats.count("patched_entries", len(patches))
+
+        # Swapped once the file is closed
+        if patches:
+            os.replace(patched_file, nml_file)
+        return len(patches)
 
-
-        # Process all cues and tempo markers
-        self.process_cues(entry)
-
-        # Add fallback tempo if no beat grid markers were found
-        self.default_tempo()
-
-        return True
-
-    def process_loops(self, nml_file):
-        """
-        nml_file: Path to input NML file
-        """
-        tree = ET.parse(nml_file)
-        self.root = tree.getroot()
-        self.tracks = self.root.findall(".//ENTRY")
-
-        for track in self.tracks:
-            if self.process_entry(track):
-                self.track_index += 1
-
-        tree = ET.ElementTree(self.root)
-        tree.write(nml_file, encoding="utf-8", xml_declaration=True, short_empty_elements=False)
+    @staticmethod
+    def replace_entry(entry, processed):
+        """Replace the content of an ENTRY element of the document with a processed copy, in place."""
+        tail = entry.tail
+        entry.clear()
+        entry.attrib.update(processed.attrib)
+        entry.text = processed.text
+        entry.extend(list(processed))
+        entry.tail = tail
+
+    def add_processed_loops(self, added_loops):
+        """Register entries processed in a worker process."""
+        for loops in added_loops:
+            self.added_loops += loops
+            self.track_index += 1
+
+
+def process_loops_shard(looper_class, start_index, entries):
+    """
+    Process a shard of serialized collection entries in a worker process.
+
+    Returns:
+        list: (number of loops added, entry serialized again if modified else None) for each entry
+    """
+    looper = looper_class()
+    looper.track_index = start_index
+    results = []
+    for entry in entries:
+        before = looper.added_loops
+        replacement = looper.patch_entry(entry)
+        results.append((looper.added_loops - before, replacement))
+    return results
 
 
 if __name__ == "__main__":
-    set_conversion("traktor", "rekordbox")
-    if len(sys.argv) < 2:
-        print("Usage: python nml_custom_loops.py playlist.nml")
+    parser = argparse.ArgumentParser(description="Define custom loops in a Traktor NML collection")
+    parser.add_argument("nml_file", help="playlist.nml")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    parser.add_argument("--jobs", type=int, default=1, help="processes analysing entries in parallel (0: one per CPU)")
+    parser.add_argument("--stats", help="JSON file where stage timings and counters are saved")
+    parser.add_argument(
+        "--patch", action="store_true", help="rewrite only the modified entries, keeping every other byte of the file"
+    )
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    nml_file = args.nml_file
+
+    if not exists(nml_file):
+        print(f"Error: {nml_file} does not exist")
     else:
-        nml_file = sys.argv[1]
-
-        if not exists(nml_file):
-            print(f"Error: {nml_file} does not exist")
-
-        looper = TraktorCustomLoops()
-        looper.process_loops(nml_file)
+        looper = TraktorCustomLoops(stats=ConversionStats() if args.stats else None)
+        if args.patch:
+            patched = looper.patch_loops(nml_file, jobs=args.jobs or None)
+            print(f"🩹 {patched} entries rewritten in place")
+        else:
+            looper.process_loops(nml_file, jobs=args.jobs or None)
+        if args.stats:
+            looper.stats.save(args.stats)
 
         print(f"☕️ {looper.added_loops} where define in {nml_file}!")
@@ -1,267 +1,213 @@
-import xml.etree.ElementTree as ET
-import sys
+import argparse
+from functools import partial
 from os.path import exists
 
+from beatgrid import BPM_TOLERANCE, PHASE_TOLERANCE, GridCompactor
+from conversion import ConversionContext
+from dedup import DEDUP_POLICIES, Deduplicator, probe_nml_entry, scan_collection
+from expat_reader import iter_collection_expat
+from fields import nml_extractor, read_nml_marks
+from fragment_cache import KEY_MODES, FragmentCache
+from mappings import rekordbox_cue_color, rekordbox_cue_type
+from parallel import ShardPool
+from playlist_index import PlaylistKeyIndex
+from stats import ConversionStats
+from streaming import ElementTemplate, XmlStreamWriter, iter_collection
 from utils import (
     get_attribute,
-    format_date,
     get_element,
-    get_tonalikey,
-    get_track_color,
-    get_cue_type,
-    set_conversion,
-    get_location,
-    set_cue_color,
 )
+from xml_backend import BACKENDS, backend, use_backend
+
+TRACK = ElementTemplate("TRACK", (
+    "TrackID", "Name", "Artist", "Album", "Genre", "Kind", "Size", "TotalTime", "DiscNumber", "TrackNumber",
+    "Year", "AverageBpm", "BitRate", "DateModified", "DateAdded", "SampleRate", "PlayCount", "LastPlayed",
+    "Rating", "Tonality", "Location", "Colour",
+))
+TEMPO = ElementTemplate("TEMPO", ("Inizio", "Bpm", "Battito", "Metro"), optional=("Metro",))
+POSITION_MARK = ElementTemplate(
+    "POSITION_MARK",
+    ("Type", "Num", "Start", "Name", "Red", "Green", "Blue", "End"),
+    optional=("Red", "Green", "Blue", "End"),
+)
+NO_COLOR = (None, None, None)
+
+
+def add_tempo(track, start, bpm, metro=None):
+    """
+    Add a TEMPO element (beatgrid marker) to a TRACK.
+
+    Args:
+        track: TRACK ElementBuffer
+        start: Start time in seconds
+        bpm: BPM, rounded to 2 decimals
+        metro: Time signature, if known
+    """
+    track.append(TEMPO.empty(f"{start}", f"{round(bpm, 2)}", "1", metro or None))
+
+
+def add_cue(track, cue, cue_index):
+    """
+    Add a POSITION_MARK element from a regular cue/loop to a TRACK.
+
+    Args:
+        track: TRACK ElementBuffer
+        cue: Cue read from a CUE_V2 element
+        cue_index: Position of the cue in the track, its number when it isn't a hot cue
+    """
+    # Use hotcue number if available, otherwise use current index
+    c_num = cue.hotcue if cue.hotcue and cue.hotcue != "-1" else str(cue_index)
+
+    red, green, blue = rekordbox_cue_color(cue.type, cue.name) or NO_COLOR
+
+    track.append(POSITION_MARK.empty(
+        rekordbox_cue_type(cue.type),
+        c_num,
+        f"{cue.start}",
+        cue.name,
+        red,
+        green,
+        blue,
+        # End time for loops (when length > 0)
+        f"{cue.end}" if cue.end is not None else None,
+    ))
+
+    # Num="-1" allows the cue to be indexed but not displayed in the pad / useful for grid
+
+    # hidden_cue = backend.SubElement(track, "POSITION_MARK",  Type=get_cue_type(cue_type), Num="-1", Start=f"{start_seconds}", Name=cue_name)
+    # set_cue_color(hidden_cue, ctype=cue_type, cname=cue_name)
+    # if length and float(length) != 0:
+    #     hidden_cue.set("End", f"{end_seconds}")
+
+
+def open_track(info, track_index):
+    """
+    Start the main TRACK element with all metadata.
+
+    Args:
+        info: Track read from the NML entry
+        track_index: Position of the track in the collection
+
+    Returns:
+        ElementBuffer: TRACK element, to which TEMPO and POSITION_MARK elements are appended
+    """
+    kind = "3"
+    creation_date = "0"
+    size = "0"
+
+    return TRACK.open(
+        f"{track_index:09d}",
+        info.title,
+        info.artist,
+        info.album,
+        info.genre,
+        kind,
+        size,
+        info.playtime,
+        "0",
+        f"{track_index}",
+        creation_date,
+        f"{info.bpm}",
+        f"{info.bitrate}",
+        info.modif_date,
+        info.import_date,
+        "0",
+        info.playcount,
+        info.last_played,
+        info.ranking,
+        info.key,
+        info.location,
+        info.color,
+    )
+
+
+def add_marks(track, entry, info, context):
+    """Add the beatgrid (TEMPO elements) and the cues and loops (POSITION_MARK elements) of an entry to its TRACK."""
+    read_nml_marks(entry, info)
+    if context.grid is not None:
+        dropped = context.grid.dropped
+        info.tempos = context.grid.compact(info.tempos)
+        context.stats.count("dropped_grid_markers", context.grid.dropped - dropped)
+
+    # Markers and cues are written in the order of their CUE_V2 elements
+    next_cue = 0
+    for tempo in info.tempos:
+        while next_cue < min(tempo.cue_index, len(info.cues)):
+            add_cue(track, info.cues[next_cue], next_cue)
+            next_cue += 1
+        add_tempo(track, tempo.start, tempo.bpm, tempo.metro)
+    for cue_index in range(next_cue, len(info.cues)):
+        add_cue(track, info.cues[cue_index], cue_index)
+
+    context.stats.count("tempos", len(info.tempos))
+    context.stats.count("cues", len(info.cues))
+
+
+def convert_entry(entry, track_index, context):
+    """
+    Convert a Traktor collection ENTRY (not a playlist entry) to a Rekordbox TRACK.
+    Only depends on its arguments, so that entries can be converted concurrently.
+
+    Args:
+        entry: NML ENTRY element
+        track_index: Position of the track in the collection
+        context: ConversionContext of the conversion
+
+    Returns:
+        tuple: (TRACK ElementBuffer, Track read from the entry)
+    """
+    with context.stats.stage("metadata"):
+        info = nml_extractor.extract(entry, context)
+        track = open_track(info, track_index)
+
+    with context.stats.stage("cues"):
+        # Process all tempo markers (with a fallback one if there is no beat grid marker) and cues
+        add_marks(track, entry, info, context)
+
+    return track, info
 
 
 class Traktor2Rekordbox:
-    def __init__(self):
-        """Initialize the converter with default values."""
-        self.track = None
-        self.cues = []
-        self.track_index = 0
-        self.cue_index = 0
-        self.added_tempos = 0
-        self.track_info = {}
-        self.track_id_map = {}  # Map file path to TrackID for playlist references
-
-    def set_track_info(self, entry):
-        """Extract track metadata from NML entry."""
-        info = get_element(entry, "INFO")
-        location = get_element(entry, "LOCATION")
-
-        self.track_info = {
-            "id": get_attribute(entry, "AUDIO_ID"),
-            "title": get_attribute(entry, "TITLE"),
-            "artist": get_attribute(entry, "ARTIST"),
-            "album": get_attribute(get_element(entry, "ALBUM"), "TITLE"),
-            "key": get_tonalikey(get_attribute(get_element(entry, "MUSICAL_KEY"), "VALUE")),
-            "bpm": float(get_attribute(get_element(entry, "TEMPO"), "BPM") or 0.0),
-            "color": get_track_color(get_attribute(info, "COLOR")),
-            "genre": get_attribute(info, "GENRE"),
-            "playtime": get_attribute(info, "PLAYTIME"),
-            "playcount": get_attribute(info, "PLAYCOUNT"),
-            "bitrate": float(get_attribute(info, "BITRATE") or 0.0) / 1000,
-            "import_date": format_date(get_attribute(info, "IMPORT_DATE")),
-            "modif_date": format_date(get_attribute(entry, "MODIFIED_DATE")),
-            "last_played": format_date(get_attribute(info, "LAST_PLAYED")),
-            "ranking": get_attribute(info, "RANKING"),
-            "file_path": self.get_file_path(location),  # Store the full file path for playlist matching
-        }
-
-        return self.track_info
-
-    @staticmethod
-    def is_beatgrid(cue):
-        """
-        Check if a CUE_V2 element is a beatgrid marker (AutoGrid or Beat Marker with GRID element)
-        """
-        cue_name = get_attribute(cue, "NAME")
-        grid_element = cue.find("GRID")
-        return (cue_name in ["AutoGrid", "Beat Marker"]) and grid_element is not None
-
-    @staticmethod
-    def get_file_path(location):
-        """
-        Construct the full file path from LOCATION element to match PRIMARYKEY format.
-        Format: "VOLUME/DIR/FILE" (without the VOLUMEID)
-        """
-        if location is None:
-            return ""
-
-        volume = get_attribute(location, "VOLUME")
-        directory = get_attribute(location, "DIR")
-        file = get_attribute(location, "FILE")
-
-        # Construct path in same format as PRIMARYKEY uses
-        # Example: "Macintosh HD/:Users/:username/:Music/:new_library/:file.mp3"
-        return f"{volume}{directory}{file}"
-
-    @staticmethod
-    def ms_2_sec(time_ms):
-        """Convert time from milliseconds to seconds."""
-        return float(time_ms) / 1000 if time_ms else 0
-
-    def add_tempo(self, start, bpm, metro=None):
-        bpm_value = round(float(bpm), 2)
-        el = ET.SubElement(self.track, "TEMPO", Inizio=f"{start}", Bpm=f"{bpm_value}", Battito="1")
-        if metro:
-            el.set("Metro", metro)
-        self.added_tempos += 1
-
-    def add_beatgrid(self, cue):
-        start_seconds = self.ms_2_sec(get_attribute(cue, "START"))
-        grid_element = cue.find("GRID")
-        grid_bpm = get_attribute(grid_element, "BPM")
-
-        if grid_bpm:
-            self.add_tempo(start_seconds, grid_bpm, metro="4/4")
-
-    def add_cue(self, cue):
-        """
-        Create a POSITION_MARK element from a regular cue/loop.
-
-        Args:
-            cue: CUE_V2 XML element containing cue/loop information
-        """
-        cue_type = get_attribute(cue, "TYPE")
-        cue_name = get_attribute(cue, "NAME")
-        start_seconds = self.ms_2_sec(get_attribute(cue, "START"))
-        length = get_attribute(cue, "LEN")
-        hotcue_no = get_attribute(cue, "HOTCUE")
-
-        # Use hotcue number if available, otherwise use current index
-        c_num = hotcue_no if hotcue_no and hotcue_no != "-1" else str(self.cue_index)
-
-        position_mark = ET.SubElement(
-            self.track,
-            "POSITION_MARK",
-            Type=get_cue_type(cue_type),
-            Num=c_num,
-            Start=f"{start_seconds}",
-            Name=cue_name,
-        )
-
-        set_cue_color(position_mark, ctype=cue_type, cname=cue_name)
-
-        # Add end time for loops (when length > 0)
-        if length and float(length) != 0:
-            end_seconds = start_seconds + self.ms_2_sec(length)
-            position_mark.set("End", f"{end_seconds}")
-
-        # Num="-1" allows the cue to be indexed but not displayed in the pad / useful for grid
-
-        # hidden_cue = ET.SubElement(self.track, "POSITION_MARK",  Type=get_cue_type(cue_type), Num="-1", Start=f"{start_seconds}", Name=cue_name)
-        # set_cue_color(hidden_cue, ctype=cue_type, cname=cue_name)
-        # if length and float(length) != 0:
-        #     hidden_cue.set("End", f"{end_seconds}")
-
-        self.cue_index += 1
-
-    def process_cue(self, cue):
-        """
-        Process a single CUE_V2 element and add appropriate elements to the track.
-
-        Args:
-            cue: CUE_V2 XML element from NML
-        """
-        if self.is_beatgrid(cue):
-            self.add_beatgrid(cue)
-        else:
-            self.add_cue(cue)
-
-    def default_tempo(self):
-        """
-        Add a default TEMPO element if no beatgrid markers were processed
-        for tracks that don't have flexible beatgrids.
+    def __init__(self, stats=None, grid=None, dedup=None):
         """
-        if self.added_tempos == 0:
-            # Look for AutoGrid cue to get the start position
-            autogrid_start = None
-            for cue in self.cues:
-                if get_attribute(cue, "NAME") == "AutoGrid":
-                    autogrid_start = self.ms_2_sec(get_attribute(cue, "START"))
-                    break
-
-            if autogrid_start is not None:
-                self.add_tempo(autogrid_start, self.track_info["bpm"])
-
-    def add_track(self, collection, location):
-        """
-        Create the main TRACK element with all metadata.
+        Initialize the converter with default values.
 
         Args:
-            collection: Parent COLLECTION element
-            location: Track file location
-
-        Returns:
-            ET.Element: Created TRACK element
+            stats: ConversionStats collecting stage timings and counters (None to disable them)
+            grid: GridCompactor dropping redundant beatgrid markers (None to keep them all)
+            dedup: Deduplicator dropping the copies of tracks found several times (None to keep them all)
         """
-        kind = "3"
-        creation_date = "0"
-        size = "0"
-
-        info = self.track_info
-        track_id = f"{self.track_index:09d}"
-
-        # Store mapping from file path to TrackID for playlist references
-        if info["file_path"]:
-            self.track_id_map[info["file_path"]] = track_id
-
-        return ET.SubElement(
-            collection,
-            "TRACK",
-            TrackID=track_id,
-            Name=info["title"],
-            Artist=info["artist"],
-            Album=info["album"],
-            Genre=info["genre"],
-            Kind=kind,
-            Size=size,
-            TotalTime=info["playtime"],
-            DiscNumber="0",
-            TrackNumber=f"{self.track_index}",
-            Year=creation_date,
-            AverageBpm=f"{info['bpm']}",
-            BitRate=f"{info['bitrate']}",
-            DateModified=info["modif_date"],
-            DateAdded=info["import_date"],
-            SampleRate="0",
-            PlayCount=info["playcount"],
-            LastPlayed=info["last_played"],
-            Rating=info["ranking"],
-            Tonality=info["key"],
-            Location=location,
-            Colour=info["color"],
-        )
-
-    def reset_track(self):
-        """Reset internal state for processing a new track."""
-        self.track = None
-        self.cues = []
-        self.cue_index = 0
-        self.added_tempos = 0
-        self.track_info = {}
+        self.context = ConversionContext("traktor", "rekordbox", stats, grid)
+        self.stats = self.context.stats
+        self.grid = grid
+        self.dedup = dedup
+        self.track_index = 0
+        self.track_id_map = PlaylistKeyIndex()  # Map file path to TrackID for playlist references
 
     @staticmethod
     def is_playlist(entry):
         return get_element(entry, "PRIMARYKEY") is not None
 
-    def process_cues(self, entry):
-        self.cues = entry.findall("CUE_V2")
-        for cue in self.cues:
-            self.process_cue(cue)
-
-    def process_entry(self, entry, collection):
+    def process_entry(self, entry):
         """
-        Process a single NML entry and convert it to Rekordbox format.
+        Convert a single NML entry at the current position of the collection,
+        and register it for playlist references.
 
         Args:
             entry: NML ENTRY element
-            collection: Rekordbox COLLECTION element
 
         Returns:
-            bool: True if track was processed, False if skipped
+            tuple: (TRACK ElementBuffer, Track), None if the entry was skipped
         """
         if self.is_playlist(entry):
             # Playlists are handled separately
-            return False
-
-        self.reset_track()
-
-        self.set_track_info(entry)
-        location = get_location(get_element(entry, "LOCATION"))
-
-        self.track = self.add_track(collection, location)
+            return None
 
-        # Process all cues and tempo markers
-        self.process_cues(entry)
-
-        # Add fallback tempo if no beat grid markers were found
-        self.default_tempo()
-
-        return True
+        track, info = convert_entry(entry, self.track_index, self.context)
+        # Store mapping from file path to TrackID for playlist references
+        if info.file_path:
+            self.track_id_map.add(info.file_path, f"{self.track_index:09d}")
+        return track, info
 
     def process_playlists(self, root, playlists_node):
         """
@@ -277,32 +223,67 @@ class Traktor2Rekordbox:
         if nml_playlists is None:
             return
 
+        self.process_playlists_section(nml_playlists, playlists_node)
+
+    def process_playlists_section(self, nml_playlists, playlists_node):
+        """
+        Convert the content of a Traktor PLAYLISTS element.
+
+        Args:
+            nml_playlists: NML PLAYLISTS element
+            playlists_node: Rekordbox PLAYLISTS NODE element (ROOT node)
+        """
         # Traktor has a root NODE that contains SUBNODES with the actual playlists
         root_node = nml_playlists.find("NODE")
         if root_node is not None:
-            subnodes = root_node.find("SUBNODES")
-            if subnodes is not None:
-                for node in subnodes.findall("NODE"):
-                    self.process_playlist_node(node, playlists_node)
-            else:
-                # Fallback if no SUBNODES wrapper
-                for node in root_node.findall("NODE"):
-                    self.process_playlist_node(node, playlists_node)
+            for node in self.get_child_nodes(root_node):
+                self.process_playlist_node(node, playlists_node)
+
+    @staticmethod
+    def get_child_nodes(nml_node):
+        """Get the children NODE of a Traktor folder NODE."""
+        # Look for SUBNODES container (Traktor wraps child nodes in this)
+        subnodes = nml_node.find("SUBNODES")
+        if subnodes is not None:
+            return subnodes.findall("NODE")
+        # Fallback: direct NODE children
+        return nml_node.findall("NODE")
 
     def process_playlist_node(self, nml_node, parent_node):
         """
-        Recursively process a playlist node (folder or playlist).
+        Process a playlist node (folder or playlist) and all its descendants.
+        The tree is walked with an explicit stack, so deeply nested folders can't hit the recursion limit.
 
         Args:
             nml_node: Traktor NODE element
             parent_node: Parent Rekordbox NODE element
         """
+        stack = [(nml_node, parent_node)]
+        while stack:
+            node, parent = stack.pop()
+            folder_node = self.add_playlist_node(node, parent)
+            if folder_node is not None:
+                # Reversed, so that children are popped (and added to the folder) in their original order
+                stack.extend((child, folder_node) for child in reversed(self.get_child_nodes(node)))
+
+    def add_playlist_node(self, nml_node, parent_node):
+        """
+        Convert a single playlist node (folder or playlist), without its descendants.
+
+        Args:
+            nml_node: Traktor NODE element
+            parent_node: Parent Rekordbox NODE element
+
+        Returns:
+            Element: Created folder NODE element, None for playlists
+        """
         node_type = get_attribute(nml_node, "TYPE")
         node_name = get_attribute(nml_node, "NAME")
 
         if node_type == "FOLDER":
+            self.stats.count("folders")
             # Create a folder node (Type="0")
-            folder_node = ET.SubElement(
+            return backend.SubElement(
                 parent_node,
                 "NODE",
                 Type="0",
@@ -310,25 +291,16 @@ class Traktor2Rekordbox:
                 Count="0",  # Will be updated if needed
             )
 
-            # Look for SUBNODES container (Traktor wraps child nodes in this)
-            subnodes = nml_node.find("SUBNODES")
-            if subnodes is not None:
-                for child in subnodes.findall("NODE"):
-                    self.process_playlist_node(child, folder_node)
-            else:
-                # Fallback: direct NODE children
-                for child in nml_node.findall("NODE"):
-                    self.process_playlist_node(child, folder_node)
-
-        elif node_type == "PLAYLIST":
+        if node_type == "PLAYLIST":
             # Get all playlist entries from PLAYLIST/ENTRY structure
             playlist_element = nml_node.find("PLAYLIST")
 
             if playlist_element is not None:
                 entries = playlist_element.findall("ENTRY")
+                self.stats.count("playlists")
 
                 # Create a playlist node (Type="1")
-                playlist_node = ET.SubElement(
+                playlist_node = backend.SubElement(
                     parent_node,
                     "NODE",
                     Type="1",
@@ -341,56 +313,294 @@ class Traktor2Rekordbox:
                 for entry in entries:
                     primarykey = get_element(entry, "PRIMARYKEY")
                     if primarykey is not None:
-                        file_path = get_attribute(primarykey, "KEY")
-
                         # Look up the corresponding TrackID using file path
-                        if file_path in self.track_id_map:
-                            track_id = self.track_id_map[file_path]
-                            ET.SubElement(playlist_node, "TRACK", Key=track_id)
+                        track_id = self.track_id_map.resolve(get_attribute(primarykey, "KEY"))
+                        if track_id is not None:
+                            backend.SubElement(playlist_node, "TRACK", Key=track_id)
+                        else:
+                            self.stats.count("unresolved_playlist_keys")
+
+        return None
 
     def convert_nml_to_xml(self, nml_file, xml_file):
         """
-        nml_file: Path to input NML file
-        xml_file: Path to output XML file
+        nml_file: Path or readable binary file object of the input NML
+        xml_file: Path or writable binary file object of the output XML
+        """
+        with self.stats.stage("parse"):
+            root = backend.parse(nml_file)
+            entries = root.findall(".//ENTRY")
+        collection = [entry for entry in entries if not self.is_playlist(entry)]
+        track_count = len(collection)
+        if self.dedup is not None:
+            with self.stats.stage("dedup"):
+                track_count -= self.dedup.scan(probe_nml_entry(entry) for entry in collection)
+
+        self.write_xml(xml_file, self.convert_entries(entries), track_count, {"PLAYLISTS": root.find(".//PLAYLISTS")})
+
+    def write_xml(self, xml_file, tracks, track_count=None, sections=None):
         """
-        tree = ET.parse(nml_file)
-        root = tree.getroot()
-        entries = root.findall(".//ENTRY")
+        Write the Rekordbox XML document, serializing tracks as they are converted.
 
-        rekordbox = ET.Element("DJ_PLAYLISTS", Version="1.0.0")
-        track_count = sum(1 for entry in entries if not self.is_playlist(entry))
-        collection = ET.SubElement(rekordbox, "COLLECTION", Entries=str(track_count))
+        Args:
+            xml_file: Path or writable binary file object of the output XML
+            tracks: Iterable of serialized TRACK elements
+            track_count: Number of tracks, back-patched once all tracks are written when unknown (seekable output only)
+            sections: NML top-level sections by tag, read once all tracks are written
+        """
+        playlists = backend.Element("PLAYLISTS")
+        root_node = backend.SubElement(playlists, "NODE", Type="0", Name="ROOT", Count="0")
+
+        with XmlStreamWriter(xml_file) as writer:
+            writer.write_declaration()
+            writer.write('<DJ_PLAYLISTS Version="1.0.0"><COLLECTION')
+            if track_count is None:
+                writer.reserve_attribute("Entries")
+            else:
+                writer.write(f' Entries="{track_count}"')
+            writer.write(">")
+
+            written = 0
+            for track in tracks:
+                with self.stats.stage("write"):
+                    writer.write_bytes(track)
+                written += 1
+            self.stats.count("tracks", written)
+
+            writer.write("</COLLECTION>")
+            if track_count is None:
+                writer.patch_attribute("Entries", written)
+
+            # Process all playlists, once every track can be referenced
+            if self.dedup is not None:
+                self.add_duplicate_aliases()
+            nml_playlists = (sections or {}).get("PLAYLISTS")
+            if nml_playlists is not None:
+                with self.stats.stage("playlists"):
+                    self.process_playlists_section(nml_playlists, root_node)
+            with self.stats.stage("write"):
+                writer.write_element(playlists)
+                writer.write("</DJ_PLAYLISTS>")
+
+    def convert_entries(self, entries, jobs=1, cache=None):
+        """
+        Convert collection entries to Rekordbox TRACK elements.
+
+        Args:
+            entries: Iterable of NML ENTRY elements, in collection order
+            jobs: Number of processes converting entries by shards (None for one per CPU)
+            cache: FragmentCache of previously converted entries (sequential conversions only)
+
+        Yields:
+            bytes: Serialized TRACK elements, in collection order
+        """
+        if self.dedup is not None:
+            entries = self.deduplicate(entries)
+
+        if jobs == 1:
+            for entry in entries:
+                fragment = None
+                if cache is not None:
+                    with self.stats.stage("cache"):
+                        key = cache.key(entry)
+                        fragment = cache.get(key)
+
+                if fragment is not None:
+                    self.stats.count("cached_tracks")
+                    yield self.add_cached_track(fragment)
+                    continue
+
+                dropped = self.grid.dropped if self.grid is not None else 0
+                converted = self.process_entry(entry)
+                if converted is not None:
+                    track, info = converted
+                    with self.stats.stage("serialize"):
+                        track = track.tostring()
+                    if cache is not None:
+                        # Counted again when the fragment is spliced
+                        counters = {"cues": len(info.cues), "tempos": len(info.tempos)}
+                        if self.grid is not None:
+                            counters["dropped_grid_markers"] = self.grid.dropped - dropped
+                        cache.put(key, self.get_track_fragment(track, info.file_path, counters))
+                    yield track
+                    self.track_index += 1
+            return
 
-        # Process each track
+        if cache is not None:
+            raise ValueError("The fragment cache can only be used by sequential conversions (jobs=1)")
+
+        worker = partial(convert_nml_shard, grid=self.grid, stats=self.stats.enabled)
+        with ShardPool(worker, jobs, self.track_index) as pool:
+            for entry in entries:
+                # Skipped before sharding, so that workers know the TrackID of every entry they get
+                if not self.is_playlist(entry):
+                    # Time spent sending entries and waiting for converted shards (workers aren't timed)
+                    with self.stats.stage("shards"):
+                        tracks = pool.add(entry)
+                    yield from self.add_converted_tracks(tracks)
+            with self.stats.stage("shards"):
+                tracks = pool.flush()
+            yield from self.add_converted_tracks(tracks)
+
+    def deduplicate(self, entries):
+        """Skip the collection entries dropped by the Deduplicator."""
         for entry in entries:
-            if self.process_entry(entry, collection):
-                self.track_index += 1
+            if self.is_playlist(entry):
+                yield entry
+                continue
+            with self.stats.stage("dedup"):
+                keep = self.dedup.keep(probe_nml_entry(entry))
+            if keep:
+                yield entry
+            else:
+                self.stats.count("duplicate_tracks")
 
-        # Create PLAYLISTS section
-        playlists = ET.SubElement(rekordbox, "PLAYLISTS")
-        root_node = ET.SubElement(playlists, "NODE", Type="0", Name="ROOT", Count="0")
+    def add_duplicate_aliases(self):
+        """Point the playlist references of dropped duplicates at the TrackID of their survivor."""
+        for dropped, survivor in self.dedup.aliases:
+            track_id = self.track_id_map.exact.get(survivor.path)
+            if dropped.path and track_id is not None:
+                self.track_id_map.add(dropped.path, track_id)
 
-        # Process all playlists
-        self.process_playlists(root, root_node)
+    def get_track_fragment(self, track, file_path, counters):
+        """
+        Split a serialized TRACK around its TrackID and TrackNumber, which depend on its position
+        in the collection, so that it can be spliced back at any position.
 
-        tree = ET.ElementTree(rekordbox)
-        tree.write(xml_file, encoding="utf-8", xml_declaration=True)
+        Returns:
+            tuple: (file path, head, middle, tail, stats counters of the track)
+        """
+        head, rest = track.split(b' TrackID="%09d"' % self.track_index, 1)
+        middle, tail = rest.split(b' TrackNumber="%d"' % self.track_index, 1)
+        return file_path, head, middle, tail, counters
+
+    def add_cached_track(self, fragment):
+        """Number a cached TRACK fragment at the current position and register it for playlist references."""
+        file_path, head, middle, tail, counters = fragment
+        self.stats.merge(counters)
+        if self.grid is not None:
+            self.grid.dropped += counters.get("dropped_grid_markers", 0)
+        if file_path:
+            self.track_id_map.add(file_path, f"{self.track_index:09d}")
+
+        track = b'%s TrackID="%09d"%s TrackNumber="%d"%s' % (head, self.track_index, middle, self.track_index, tail)
+        self.track_index += 1
+        return track
+
+    def add_converted_tracks(self, tracks):
+        """Register tracks converted in a worker process for playlist references."""
+        for track, file_path, dropped, counters in tracks:
+            if dropped:
+                self.grid.dropped += dropped
+            if counters:
+                self.stats.merge(counters)
+            if file_path:
+                self.track_id_map.add(file_path, f"{self.track_index:09d}")
+            self.track_index += 1
+            yield track
+
+    def stream_nml_to_xml(self, nml_file, xml_file, jobs=1, cache=None, expat=False):
+        """
+        Convert an NML file one collection entry at a time, so that memory stays flat
+        as the collection grows: each ENTRY is converted, written and cleared before the next one is parsed.
+        PLAYLISTS are handled once the whole COLLECTION was converted (Traktor always writes it first).
+
+        nml_file: Path or readable binary file object of the input NML
+        xml_file: Path or seekable binary file object of the output XML
+        jobs: Number of processes converting entries by shards (None for one per CPU)
+        cache: FragmentCache of previously converted entries, spliced without being converted again
+        expat: Read the NML with expat (memory-mapped, without element tree), sequential conversions without cache only
+        """
+        if expat and (jobs != 1 or cache is not None):
+            raise ValueError("The expat reader can only be used by sequential conversions without cache")
+        if self.dedup is not None and self.dedup.needs_scan:
+            with self.stats.stage("dedup"):
+                scan_collection(self.dedup, nml_file, "ENTRY", probe_nml_entry, expat)
+        items = iter_collection_expat(nml_file, "ENTRY") if expat else iter_collection(nml_file, "ENTRY")
+        sections = {}
+
+        def collection_entries():
+            for kind, element in self.stats.iterate(items, "parse"):
+                if kind == "item":
+                    yield element
+                else:
+                    sections[element.tag] = element
+
+        self.write_xml(xml_file, self.convert_entries(collection_entries(), jobs, cache), sections=sections)
+
+
+def convert_nml_shard(start_index, entries, grid=None, stats=False):
+    """
+    Convert a shard of serialized collection entries in a worker process.
+
+    Returns:
+        list: (serialized TRACK, file path, dropped beatgrid markers, counters or None) of each entry
+    """
+    if grid is not None:
+        grid.dropped = 0  # Copy of the main process compactor, with its count
+    context = ConversionContext("traktor", "rekordbox", ConversionStats() if stats else None, grid)
+    results = []
+    for track_index, entry in enumerate(entries, start_index):
+        track, info = convert_entry(backend.fromstring(entry), track_index, context)
+        dropped = 0
+        if grid is not None:
+            dropped, grid.dropped = grid.dropped, 0
+        counters = context.take_counters() if stats else None
+        results.append((track.tostring(), info.file_path, dropped, counters))
+    return results
 
 
 if __name__ == "__main__":
-    set_conversion("traktor", "rekordbox")
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Convert a Traktor NML collection to Rekordbox XML")
+    parser.add_argument("nml_file", help="collection.nml")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    parser.add_argument("--stream", action="store_true", help="convert entry by entry with bounded memory")
+    parser.add_argument("--jobs", type=int, default=1, help="processes converting entries in parallel (0: one per CPU)")
+    parser.add_argument("--expat", action="store_true", help="read the collection with expat from a memory map (implies --stream)")
+    parser.add_argument("--cache", help="fragment cache file reused by later conversions of the same collection")
+    parser.add_argument("--cache-key", choices=KEY_MODES, default="content", help="key cached entries on their content, or on location + AUDIO_ID + modification date (cheaper)")
+    parser.add_argument("--stats", help="JSON file where stage timings and counters are saved")
+    parser.add_argument("--compact-grid", action="store_true", help="drop the beatgrid markers that don't change the grid")
+    parser.add_argument("--dedup", choices=DEDUP_POLICIES, help="keep a single copy of tracks found several times, chosen by this policy")
+    parser.add_argument("--dedup-metadata", action="store_true", help="also match duplicates on title, artist and duration")
+    parser.add_argument("--bpm-tolerance", type=float, default=BPM_TOLERANCE, help="largest BPM difference of merged grid markers")
+    parser.add_argument("--phase-tolerance", type=float, default=PHASE_TOLERANCE * 1000, help="largest offset in ms of a dropped grid marker")
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.expat and (args.jobs != 1 or args.cache):
+        parser.error("--expat can't be combined with --jobs or --cache")
+    if args.cache and args.jobs != 1:
+        parser.error("--cache can't be combined with --jobs")
+
+    nml_file = args.nml_file
+
+    if not exists(nml_file):
         print("Usage: python nml_to_rekord.py collection.nml")
     else:
-        nml_file = sys.argv[1]
-
-        if not exists(nml_file):
-            print("Usage: python nml_to_rekord.py collection.nml")
-
         rekordbox_file = f"{''.join(nml_file.split('.')[:-1])}.xml"
-        open(rekordbox_file, "w").close()
-
-        converter = Traktor2Rekordbox()
-        converter.convert_nml_to_xml(nml_file, rekordbox_file)
 
+        grid = GridCompactor(args.bpm_tolerance, args.phase_tolerance / 1000) if args.compact_grid else None
+        dedup = Deduplicator(args.dedup, args.dedup_metadata) if args.dedup else None
+        converter = Traktor2Rekordbox(stats=ConversionStats() if args.stats else None, grid=grid, dedup=dedup)
+        if args.cache:
+            # Compacted grids give other fragments
+            namespace = f"traktor>rekordbox:grid={args.bpm_tolerance},{args.phase_tolerance}" if grid else "traktor>rekordbox"
+            with FragmentCache(args.cache, namespace, key_mode=args.cache_key) as cache:
+                converter.stream_nml_to_xml(nml_file, rekordbox_file, cache=cache)
+            print(f"🗃️ cache: {cache.hits} hits, {cache.misses} misses, {cache.evictions} evictions")
+        elif args.stream or args.expat or args.jobs != 1:
+            converter.stream_nml_to_xml(nml_file, rekordbox_file, jobs=args.jobs or None, expat=args.expat)
+        else:
+            converter.convert_nml_to_xml(nml_file, rekordbox_file)
+
+        if args.stats:
+            converter.context.count_dates()
+            converter.stats.save(args.stats)
+        if grid:
+            print(f"📏 beatgrid: {grid.dropped} redundant markers dropped")
+        if dedup:
+            print(f"🧹 dedup: {dedup.dropped} duplicate tracks dropped")
         print(f"☕️ {nml_file} was converted to {rekordbox_file}!")
@@ -0,0 +1,76 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from xml_backend import backend, use_backend
+
+SHARD_SIZE = 250  # Collection items sent at once to a worker process
+
+
+def init_worker(backend_name):
+    """Set up a worker process like the main one."""
+    use_backend(backend_name)
+
+
+class ShardPool:
+    """
+    Convert collection items by shards in a pool of processes.
+
+    Items are serialized and sent by shards to `worker(start_index, items)`, a module-level function
+    (or a partial of one) converting them with its own ConversionContext and returning one result per item;
+    `start_index` is the position of the first item of the shard in the collection, so that workers
+    number tracks exactly as a sequential conversion would.
+    Results are returned in collection order, whatever the order in which shards complete,
+    and at most two shards per process are in flight to keep memory bounded.
+    """
+
+    def __init__(self, worker, jobs=None, start_index=0, shard_size=SHARD_SIZE):
+        """
+        Args:
+            worker: Function converting a shard in a worker process
+            jobs: Number of processes (defaults to the number of CPUs)
+            start_index: Index of the first item sent to the pool
+            shard_size: Number of items per shard
+        """
+        self.worker = worker
+        self.jobs = jobs or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.next_index = start_index
+        self.shard = []
+        self.pending = deque()
+        self.executor = ProcessPoolExecutor(self.jobs, initializer=init_worker, initargs=(backend.name,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.executor.shutdown(cancel_futures=True)
+
+    def submit(self):
+        if self.shard:
+            self.pending.append(self.executor.submit(self.worker, self.next_index, self.shard))
+            self.next_index += len(self.shard)
+            self.shard = []
+
+    def add(self, element):
+        """Queue an item, return the results of the first shards that are done (possibly none)."""
+        return self.add_serialized(backend.tostring(element))
+
+    def add_serialized(self, data):
+        """Queue an item already serialized (e.g. its bytes in the source document), like `add`."""
+        self.shard.append(data)
+        if len(self.shard) >= self.shard_size:
+            self.submit()
+
+        results = []
+        while self.pending and (len(self.pending) > 2 * self.jobs or self.pending[0].done()):
+            results.extend(self.pending.popleft().result())
+        return results
+
+    def flush(self):
+        """Submit the last shard, then wait and return all remaining results."""
+        self.submit()
+        results = []
+        while self.pending:
+            results.extend(self.pending.popleft().result())
+        return results
@@ -0,0 +1,64 @@
+import unicodedata
+
+AMBIGUOUS = object()  # Several tracks share a key: never resolve through it
+
+
+class PlaylistKeyIndex:
+    """
+    Resolve Traktor PRIMARYKEY strings ("VOLUME/:DIR/:FILE") to Rekordbox TrackIDs.
+
+    Keys are indexed once per collection in three tiers, tried in order:
+        - the exact key
+        - a normalized key (NFC unicode, case folded, without volume prefix)
+        - the normalized file name alone, when it is unique in the collection
+    """
+
+    def __init__(self):
+        self.exact = {}
+        self.normalized = {}
+        self.filenames = {}
+
+    def __len__(self):
+        return len(self.exact)
+
+    def __contains__(self, key):
+        return self.resolve(key) is not None
+
+    @staticmethod
+    def normalize(key):
+        """Normalize a PRIMARYKEY so that NFD (macOS) / NFC, case and volume differences still match."""
+        key = unicodedata.normalize("NFC", key).casefold()
+        # The volume name is everything before the first "/:" separator
+        start = key.find("/:")
+        return key[start:] if start != -1 else key
+
+    @staticmethod
+    def filename(normalized_key):
+        return normalized_key.rsplit("/:", 1)[-1]
+
+    @staticmethod
+    def _add_unique(table, key, track_id):
+        if table.get(key, track_id) != track_id:
+            table[key] = AMBIGUOUS
+        else:
+            table[key] = track_id
+
+    def add(self, key, track_id):
+        """Index a collection track under its PRIMARYKEY."""
+        normalized = self.normalize(key)
+        self.exact[key] = track_id
+        self._add_unique(self.normalized, normalized, track_id)
+        self._add_unique(self.filenames, self.filename(normalized), track_id)
+
+    def resolve(self, key):
+        """Return the TrackID matching a playlist PRIMARYKEY, or None if it can't be resolved."""
+        track_id = self.exact.get(key)
+        if track_id is not None:
+            return track_id
+
+        normalized = self.normalize(key)
+        track_id = self.normalized.get(normalized)
+        if track_id is None:
+            track_id = self.filenames.get(self.filename(normalized))
+
+        return None if track_id is AMBIGUOUS else track_id
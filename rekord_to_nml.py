@@ -1,344 +1,584 @@
+import argparse
 import base64
 import hashlib
 import random
 import uuid
-import xml.etree.ElementTree as ET
 import sys
+from functools import partial
 from os.path import exists
 
-from consts import KEY_TO_CODE
-from utils import (
-    get_attribute,
-    format_date,
-    get_tonalikey,
-    get_track_color,
-    get_cue_type,
-    set_conversion,
-    get_location,
-    set_cue_color,
-    today,
+from beatgrid import BPM_TOLERANCE, PHASE_TOLERANCE, GridCompactor
+from conversion import ConversionContext
+from dedup import DEDUP_POLICIES, Deduplicator, probe_rekordbox_track, scan_collection
+from expat_reader import iter_collection_expat
+from fields import read_rekordbox_marks, rekordbox_extractor
+from locations import EMPTY_LOCATION
+from mappings import KEY_CODES, traktor_cue_color, traktor_cue_type
+from model import TempoMarker
+from parallel import ShardPool
+from stats import ConversionStats
+from streaming import ElementTemplate, XmlStreamWriter, iter_collection
+from xml_backend import BACKENDS, backend, use_backend
+
+# Traktor writes empty elements as <TAG></TAG>
+ENTRY = ElementTemplate("ENTRY", ("MODIFIED_DATE", "MODIFIED_TIME", "AUDIO_ID", "TITLE", "ARTIST"), short_empty_elements=False)
+LOCATION = ElementTemplate("LOCATION", ("DIR", "FILE", "VOLUME", "VOLUMEID"), short_empty_elements=False)
+ALBUM = ElementTemplate("ALBUM", ("TITLE",), short_empty_elements=False)
+MODIFICATION_INFO = ElementTemplate("MODIFICATION_INFO", ("AUTHOR_TYPE",), short_empty_elements=False)
+INFO = ElementTemplate(
+    "INFO",
+    (
+        "BITRATE", "GENRE", "KEY", "PLAYCOUNT", "PLAYTIME", "PLAYTIME_FLOAT", "RANKING",
+        "IMPORT_DATE", "LAST_PLAYED", "FLAGS", "COLOR", "COMMENT",
+    ),
+    optional=("COMMENT",),
+    short_empty_elements=False,
 )
+TEMPO = ElementTemplate("TEMPO", ("BPM", "BPM_QUALITY"), short_empty_elements=False)
+LOUDNESS = ElementTemplate("LOUDNESS", ("PEAK_DB", "PERCEIVED_DB", "ANALYZED_DB"), short_empty_elements=False)
+MUSICAL_KEY = ElementTemplate("MUSICAL_KEY", ("VALUE",), short_empty_elements=False)
+CUE_V2 = ElementTemplate(
+    "CUE_V2",
+    ("NAME", "DISPL_ORDER", "TYPE", "START", "LEN", "REPEATS", "HOTCUE", "COLOR"),
+    optional=("COLOR",),
+    short_empty_elements=False,
+)
+GRID = ElementTemplate("GRID", ("BPM",), short_empty_elements=False)
+
+# Rekordbox playlist tree NODE types
+FOLDER_NODE = "0"
+PLAYLIST_NODE = "1"
+LOCATION_KEYS = "1"  # KeyType of playlists referencing tracks by Location instead of TrackID
+
+AUDIO_ID_PLACEHOLDER = "AWAWZmRENDMzMzf//////////////////////f/////////////////////s/////////////////////5b///7//////////+//////af/////////////////////+///////////f/////////1n/////////9Y///////////f/////////+r/7///////9XYzMzM0MyMzJUMzNDNDMzRDn//////////////////////f/////////////////////e/////////////////////3r+/+////////7u7u/v////vf//7////////v/+//////+FZneYYQAAAA=="
+
+
+
+def generate_audio_id():
+    # AUDIO_ID contains Base64-encoded audio fingerprint data (spectral analysis, transients, beat info) that Traktor uses for validation.
+    # Since we can't generate authentic fingerprints without Native Instruments' algorithms, we use a static placeholder.
+    # Imported tracks might require re-analysis in Traktor.
+    return AUDIO_ID_PLACEHOLDER
+
+
+def open_entry(info, context):
+    return ENTRY.open(
+        info.modif_date or context.today(),  # MODIFIED_DATE
+        "0",  # MODIFIED_TIME, TODO change
+        generate_audio_id(),
+        info.title,
+        info.artist,
+    )
+
+
+def add_metadata(entry, info):
+    """Add the LOCATION, ALBUM, MODIFICATION_INFO, INFO, TEMPO, LOUDNESS and MUSICAL_KEY elements of a track to its ENTRY."""
+    location = info.location
+    entry.append(LOCATION.empty(location.dir, location.file, location.volume, location.volume))
+
+    if info.album:
+        entry.append(ALBUM.empty(info.album))
+
+    entry.append(MODIFICATION_INFO.empty("user"))
+
+    entry.append(INFO.empty(
+        str(int(info.bitrate)),
+        info.genre,
+        KEY_CODES.forward[info.key],
+        info.playcount,
+        info.playtime,
+        f"{float(info.playtime):.6f}",
+        info.ranking,
+        info.import_date,
+        info.last_played,
+        "12",
+        # str(int(float(info.filesize) / 1024)) if info.filesize else "0",  # FILESIZE
+        info.color,
+        info.comments or None,
+    ))
+
+    entry.append(TEMPO.empty(f"{info.bpm:.6f}", "100.000000"))
+    entry.append(LOUDNESS.empty("-1.0", "-1.0", "-1.0"))
+    entry.append(MUSICAL_KEY.empty(info.key))
+
+
+def add_beatmarker(entry, start_ms, bpm, is_autogrid=False):
+    """
+    Add a CUE_V2 grid element (beatgrid marker) to an ENTRY.
+
+    Args:
+        entry: ENTRY ElementBuffer
+        start_ms: Start time in milliseconds
+        bpm: BPM
+        is_autogrid: Whether it is the first marker of the grid
+    """
+    name = "AutoGrid" if is_autogrid else "Beat Marker"
+
+    cue = CUE_V2.open(name, "0", "4", f"{start_ms:.6f}", "0.000000", "-1", "-1", None)
+    cue.append(GRID.empty(f"{bpm:.6f}"))
+
+    entry.append(cue.close())
+
+
+def add_autogrid(entry, start_ms):
+    entry.append(CUE_V2.empty("AutoGrid", "0", "0", f"{start_ms:.6f}", "0.000000", "-1", "0", "#FFFFFF"))
+
+
+def add_cue(entry, cue, cue_index):
+    """
+    Add a CUE_V2 element from a cue or loop to an ENTRY.
+
+    Args:
+        entry: ENTRY ElementBuffer
+        cue: Cue read from a POSITION_MARK element
+        cue_index: Position of the cue in the track (from 1), its number when it isn't a hot cue
+    """
+    start_ms = cue.start * 1000
+    loop_length = 0
+    if cue.end is not None:
+        loop_length = cue.end * 1000 - start_ms
+
+    hotcue = cue.hotcue if cue.hotcue and cue.hotcue != "-1" else str(cue_index)
+
+    color = traktor_cue_color(*cue.color) if cue.color else None
+
+    entry.append(CUE_V2.empty(
+        cue.name or "n.n.",
+        "0",
+        traktor_cue_type(cue.type),
+        f"{start_ms:.6f}",
+        f"{loop_length:.6f}",
+        "-1",
+        hotcue,
+        color,
+    ))
+
+
+def add_grid(entry, info, context):
+    """Add the beatgrid markers of a track to its ENTRY."""
+    # Without beatgrid, the grid starts at 0 at the track BPM
+    tempos = info.tempos or [TempoMarker(0, info.bpm)]
+    if context.grid is not None:
+        dropped = context.grid.dropped
+        tempos = context.grid.compact(tempos)
+        context.stats.count("dropped_grid_markers", context.grid.dropped - dropped)
+
+    for i, tempo in enumerate(tempos):
+        start_ms = tempo.start * 1000
+
+        is_autogrid = (i == 0)
+        add_beatmarker(entry, start_ms, tempo.bpm, is_autogrid=is_autogrid)
+
+        if is_autogrid:
+            add_autogrid(entry, start_ms)
+    context.stats.count("tempos", len(tempos))
+
+
+def add_cues(entry, info, context):
+    """Add the cues and loops of a track to its ENTRY."""
+    cues = [cue for cue in info.cues if cue.name != "AutoGrid"]
+    for cue_index, cue in enumerate(cues, 1):
+        add_cue(entry, cue, cue_index)
+    context.stats.count("cues", len(cues))
+
+
+def convert_track(track, context):
+    """
+    Convert a Rekordbox collection TRACK to a Traktor ENTRY.
+    Only depends on its arguments, so that tracks can be converted concurrently.
+
+    Args:
+        track: Rekordbox TRACK element
+        context: ConversionContext of the conversion
+
+    Returns:
+        tuple: (ENTRY ElementBuffer, Track read from the TRACK)
+    """
+    with context.stats.stage("metadata"):
+        info = rekordbox_extractor.extract(track, context)
+        entry = open_entry(info, context)
+        add_metadata(entry, info)
+
+    with context.stats.stage("cues"):
+        read_rekordbox_marks(track, info)
+        add_grid(entry, info, context)
+        add_cues(entry, info, context)
+
+    return entry, info
 
 
 class Rekordbox2Traktor:
-    def __init__(self):
+    def __init__(self, stats=None, grid=None, dedup=None):
+        """
+        Args:
+            stats: ConversionStats collecting stage timings and counters (None to disable them)
+            grid: GridCompactor dropping redundant beatgrid markers (None to keep them all)
+            dedup: Deduplicator dropping the copies of tracks found several times (None to keep them all)
+        """
+        self.context = ConversionContext("rekordbox", "traktor", stats, grid)
+        self.stats = self.context.stats
+        self.grid = grid
+        self.dedup = dedup
         self.root = None
-        self.track = None
-        self.cues = []
         self.track_index = 0
-        self.cue_index = 0
-        self.track_info = {}
         self.tracks = []
-
-    def generate_audio_id(self):
-        # AUDIO_ID contains Base64-encoded audio fingerprint data (spectral analysis, transients, beat info) that Traktor uses for validation.
-        # Since we can't generate authentic fingerprints without Native Instruments' algorithms, we use a static placeholder.
-        # Imported tracks might require re-analysis in Traktor.
-        return "AWAWZmRENDMzMzf//////////////////////f/////////////////////s/////////////////////5b///7//////////+//////af/////////////////////+///////////f/////////1n/////////9Y///////////f/////////+r/7///////9XYzMzM0MyMzJUMzNDNDMzRDn//////////////////////f/////////////////////e/////////////////////3r+/+////////7u7u/v////vf//7////////v/+//////+FZneYYQAAAA=="
-
-    def set_track_info(self, track):
-        self.track_info = {
-            'id': get_attribute(track, "TrackId") or uuid.uuid4().hex[:8],
-            'title': get_attribute(track, "Name"),
-            'artist': get_attribute(track, "Artist"),
-            'album': get_attribute(track, "Album"),
-            'key': get_tonalikey(get_attribute(track, "Tonality")),
-            'bpm': float(get_attribute(track, "AverageBpm") or "120.0"),
-            'color': get_track_color(get_attribute(track, "Colour")),
-            'genre': get_attribute(track, "Genre"),
-            'playtime': get_attribute(track, "TotalTime"),
-            'playcount': get_attribute(track, "PlayCount"),
-            'bitrate': float(get_attribute(track, "BitRate") or "320") * 1000,
-            'import_date': format_date(get_attribute(track, "DateAdded")),
-            'modif_date': format_date(get_attribute(track, "DateModified")),
-            'last_played': format_date(get_attribute(track, "LastPlayed")),
-            'ranking': get_attribute(track, "Rating"),
-            'filesize': get_attribute(track, "Size"),
-            'location': get_attribute(track, "Location"),
-            'comments': get_attribute(track, "Comments")
-        }
-
-        return self.track_info
-
-    @staticmethod
-    def sec_2_ms(time_sec):
-        return float(time_sec) * 1000 if time_sec else 0
-
-    def add_location(self):
-        location_data = get_location(self.track_info['location'])
-        location = ET.SubElement(self.track, "LOCATION",
-                                 DIR=location_data["DIR"],
-                                 FILE=location_data["FILE"],
-                                 VOLUME=location_data["VOLUME"],
-                                 VOLUMEID=location_data["VOLUME"])
-        return location
-
-    def add_album(self):
-        if self.track_info['album']:
-            album = ET.SubElement(self.track, "ALBUM", TITLE=self.track_info['album'])
-            return album
-        return None
-
-    def add_modification_info(self):
-        modif = ET.SubElement(self.track, "MODIFICATION_INFO", AUTHOR_TYPE="user")
-        return modif
-
-    def add_info(self):
-        info_attrs = {
-            "BITRATE": str(int(self.track_info['bitrate'])),
-            "GENRE": self.track_info['genre'],
-            "KEY": KEY_TO_CODE[self.track_info['key']],
-            "PLAYCOUNT": self.track_info['playcount'],
-            "PLAYTIME": self.track_info['playtime'],
-            "PLAYTIME_FLOAT": f"{float(self.track_info['playtime']):.6f}",
-            "RANKING": self.track_info['ranking'],
-            "IMPORT_DATE": self.track_info['import_date'],
-            "LAST_PLAYED": self.track_info['last_played'],
-            "FLAGS": "12",
-            # "FILESIZE": str(int(float(self.track_info['filesize']) / 1024)) if self.track_info['filesize'] else "0",
-            "COLOR": self.track_info['color']
-        }
-
-        if self.track_info['comments']:
-            info_attrs["COMMENT"] = self.track_info['comments']
-
-        info = ET.SubElement(self.track, "INFO", **info_attrs)
-        return info
-
-    def add_tempo(self):
-        tempo = ET.SubElement(self.track, "TEMPO",
-                              BPM=f"{self.track_info['bpm']:.6f}",
-                              BPM_QUALITY="100.000000")
-        return tempo
-
-    def add_loudness(self):
-        loudness = ET.SubElement(self.track, "LOUDNESS",
-                                 PEAK_DB="-1.0",
-                                 PERCEIVED_DB="-1.0",
-                                 ANALYZED_DB="-1.0")
-        return loudness
-
-    def add_musical_key(self):
-        musical_key = ET.SubElement(self.track, "MUSICAL_KEY", VALUE=self.track_info['key'])
-        return musical_key
-
-    def add_beatmarker(self, start_ms, bpm, is_autogrid=False):
-        name = "AutoGrid" if is_autogrid else "Beat Marker"
-
-        cue = ET.SubElement(self.track, "CUE_V2",
-                            NAME=name,
-                            DISPL_ORDER="0",
-                            TYPE="4",
-                            START=f"{start_ms:.6f}",
-                            LEN="0.000000",
-                            REPEATS="-1",
-                            HOTCUE="-1")
-
-        grid = ET.SubElement(cue, "GRID", BPM=f"{bpm:.6f}")
-
-        return cue
-
-    def add_autogrid(self, start_ms):
-        cue = ET.SubElement(self.track, "CUE_V2",
-                            NAME="AutoGrid",
-                            DISPL_ORDER="0",
-                            TYPE="0",
-                            START=f"{start_ms:.6f}",
-                            LEN="0.000000",
-                            REPEATS="-1",
-                            HOTCUE="0",
-                            COLOR="#FFFFFF")
-
-        return cue
-
-    def add_cue(self, position_mark):
-        cue_type = get_attribute(position_mark, "Type")
-        start_sec = get_attribute(position_mark, "Start")
-        end_sec = get_attribute(position_mark, "End")
-        num = get_attribute(position_mark, "Num")
-        name = get_attribute(position_mark, "Name") or "n.n."
-
-        start_ms = self.sec_2_ms(start_sec)
-        loop_length = 0
-        if end_sec:
-            loop_length = self.sec_2_ms(end_sec) - start_ms
-
-        hotcue = num if num and num != "-1" else str(self.cue_index)
-
-        cue_attrs = {
-            "NAME": name,
-            "DISPL_ORDER": "0",
-            "TYPE": get_cue_type(cue_type),
-            "START": f"{start_ms:.6f}",
-            "LEN": f"{loop_length:.6f}",
-            "REPEATS": "-1",
-            "HOTCUE": hotcue
-        }
-
-        cue = ET.SubElement(self.track, "CUE_V2", **cue_attrs)
-        r = get_attribute(position_mark, "Red")
-        g = get_attribute(position_mark, "Green")
-        b = get_attribute(position_mark, "Blue")
-
-        if r and g and b:
-            set_cue_color(cue, r=r, g=g, b=b)
-
-        self.cue_index += 1
-        return cue
-
-    def process_tempo(self, track):
-        tempo_elements = track.findall("TEMPO")
-
-        if not tempo_elements:
-            self.add_beatmarker(0, self.track_info['bpm'], is_autogrid=True)
-            self.add_autogrid(0)
-
-        elif len(tempo_elements) == 1:
-            tempo = tempo_elements[0]
-            start_sec = float(get_attribute(tempo, "Inizio") or "0")
-            bpm = float(get_attribute(tempo, "Bpm") or str(self.track_info['bpm']))
-            start_ms = self.sec_2_ms(start_sec)
-
-            self.add_beatmarker(start_ms, bpm, is_autogrid=True)
-            self.add_autogrid(start_ms)
-
-        else:
-            for i, tempo in enumerate(tempo_elements):
-                start_sec = float(get_attribute(tempo, "Inizio") or "0")
-                bpm = float(get_attribute(tempo, "Bpm") or str(self.track_info['bpm']))
-                start_ms = self.sec_2_ms(start_sec)
-
-                is_autogrid = (i == 0)
-                self.add_beatmarker(start_ms, bpm, is_autogrid=is_autogrid)
-
-                if is_autogrid:
-                    self.add_autogrid(start_ms)
-
-    def process_cues(self, track):
-        position_marks = track.findall("POSITION_MARK")
-
-        for position_mark in position_marks:
-            name = get_attribute(position_mark, "Name")
-            if name == "AutoGrid":
-                continue
-
-            self.add_cue(position_mark)
-
-    def reset_track(self):
-        self.track = None
-        self.cues = []
-        self.cue_index = 1
-        self.track_info = {}
-
-    def add_entry(self, collection):
-        info = self.track_info
-
-        entry = ET.SubElement(
-            collection,
-            "ENTRY",
-            MODIFIED_DATE= info['modif_date'] or today(),
-            MODIFIED_TIME="0", # TODO change
-            AUDIO_ID=self.generate_audio_id(),
-            TITLE=info['title'],
-            ARTIST=info['artist']
-        )
-        return entry
+        self.collection_keys = set()  # PRIMARYKEY of the converted tracks
+        self.track_keys = {}  # Map TrackID to PRIMARYKEY for playlist references
+        self.key_aliases = {}  # Map PRIMARYKEY of dropped duplicates to the PRIMARYKEY of their survivor
 
     def add_playlist(self, name="collection"):
-        playlists = ET.SubElement(self.root, "PLAYLISTS")
-        root_node = ET.SubElement(playlists, "NODE", TYPE="FOLDER", NAME="$ROOT")
-        subnodes = ET.SubElement(root_node, "SUBNODES", COUNT="1")
+        """
+        Add the PLAYLISTS section, with a playlist of the whole converted collection.
+
+        Returns:
+            Element: SUBNODES of the $ROOT folder, to which the converted playlist tree is added
+        """
+        playlists = backend.SubElement(self.root, "PLAYLISTS")
+        root_node = backend.SubElement(playlists, "NODE", TYPE="FOLDER", NAME="$ROOT")
+        subnodes = backend.SubElement(root_node, "SUBNODES", COUNT="1")
+        self.add_playlist_node(subnodes, name, self.tracks)
+        return subnodes
 
-        playlist_node = ET.SubElement(subnodes, "NODE", TYPE="PLAYLIST", NAME=name)
-        playlist = ET.SubElement(
+    @staticmethod
+    def add_playlist_node(subnodes, name, track_keys):
+        """
+        Add a playlist NODE to a Traktor folder.
+
+        Args:
+            subnodes: SUBNODES element of the folder
+            name: Name of the playlist
+            track_keys: PRIMARYKEY of its tracks, in order
+        """
+        playlist_node = backend.SubElement(subnodes, "NODE", TYPE="PLAYLIST", NAME=name)
+        playlist = backend.SubElement(
             playlist_node, "PLAYLIST",
-            ENTRIES=str(len(self.tracks)),
+            ENTRIES=str(len(track_keys)),
             TYPE="LIST",
             UUID=uuid.uuid4().hex
         )
 
-        for track_loc in self.tracks:
-            entry = ET.SubElement(playlist, "ENTRY")
-            primary_key = ET.SubElement(entry, "PRIMARYKEY", TYPE="TRACK", KEY=track_loc)
-
-    def process_track(self, track, collection):
-        self.reset_track()
-
-        self.set_track_info(track)
-        self.track = self.add_entry(collection)
-
-        self.add_location()
-        self.add_album()
-        self.add_modification_info()
-        self.add_info()
-        self.add_tempo()
-        self.add_loudness()
-        self.add_musical_key()
-
-        self.process_tempo(track)
-        self.process_cues(track)
+        for track_key in track_keys:
+            entry = backend.SubElement(playlist, "ENTRY")
+            primary_key = backend.SubElement(entry, "PRIMARYKEY", TYPE="TRACK", KEY=track_key)
 
-        return True
+    @staticmethod
+    def get_child_nodes(rekordbox_node):
+        """Get the folder and playlist NODE children of a Rekordbox folder NODE."""
+        return [node for node in rekordbox_node.findall("NODE") if node.get("Type") in (FOLDER_NODE, PLAYLIST_NODE)]
+
+    def add_playlist_tree(self, rekordbox_playlists, subnodes):
+        """
+        Convert the Rekordbox playlist tree (the children of its ROOT node) into a Traktor folder.
+        The tree is walked with an explicit stack, so deeply nested folders can't hit the recursion limit.
+
+        Args:
+            rekordbox_playlists: Rekordbox PLAYLISTS element
+            subnodes: SUBNODES element of the Traktor folder receiving the tree
+        """
+        root_node = rekordbox_playlists.find("NODE")
+        if root_node is None:
+            return
+
+        children = self.get_child_nodes(root_node)
+        subnodes.set("COUNT", str(int(subnodes.get("COUNT")) + len(children)))
+        # Reversed, so that children are popped (and added to the folder) in their original order
+        stack = [(child, subnodes) for child in reversed(children)]
+        while stack:
+            node, parent = stack.pop()
+            name = node.get("Name", "")
+
+            if node.get("Type") == FOLDER_NODE:
+                self.stats.count("folders")
+                children = self.get_child_nodes(node)
+                folder_node = backend.SubElement(parent, "NODE", TYPE="FOLDER", NAME=name)
+                folder = backend.SubElement(folder_node, "SUBNODES", COUNT=str(len(children)))
+                stack.extend((child, folder) for child in reversed(children))
+            else:
+                self.stats.count("playlists")
+                key_type = node.get("KeyType", "0")
+                track_keys = []
+                for track in node.iterfind("TRACK"):
+                    track_key = self.resolve_track_key(track.get("Key", ""), key_type)
+                    if track_key is not None:
+                        track_keys.append(track_key)
+                    else:
+                        self.stats.count("unresolved_playlist_keys")
+                self.add_playlist_node(parent, name, track_keys)
+
+    def resolve_track_key(self, key, key_type="0"):
+        """
+        PRIMARYKEY of a track referenced by a Rekordbox playlist (by TrackID, or by Location),
+        None if it isn't a track of the converted collection.
+        """
+        if key_type == LOCATION_KEYS:
+            location = self.context.get_location(key)
+            if location is EMPTY_LOCATION:
+                return None
+            track_key = self.key_aliases.get(location.key, location.key)
+            return track_key if track_key in self.collection_keys else None
+        return self.track_keys.get(key)
+
+    def add_duplicate_aliases(self):
+        """Point the playlist references of dropped duplicates at their survivor."""
+        for dropped, survivor in self.dedup.aliases:
+            if dropped.track_id:
+                self.track_keys[dropped.track_id] = survivor.path
+            if dropped.path and dropped.path != survivor.path:
+                self.key_aliases[dropped.path] = survivor.path
+
+    def deduplicate(self, tracks):
+        """Skip the collection tracks dropped by the Deduplicator."""
+        for track in tracks:
+            with self.stats.stage("dedup"):
+                keep = self.dedup.keep(probe_rekordbox_track(track))
+            if keep:
+                yield track
+            else:
+                self.stats.count("duplicate_tracks")
+
+    def add_track_key(self, track_id, track_key):
+        """Register a converted track for the collection playlist and for playlist references."""
+        self.tracks.append(track_key)
+        self.collection_keys.add(track_key)
+        if track_id:
+            self.track_keys[track_id] = track_key
+
+    def process_track(self, track):
+        """
+        Convert a single Rekordbox TRACK, and register it for the playlists.
+
+        Returns:
+            tuple: (ENTRY ElementBuffer, Track)
+        """
+        entry, info = convert_track(track, self.context)
+        self.add_track_key(track.get("TrackID"), info.location.key)
+        return entry, info
 
     def add_head(self):
-        head = ET.SubElement(self.root, "HEAD", COMPANY="www.native-instruments.com", PROGRAM="Traktor Pro 4")
+        head = backend.SubElement(self.root, "HEAD", COMPANY="www.native-instruments.com", PROGRAM="Traktor Pro 4")
         return head
 
-    def add_collection(self, entries):
-        collection = ET.SubElement(self.root, "COLLECTION", ENTRIES=str(len(entries)))
-        return collection
-
     def add_sets(self, entries=[]):
-        sets = ET.SubElement(self.root, "SETS", ENTRIES=str(len(entries)))
+        sets = backend.SubElement(self.root, "SETS", ENTRIES=str(len(entries)))
         return sets
 
     def add_indexing(self):
-        indexing = ET.SubElement(self.root, "INDEXING")
+        indexing = backend.SubElement(self.root, "INDEXING")
         return indexing
 
     def convert_xml_to_nml(self, xml_file, nml_file):
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        self.root = ET.Element("NML", VERSION="20")
-
-        entries = root.findall(".//TRACK")
-
-        self.add_head()
-        collection = self.add_collection(entries)
+        """
+        xml_file: Path or readable binary file object of the input Rekordbox XML
+        nml_file: Path or writable binary file object of the output NML
+        """
+        with self.stats.stage("parse"):
+            root = backend.parse(xml_file)
+
+            # Only collection tracks: PLAYLISTS also contain TRACK elements (Key references)
+            entries = root.findall("./COLLECTION/TRACK")
+        entry_count = len(entries)
+        if self.dedup is not None:
+            with self.stats.stage("dedup"):
+                entry_count -= self.dedup.scan(probe_rekordbox_track(track) for track in entries)
+
+        self.write_nml(nml_file, self.convert_tracks(entries), entry_count, {"PLAYLISTS": root.find("PLAYLISTS")})
+
+    def write_nml(self, nml_file, entries, entry_count=None, sections=None):
+        """
+        Write the Traktor NML document, serializing entries as they are converted.
+
+        Args:
+            nml_file: Path or writable binary file object of the output NML
+            entries: Iterable of serialized ENTRY elements
+            entry_count: Number of entries, back-patched once all entries are written when unknown (seekable output only)
+            sections: Rekordbox top-level sections by tag, read once all entries are written
+        """
+        self.root = backend.Element("NML", VERSION="20")
+        head = self.add_head()
 
         self.tracks = []
-
-        for track in entries:
-            if self.process_track(track, collection):
-                loc = get_location(get_attribute(track, "Location"))
-                self.tracks.append(f"{loc['VOLUME']}{loc['DIR']}{loc['FILE']}")
+        self.collection_keys = set()
+        self.track_keys = {}
+        self.key_aliases = {}
+
+        with XmlStreamWriter(nml_file) as writer:
+            writer.write_declaration()
+            writer.write('<NML VERSION="20">')
+            writer.write_element(head, short_empty_elements=False)
+            writer.write("<COLLECTION")
+            if entry_count is None:
+                writer.reserve_attribute("ENTRIES")
+            else:
+                writer.write(f' ENTRIES="{entry_count}"')
+            writer.write(">")
+
+            written = 0
+            for entry in entries:
+                with self.stats.stage("write"):
+                    writer.write_bytes(entry)
+                written += 1
+            self.stats.count("tracks", written)
+
+            writer.write("</COLLECTION>")
+            if entry_count is None:
+                writer.patch_attribute("ENTRIES", written)
+
+            self.root.remove(head)
+            with self.stats.stage("playlists"):
+                self.add_sets()
+                subnodes = self.add_playlist()
+                self.stats.count("playlists")
+                # Every track can be referenced once the whole collection was converted
+                if self.dedup is not None:
+                    self.add_duplicate_aliases()
+                rekordbox_playlists = (sections or {}).get("PLAYLISTS")
+                if rekordbox_playlists is not None:
+                    self.add_playlist_tree(rekordbox_playlists, subnodes)
+                self.add_indexing()
+            with self.stats.stage("write"):
+                for section in self.root:
+                    writer.write_element(section, short_empty_elements=False)
+                writer.write("</NML>")
+
+    def convert_tracks(self, tracks, jobs=1):
+        """
+        Convert collection tracks to Traktor ENTRY elements.
+
+        Args:
+            tracks: Iterable of Rekordbox TRACK elements, in collection order
+            jobs: Number of processes converting tracks by shards (None for one per CPU)
+
+        Yields:
+            bytes: Serialized ENTRY elements, in collection order
+        """
+        if self.dedup is not None:
+            tracks = self.deduplicate(tracks)
+
+        if jobs == 1:
+            for track in tracks:
+                entry, _ = self.process_track(track)
+                with self.stats.stage("serialize"):
+                    entry = entry.tostring()
+                yield entry
                 self.track_index += 1
-
-        self.add_sets()
-        self.add_playlist()
-        self.add_indexing()
-
-        tree = ET.ElementTree(self.root)
-        tree.write(nml_file, encoding="utf-8", xml_declaration=True, short_empty_elements=False)
+            return
+
+        worker = partial(convert_xml_shard, grid=self.grid, stats=self.stats.enabled)
+        with ShardPool(worker, jobs, self.track_index) as pool:
+            for track in tracks:
+                # Time spent sending tracks and waiting for converted shards (workers aren't timed)
+                with self.stats.stage("shards"):
+                    entries = pool.add(track)
+                yield from self.add_converted_entries(entries)
+            with self.stats.stage("shards"):
+                entries = pool.flush()
+            yield from self.add_converted_entries(entries)
+
+    def add_converted_entries(self, entries):
+        """Register entries converted in a worker process for the playlists."""
+        for entry, track_id, track_key, dropped, counters in entries:
+            if dropped:
+                self.grid.dropped += dropped
+            if counters:
+                self.stats.merge(counters)
+            self.add_track_key(track_id, track_key)
+            self.track_index += 1
+            yield entry
+
+    def stream_xml_to_nml(self, xml_file, nml_file, jobs=1, expat=False):
+        """
+        Convert a Rekordbox XML file one collection track at a time, so that full library exports
+        can be converted with bounded memory: each ENTRY is written as soon as it is built,
+        and the source TRACK is freed before the next one is parsed.
+
+        xml_file: Path or readable binary file object of the input Rekordbox XML
+        nml_file: Path or seekable binary file object of the output NML
+        jobs: Number of processes converting tracks by shards (None for one per CPU)
+        expat: Read the XML with expat (memory-mapped, without element tree), sequential conversions only
+        """
+        if expat and jobs != 1:
+            raise ValueError("The expat reader can only be used by sequential conversions")
+        if self.dedup is not None and self.dedup.needs_scan:
+            with self.stats.stage("dedup"):
+                scan_collection(self.dedup, xml_file, "TRACK", probe_rekordbox_track, expat)
+        items = iter_collection_expat(xml_file, "TRACK") if expat else iter_collection(xml_file, "TRACK")
+        sections = {}
+
+        def collection_tracks():
+            for kind, element in self.stats.iterate(items, "parse"):
+                if kind == "item":
+                    yield element
+                else:
+                    sections[element.tag] = element
+
+        self.write_nml(nml_file, self.convert_tracks(collection_tracks(), jobs), sections=sections)
+
+
+def convert_xml_shard(start_index, tracks, grid=None, stats=False):
+    """
+    Convert a shard of serialized collection tracks in a worker process.
+
+    Returns:
+        list: (serialized ENTRY, TrackID, playlist key, dropped beatgrid markers, counters or None) of each track
+    """
+    if grid is not None:
+        grid.dropped = 0  # Copy of the main process compactor, with its count
+    context = ConversionContext("rekordbox", "traktor", ConversionStats() if stats else None, grid)
+    results = []
+    for serialized in tracks:
+        track = backend.fromstring(serialized)
+        entry, info = convert_track(track, context)
+        dropped = 0
+        if grid is not None:
+            dropped, grid.dropped = grid.dropped, 0
+        counters = context.take_counters() if stats else None
+        results.append((entry.tostring(), track.get("TrackID"), info.location.key, dropped, counters))
+    return results
 
 
 if __name__ == "__main__":
-    set_conversion("rekordbox", "traktor")
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Convert a Rekordbox XML collection to Traktor NML")
+    parser.add_argument("xml_file", help="playlist.rekordbox.xml")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    parser.add_argument("--stream", action="store_true", help="convert track by track with bounded memory")
+    parser.add_argument("--jobs", type=int, default=1, help="processes converting tracks in parallel (0: one per CPU)")
+    parser.add_argument("--expat", action="store_true", help="read the collection with expat from a memory map (implies --stream)")
+    parser.add_argument("--stats", help="JSON file where stage timings and counters are saved")
+    parser.add_argument("--compact-grid", action="store_true", help="drop the beatgrid markers that don't change the grid")
+    parser.add_argument("--dedup", choices=DEDUP_POLICIES, help="keep a single copy of tracks found several times, chosen by this policy")
+    parser.add_argument("--dedup-metadata", action="store_true", help="also match duplicates on title, artist and duration")
+    parser.add_argument("--bpm-tolerance", type=float, default=BPM_TOLERANCE, help="largest BPM difference of merged grid markers")
+    parser.add_argument("--phase-tolerance", type=float, default=PHASE_TOLERANCE * 1000, help="largest offset in ms of a dropped grid marker")
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.expat and args.jobs != 1:
+        parser.error("--expat can't be combined with --jobs")
+
+    xml_file = args.xml_file
+
+    if not exists(xml_file):
         print("Usage: python rekord_to_nml.py playlist.rekordbox.xml")
-    else:
-        xml_file = sys.argv[1]
+        sys.exit(1)
 
-        if not exists(xml_file):
-            print("Usage: python rekord_to_nml.py playlist.rekordbox.xml")
-            sys.exit(1)
+    filepath = xml_file.replace(".xml", "").replace(".rekordbox", "")
+    nml_file = f"{filepath}.nml"
 
-        filepath = xml_file.replace(".xml", "").replace(".rekordbox", "")
-        nml_file = f"{filepath}.nml"
-        open(nml_file, "w").close()
-
-        converter = Rekordbox2Traktor()
+    grid = GridCompactor(args.bpm_tolerance, args.phase_tolerance / 1000) if args.compact_grid else None
+    dedup = Deduplicator(args.dedup, args.dedup_metadata) if args.dedup else None
+    converter = Rekordbox2Traktor(stats=ConversionStats() if args.stats else None, grid=grid, dedup=dedup)
+    if args.stream or args.expat or args.jobs != 1:
+        converter.stream_xml_to_nml(xml_file, nml_file, jobs=args.jobs or None, expat=args.expat)
+    else:
         converter.convert_xml_to_nml(xml_file, nml_file)
 
-        print(f"☕️ {xml_file} was converted to {nml_file}!")
\ No newline at end of file
+    if args.stats:
+        converter.context.count_dates()
+        converter.stats.save(args.stats)
+    if grid:
+        print(f"📏 beatgrid: {grid.dropped} redundant markers dropped")
+    if dedup:
+        print(f"🧹 dedup: {dedup.dropped} duplicate tracks dropped")
+    print(f"☕️ {xml_file} was converted to {nml_file}!")
\ No newline at end of file
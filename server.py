@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os.path import basename, join, splitext
+from urllib.parse import parse_qs, urlsplit
+
+from batch_convert import CONVERSIONS, convert_file, output_path
+from streaming import BUFFER_SIZE
+from xml_backend import BACKENDS, backend, use_backend
+
+MAX_UPLOAD = 512 * 1024 * 1024
+MAX_HEADERS = 100
+LATENCY_WINDOW = 1000  # Latest requests the latency percentiles are computed on
+REASONS = {
+    200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error",
+}
+CONTENT_TYPES = {".xml": "application/xml", ".nml": "application/xml"}
+PREFLIGHT_HEADERS = {  # Answer to the CORS preflight of browser uploads
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Content-Length",
+    "Content-Length": "0",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyMetrics:
+    """Request counts, statuses and latencies of each route."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.routes = {}
+        self.in_flight = 0
+        self.started = time.perf_counter()
+
+    def record(self, route, status, seconds):
+        metrics = self.routes.get(route)
+        if metrics is None:
+            metrics = self.routes[route] = {"requests": 0, "statuses": {}, "latencies": deque(maxlen=self.window)}
+        metrics["requests"] += 1
+        metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+        metrics["latencies"].append(seconds)
+
+    @staticmethod
+    def percentile(ordered, fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def report(self):
+        """
+        Returns:
+            dict: Uptime, requests in flight, and for each route its requests, statuses and latencies (in seconds)
+        """
+        routes = {}
+        for route, metrics in self.routes.items():
+            ordered = sorted(metrics["latencies"])
+            routes[route] = {
+                "requests": metrics["requests"],
+                "statuses": {str(status): count for status, count in metrics["statuses"].items()},
+                "latency": {
+                    "p50": self.percentile(ordered, 0.5),
+                    "p95": self.percentile(ordered, 0.95),
+                    "max": ordered[-1],
+                },
+            }
+        return {"uptime": time.perf_counter() - self.started, "in_flight": self.in_flight, "routes": routes}
+
+
+class ConversionServer:
+    """
+    Local HTTP service converting collections, with the converters kept warm in a pool of worker processes.
+
+    Routes:
+        POST /convert?file=<name>.nml|.xml  Body: the collection, response: the converted collection (streamed)
+        GET /metrics                          Request counts and latencies, as JSON
+        GET /health
+
+    Uploads are spooled to disk and converted files are streamed from disk, so that memory doesn't
+    depend on the size of collections. At most `jobs` conversions run at once, the next ones wait.
+    """
+
+    def __init__(self, workers=None, jobs=None, max_upload=MAX_UPLOAD, work_dir=None):
+        """
+        Args:
+            workers: Number of worker processes converting collections (defaults to the number of CPUs)
+            jobs: Number of conversions running or queued in the pool at once (defaults to the number of workers)
+            max_upload: Size in bytes above which uploads are refused
+            work_dir: Where uploads and converted files are stored while a request is handled
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.jobs = asyncio.Semaphore(jobs or self.workers)
+        self.max_upload = max_upload
+        self.work_dir = work_dir
+        self.metrics = LatencyMetrics()
+        self.pool = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Start the worker processes and listen for requests (port 0 for any free port).
+
+        Returns:
+            asyncio.Server: Server accepting connections, `close` stops the workers once it is closed
+        """
+        # Spawned rather than forked: forked workers would keep a copy of the connections open at the time,
+        # which then wouldn't be closed before the worker exits
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(self.workers, context, initializer=use_backend, initargs=(backend.name,))
+        try:
+            return await asyncio.start_server(self.handle, host, port)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """Serve until cancelled."""
+        server = await self.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def handle(self, reader, writer):
+        """Handle one request per connection."""
+        start = time.perf_counter()
+        route, status = "invalid", 500
+        self.metrics.in_flight += 1
+        try:
+            method, url, headers = await self.read_head(reader)
+            route = urlsplit(url).path
+            status = await self.dispatch(method, url, headers, reader, writer)
+        except HttpError as e:
+            status = e.status
+            await self.send_json(writer, status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 400
+        except Exception as e:
+            status = 500
+            await self.send_json(writer, status, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.record(route, status, time.perf_counter() - start)
+            writer.close()
+
+    @staticmethod
+    async def read_head(reader):
+        """
+        Returns:
+            tuple: (method, URL, headers with lowercase names)
+        """
+        try:
+            method, url, _ = (await reader.readline()).decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Invalid request line")
+
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return method, url, headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise HttpError(400, "Too many headers")
+
+    async def dispatch(self, method, url, headers, reader, writer):
+        path = urlsplit(url).path
+        if method == "OPTIONS":
+            await self.send_head(writer, 204, PREFLIGHT_HEADERS)
+            return 204
+        if path == "/health":
+            await self.send_json(writer, 200, {"status": "ok"})
+            return 200
+        if path == "/metrics":
+            await self.send_json(writer, 200, self.metrics.report())
+            return 200
+        if path == "/convert":
+            if method != "POST":
+                raise HttpError(405, "Use POST to convert a collection")
+            return await self.convert(url, headers, reader, writer)
+        raise HttpError(404, f"No route {path}")
+
+    async def convert(self, url, headers, reader, writer):
+        name = basename(parse_qs(urlsplit(url).query).get("file", [""])[0])
+        if splitext(name)[1].lower() not in CONVERSIONS:
+            raise HttpError(400, "The file parameter must be a .nml or .xml file name")
+        if "content-length" not in headers:
+            raise HttpError(411, "Content-Length is required")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HttpError(400, "Content-Length must be a number of bytes") from None
+        if length < 0:
+            raise HttpError(400, "Content-Length must be a number of bytes")
+        if length > self.max_upload:
+            raise HttpError(413, f"Collections are limited to {self.max_upload} bytes")
+
+        directory = tempfile.mkdtemp(dir=self.work_dir)
+        try:
+            input_file = join(directory, name)
+            output_file = output_path(input_file, directory)
+            await self.receive(reader, input_file, length)
+
+            async with self.jobs:
+                loop = asyncio.get_running_loop()
+                tracks, error = await loop.run_in_executor(self.pool, convert_file, input_file, output_file)
+            if error:
+                raise HttpError(422, error)
+
+            await self.send_file(writer, output_file, {"X-Converted-Tracks": str(tracks)})
+            return 200
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    async def receive(reader, path, length):
+        """Spool a request body to a file."""
+        with open(path, "wb") as file:
+            remaining = length
+            while remaining > 0:
+                chunk = await reader.read(min(BUFFER_SIZE, remaining))
+                if not chunk:
+                    raise HttpError(400, "Incomplete body")
+                file.write(chunk)
+                remaining -= len(chunk)
+
+    @staticmethod
+    async def send_head(writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", "Connection: close", "Access-Control-Allow-Origin: *"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def send_json(self, writer, status, data):
+        body = json.dumps(data).encode("utf-8")
+        await self.send_head(writer, status, {"Content-Type": "application/json", "Content-Length": str(len(body))})
+        writer.write(body)
+        await writer.drain()
+
+    async def send_file(self, writer, path, headers):
+        """Stream a converted file with chunked transfer encoding."""
+        await self.send_head(writer, 200, {
+            "Content-Type": CONTENT_TYPES[splitext(path)[1]],
+            "Content-Disposition": f'attachment; filename="{basename(path)}"',
+            "Transfer-Encoding": "chunked",
+            **headers,
+        })
+        with open(path, "rb") as file:
+            while chunk := file.read(BUFFER_SIZE):
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve collection conversions over HTTP on the local machine")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes converting collections (0: one per CPU)")
+    parser.add_argument("--jobs", type=int, default=0, help="conversions running at once, the next ones wait (0: one per worker)")
+    parser.add_argument("--max-upload", type=int, default=MAX_UPLOAD // 2 ** 20, help="largest accepted collection, in MiB")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto", help="XML parser / serializer (auto: lxml when installed)")
+    args = parser.parse_args()
+    try:
+        use_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = ConversionServer(args.workers or None, args.jobs or None, args.max_upload * 2 ** 20)
+    print(f"☕️ converting collections on http://{args.host}:{args.port}/convert")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
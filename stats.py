@@ -0,0 +1,102 @@
+import json
+import time
+from contextlib import nullcontext
+
+
+class StageTimer:
+    """Context manager adding the time spent in its block to a stage."""
+
+    __slots__ = ("stages", "name", "start")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stages[self.name] += time.perf_counter() - self.start
+
+
+class ConversionStats:
+    """
+    Wall time spent in each stage of a conversion, and counters of the converted items.
+
+    Stages don't overlap and can be entered many times (e.g. once per track): their times are summed.
+    A stage can't be nested in itself.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.timers = {}
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        """Time a block as part of a stage: `with stats.stage("parse"): ...`"""
+        timer = self.timers.get(name)
+        if timer is None:
+            self.stages[name] = 0.0
+            timer = self.timers[name] = StageTimer(self.stages, name)
+        return timer
+
+    def count(self, name, number=1):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def merge(self, counters):
+        """Add counters collected elsewhere (e.g. by a worker process, or stored with a cached fragment)."""
+        for name, number in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + number
+
+    def iterate(self, iterable, name):
+        """Iterate, timing how long each item takes to be produced as part of a stage (e.g. incremental parsing)."""
+        iterator = iter(iterable)
+        timer = self.stage(name)
+        while True:
+            with timer:
+                item = next(iterator, iterator)
+            if item is iterator:
+                return
+            yield item
+
+    def report(self):
+        """
+        Returns:
+            dict: Total wall time, time per stage (in seconds) and counters
+        """
+        return {
+            "seconds": time.perf_counter() - self.started,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+        }
+
+    def save(self, path):
+        """Save the report as JSON."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class DisabledStats:
+    """Stand-in for ConversionStats when no statistics are collected, doing as little as possible."""
+
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, number=1):
+        pass
+
+    def merge(self, counters):
+        pass
+
+    def iterate(self, iterable, name):
+        return iterable
+
+
+NO_STATS = DisabledStats()
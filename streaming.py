@@ -0,0 +1,317 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from queue import Full, Queue
+
+from xml_backend import backend
+
+COUNT_WIDTH = 24  # Room reserved for a back-patched count attribute, e.g. ` ENTRIES="123456"`
+BUFFER_SIZE = 1024 * 1024
+QUEUED_CHUNKS = 4  # Written chunks waiting to be consumed before the writer is blocked
+_DONE = object()
+
+
+def open_source(source):
+    """Binary file object of a document given as bytes, text (not a path) or a readable binary stream."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if isinstance(source, str):
+        return io.BytesIO(source.encode("utf-8"))
+    return source
+
+
+def iter_collection(source, item_tag):
+    """
+    Parse a Traktor NML or Rekordbox XML document incrementally.
+
+    Yields ("item", element) for each COLLECTION/<item_tag> element once it is fully parsed,
+    and ("section", element) for every other top-level section (PLAYLISTS, SETS, ...).
+    Items are cleared as soon as the consumer moves on: they must not be kept.
+    Sections are only detached from the document, so they can be kept to be processed later.
+
+    Args:
+        source: Path or binary file object of the document
+        item_tag: Tag of the collection items ("ENTRY" for NML, "TRACK" for Rekordbox)
+    """
+    stack = []
+    for event, element in backend.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            continue
+
+        stack.pop()
+        depth = len(stack)
+        if depth == 2 and stack[1].tag == "COLLECTION":
+            if element.tag == item_tag:
+                yield "item", element
+            element.clear()
+            stack[1].remove(element)
+        elif depth == 1:
+            stack[0].remove(element)
+            if element.tag != "COLLECTION":
+                yield "section", element
+
+
+def escape_attribute(text):
+    """Escape an attribute value exactly like ElementTree does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+class ElementTemplate:
+    """
+    Serializer of an element with a fixed list of attributes, written straight to text
+    without building an element tree, with the same output as ElementTree.
+
+    The start tag is compiled once into a dedicated function taking the attribute values in order.
+    Optional attributes are left out when their value is None.
+    """
+
+    def __init__(self, tag, attributes, optional=(), short_empty_elements=True):
+        """
+        Args:
+            tag: Element tag
+            attributes: Attribute names, in output order
+            optional: Attributes omitted when their value is None
+            short_empty_elements: Write elements without children as `<TAG ... />` (else `<TAG ...></TAG>`)
+        """
+        self.tag = tag
+        self.attributes = attributes
+        self.end_tag = f"</{tag}>"
+        self.empty_end = " />" if short_empty_elements else f">{self.end_tag}"
+        self.start_tag = self.compile(tag, attributes, optional)
+
+    @staticmethod
+    def compile(tag, attributes, optional):
+        values = [f"value_{index}" for index in range(len(attributes))]
+        parts = []
+        text = f"<{tag}"
+        for value, attribute in zip(values, attributes):
+            if attribute in optional:
+                parts.append(f"f'{text}'")
+                parts.append(f"(f' {attribute}=\"{{escape({value})}}\"' if {value} is not None else '')")
+                text = ""
+            else:
+                text += f' {attribute}="{{escape({value})}}"'
+        parts.append(f"f'{text}'")
+
+        namespace = {"escape": escape_attribute}
+        exec(f"def start_tag({', '.join(values)}):\n    return {' + '.join(parts)}", namespace)
+        return namespace["start_tag"]
+
+    def empty(self, *values):
+        """Serialize the element without children."""
+        return self.start_tag(*values) + self.empty_end
+
+    def open(self, *values):
+        """Start the element: children are appended to the returned buffer, serialized once closed."""
+        return ElementBuffer(self, self.start_tag(*values))
+
+
+class ElementBuffer:
+    """Element being serialized, holding its start tag and its already serialized children."""
+
+    __slots__ = ("template", "start_tag", "children")
+
+    def __init__(self, template, start_tag):
+        self.template = template
+        self.start_tag = start_tag
+        self.children = []
+
+    def append(self, text):
+        self.children.append(text)
+
+    def close(self):
+        """Serialize the element with its children."""
+        if not self.children:
+            return self.start_tag + self.template.empty_end
+        return f"{self.start_tag}>{''.join(self.children)}{self.template.end_tag}"
+
+    def tostring(self):
+        """Serialize the element with its children, as UTF-8 bytes."""
+        return self.close().encode("utf-8")
+
+
+def write_patched(data, patches, path):
+    """
+    Write a copy of a document with some byte ranges replaced, next to it so that it can be swapped in
+    with os.replace: untouched bytes are copied verbatim, through a buffered file.
+
+    Args:
+        data: Bytes-like document (e.g. a memoryview of the memory-mapped file)
+        patches: (start, end, replacement) of the ranges to replace, in order and without overlap
+        path: Path of the document, giving the directory and permissions of the copy
+
+    Returns:
+        str: Path of the patched copy, flushed to disk
+    """
+    descriptor, patched_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with open(descriptor, "wb", buffering=BUFFER_SIZE) as file:
+            position = 0
+            for start, end, replacement in patches:
+                file.write(data[position:start])
+                file.write(replacement)
+                position = end
+            file.write(data[position:])
+            file.flush()
+            os.fsync(file.fileno())
+        shutil.copymode(path, patched_path)
+    except BaseException:
+        os.unlink(patched_path)
+        raise
+    return patched_path
+
+
+class XmlStreamWriter:
+    """
+    Write an XML document piece by piece to a buffered file or a binary stream.
+
+    Counts that are only known once the document is written (e.g. COLLECTION ENTRIES)
+    are written as a blank placeholder inside the start tag, then patched in place:
+    this needs a seekable output.
+    """
+
+    def __init__(self, output):
+        """
+        Args:
+            output: Path of the document, or writable binary file object (flushed but left open)
+        """
+        self.owned = isinstance(output, (str, os.PathLike))
+        self.file = open(output, "wb", buffering=BUFFER_SIZE) if self.owned else output
+        self.placeholders = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def write(self, text):
+        self.file.write(text.encode("utf-8"))
+
+    def write_declaration(self):
+        """Write the same declaration as ElementTree.write(..., xml_declaration=True)."""
+        self.write("<?xml version='1.0' encoding='utf-8'?>\n")
+
+    def write_bytes(self, data):
+        self.file.write(data)
+
+    def write_element(self, element, short_empty_elements=True):
+        self.file.write(backend.tostring(element, short_empty_elements))
+
+    def reserve_attribute(self, name):
+        """Reserve room for an attribute of the start tag being written."""
+        if not self.file.seekable():
+            raise ValueError(f"{name} can only be back-patched in a seekable output")
+        self.placeholders[name] = self.file.tell()
+        self.write(" " * COUNT_WIDTH)
+
+    def patch_attribute(self, name, value):
+        """Fill a reserved attribute, padding with whitespace (valid inside a start tag)."""
+        attribute = f' {name}="{value}"'
+        if len(attribute) > COUNT_WIDTH:
+            raise ValueError(f"{name}={value} does not fit in the reserved placeholder")
+
+        position = self.file.tell()
+        self.file.seek(self.placeholders.pop(name))
+        self.write(attribute.ljust(COUNT_WIDTH))
+        self.file.seek(position)
+
+
+class ChunkPipe:
+    """
+    Unseekable binary stream handing what is written to another thread, by chunks of about `chunk_size` bytes.
+    Writes block while `queued` chunks are waiting, and fail with BrokenPipeError once the reader is gone.
+    """
+
+    def __init__(self, chunk_size=BUFFER_SIZE, queued=QUEUED_CHUNKS):
+        self.chunk_size = chunk_size
+        self.queue = Queue(queued)
+        self.buffer = bytearray()
+        self.cancelled = False
+        self.error = None
+
+    def put(self, item):
+        while not self.cancelled:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+        if item is not _DONE:
+            raise BrokenPipeError("The reader of the chunks is gone")
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            chunk = bytes(self.buffer)
+            self.buffer.clear()
+            self.put(chunk)
+
+    @staticmethod
+    def seekable():
+        return False
+
+
+def iter_written(write, chunk_size=BUFFER_SIZE, queued=QUEUED_CHUNKS):
+    """
+    Iterate over what a function writes to a binary stream, while it is written.
+    The function runs in a thread, blocked while the consumer is behind (e.g. a slow socket), so memory stays bounded.
+
+    Args:
+        write: Function taking a writable binary stream
+        chunk_size: Approximate size of the chunks
+        queued: Chunks waiting to be consumed before the function is blocked
+
+    Yields:
+        bytes: Written chunks, then errors raised by the function are raised again
+    """
+    pipe = ChunkPipe(chunk_size, queued)
+
+    def run():
+        try:
+            write(pipe)
+            pipe.flush()
+        except Exception as e:
+            pipe.error = e
+        finally:
+            pipe.put(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while (chunk := pipe.queue.get()) is not _DONE:
+            yield chunk
+        if pipe.error is not None:
+            raise pipe.error
+    finally:
+        # Stops the function when the consumer gives up early
+        pipe.cancelled = True
+        thread.join()
@@ -0,0 +1,222 @@
+import io
+import tempfile
+import unittest
+from os.path import join
+
+from conversion import location_codec
+from dedup import Deduplicator, TrackProbe, probe_nml_entry, probe_rekordbox_track, scan_collection
+from nml_to_rekord import Traktor2Rekordbox
+from rekord_to_nml import Rekordbox2Traktor
+from xml_backend import backend
+
+NML_ENTRY = """<ENTRY MODIFIED_DATE="2025/6/1" MODIFIED_TIME="3600" TITLE="Atomic" ARTIST="Blondie">
+<LOCATION DIR="/:Music/:" FILE="Atomic.mp3" VOLUME="HD"/><INFO PLAYTIME="281"/>
+<CUE_V2 NAME="AutoGrid" TYPE="4" START="10.0" LEN="0" HOTCUE="-1"><GRID BPM="128.0"/></CUE_V2>
+<CUE_V2 NAME="AutoGrid" TYPE="0" START="10.0" LEN="0" HOTCUE="0"/>
+<CUE_V2 NAME="Beat Marker" TYPE="4" START="5000.0" LEN="0" HOTCUE="-1"><GRID BPM="130.0"/></CUE_V2>
+<CUE_V2 NAME="Drop" TYPE="0" START="20000.0" LEN="0" HOTCUE="1"/>
+<CUE_V2 NAME="n.n." TYPE="0" START="30000.0" LEN="0" HOTCUE="-1"/>
+<CUE_V2 NAME="n.n." TYPE="5" START="40000.0" LEN="8000.0" HOTCUE="2"/>
+<CUE_V2 NAME="n.n." TYPE="1" START="50000.0" LEN="0" HOTCUE="-1"/>
+<CUE_V2 NAME="n.n." TYPE="3" START="0.0" LEN="0" HOTCUE="-1"/>
+</ENTRY>"""
+
+CUE = '<POSITION_MARK Type="0" Num="{}" Start="{}" Name="n.n."/>'
+FADE = '<POSITION_MARK Type="1" Num="-1" Start="{}" Name="n.n."/>'
+AUTOGRID = '<POSITION_MARK Type="0" Num="0" Start="0.2" Name="AutoGrid"/>'
+
+
+def rekordbox_track(track_id, location, modified, marks, name="Atomic"):
+    return (
+        f'<TRACK TrackID="{track_id}" Name="{name}" Artist="Blondie" Album="" Genre="Rock" Kind="3" Size="0" '
+        'TotalTime="281" DiscNumber="0" TrackNumber="0" Year="0" AverageBpm="134.33" BitRate="320.0" '
+        f'DateModified="{modified}" DateAdded="2025-01-01" SampleRate="0" PlayCount="0" LastPlayed="2025-01-01" '
+        f'Rating="0" Tonality="Em" Location="{location}" Colour="0xFFFF00">'
+        '<TEMPO Inizio="0.2" Bpm="134.33" Metro="4/4" Battito="1"/>'
+        + "".join(marks) + "</TRACK>"
+    )
+
+
+# The second track is a copy of the first (its path only differs by case), modified earlier but with more cues.
+# Counting the AutoGrid and fade marks of the first one as cues would make it survive the "most-cues" policy.
+LOCATIONS = ["file://localhost/Music/Atomic.mp3", "file://localhost/Music/ATOMIC.mp3", "file://localhost/Music/Denis.mp3"]
+TRACKS = [
+    rekordbox_track("1", LOCATIONS[0], "2025-01-01", [AUTOGRID, CUE.format(1, "30.0"), FADE.format("1.0"), FADE.format("2.0")]),
+    rekordbox_track("2", LOCATIONS[1], "2024-01-01", [CUE.format(1, "30.0"), CUE.format(2, "60.0")]),
+    rekordbox_track("3", LOCATIONS[2], "2024-01-01", [CUE.format(1, "10.0")], name="Denis"),
+]
+REKORDBOX_XML = (
+    '<?xml version="1.0" encoding="utf-8"?><DJ_PLAYLISTS Version="1.0.0">'
+    f'<COLLECTION Entries="{len(TRACKS)}">' + "".join(TRACKS) + "</COLLECTION>"
+    '<PLAYLISTS><NODE Type="0" Name="ROOT" Count="2">'
+    '<NODE Name="By id" Type="1" KeyType="0" Entries="3"><TRACK Key="1"/><TRACK Key="2"/><TRACK Key="3"/></NODE>'
+    '<NODE Name="By location" Type="1" KeyType="1" Entries="3">'
+    + "".join(f'<TRACK Key="{location}"/>' for location in LOCATIONS)
+    + "</NODE></NODE></PLAYLISTS></DJ_PLAYLISTS>"
+)
+SURVIVORS = {"first": 0, "newest": 0, "most-cues": 1}
+
+
+def probe(path, modified=(), cues=0, title="", duration=""):
+    return TrackProbe(path, "", title, "Blondie", duration, modified, cues)
+
+
+class ProbeTest(unittest.TestCase):
+    def test_nml_entry(self):
+        probed = probe_nml_entry(backend.fromstring(NML_ENTRY))
+        self.assertEqual(probed.path, "HD/:Music/:Atomic.mp3")
+        self.assertEqual((probed.title, probed.artist, probed.duration), ("Atomic", "Blondie", "281"))
+        self.assertEqual(probed.modified, (2025, 6, 1, 3600))
+        # Hot cue, memory cue and loop: not the grid markers, the AutoGrid cue, fades or loads
+        self.assertEqual(probed.cues, 3)
+
+    def test_rekordbox_track(self):
+        probed = probe_rekordbox_track(backend.fromstring(TRACKS[0]))
+        self.assertEqual(probed.path, location_codec.to_traktor(LOCATIONS[0]).key)
+        self.assertEqual(probed.track_id, "1")
+        self.assertEqual(probed.modified, (2025, 1, 1))
+        self.assertEqual(probed.cues, 1)
+
+
+class DeduplicatorTest(unittest.TestCase):
+    def run_policy(self, policy, probes, **kwargs):
+        dedup = Deduplicator(policy, **kwargs)
+        if dedup.needs_scan:
+            dedup.scan(probes)
+        return [dedup.keep(probed) for probed in probes], dedup
+
+    def test_first(self):
+        probes = [probe("HD/:Music/:Atomic.mp3"), probe("USB/:music/:ATOMIC.mp3", cues=5), probe("HD/:Music/:Denis.mp3")]
+        kept, dedup = self.run_policy("first", probes)
+        self.assertEqual(kept, [True, False, True])
+        self.assertEqual(dedup.aliases, [(probes[1], probes[0])])
+
+    def test_newest(self):
+        probes = [probe("HD/:A.mp3", (2024, 1, 1)), probe("HD/:a.mp3", (2025, 1, 1)), probe("HD/:A.mp3", (2025, 1, 1))]
+        kept, dedup = self.run_policy("newest", probes)
+        # Ties keep the first copy
+        self.assertEqual(kept, [False, True, False])
+        self.assertEqual(dedup.aliases, [(probes[0], probes[1]), (probes[2], probes[1])])
+
+    def test_most_cues(self):
+        probes = [probe("HD/:A.mp3", cues=2), probe("HD/:A.mp3", cues=4), probe("HD/:A.mp3", cues=4), probe("HD/:B.mp3")]
+        kept, dedup = self.run_policy("most-cues", probes)
+        self.assertEqual(kept, [False, True, False, True])
+        self.assertEqual(dedup.dropped, 2)
+
+    def test_match_metadata(self):
+        probes = [probe("HD/:A.mp3", title="Atomic", duration="281"), probe("HD/:B.mp3", title="ATOMIC", duration="281")]
+        self.assertEqual(self.run_policy("first", probes)[0], [True, True])
+        self.assertEqual(self.run_policy("first", probes, match_metadata=True)[0], [True, False])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            Deduplicator("longest")
+        with self.assertRaises(ValueError):
+            Deduplicator("newest").keep(probe("HD/:A.mp3"))
+
+    def test_scan_collection(self):
+        dedup = Deduplicator("most-cues")
+        source = io.BytesIO(b"--\n" + REKORDBOX_XML.encode("utf-8"))
+        source.seek(3)
+        scan_collection(dedup, source, "TRACK", probe_rekordbox_track)
+        # Rewound for the conversion pass
+        self.assertEqual(source.tell(), 3)
+        self.assertEqual(len(dedup.item_groups), 3)
+
+        class Pipe(io.RawIOBase):
+            def seekable(self):
+                return False
+
+        with self.assertRaises(ValueError):
+            scan_collection(Deduplicator("newest"), Pipe(), "TRACK", probe_rekordbox_track)
+
+
+class DedupConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.xml_file = self.path("collection.xml")
+        with open(self.xml_file, "w", encoding="utf-8") as file:
+            file.write(REKORDBOX_XML)
+        self.keys = [location_codec.to_traktor(location).key for location in LOCATIONS]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return join(self.directory.name, name)
+
+    def test_rekordbox_to_traktor(self):
+        for policy, survivor in SURVIVORS.items():
+            for streamed in (False, True):
+                with self.subTest(policy=policy, streamed=streamed):
+                    dedup = Deduplicator(policy)
+                    converter = Rekordbox2Traktor(dedup=dedup)
+                    nml_file = self.path(f"{policy}.nml")
+                    if streamed:
+                        converter.stream_xml_to_nml(self.xml_file, nml_file)
+                    else:
+                        converter.convert_xml_to_nml(self.xml_file, nml_file)
+
+                    root = backend.parse(nml_file)
+                    collection = root.find("COLLECTION")
+                    self.assertEqual(collection.get("ENTRIES"), "2")
+                    kept = [get_key(entry) for entry in collection.iterfind("ENTRY")]
+                    self.assertEqual(kept, [self.keys[survivor], self.keys[2]])
+
+                    # References to the dropped copy, by TrackID or by Location, point at the survivor
+                    playlists = nml_playlists(root)
+                    expected = [self.keys[survivor], self.keys[survivor], self.keys[2]]
+                    self.assertEqual(playlists["By id"], expected)
+                    self.assertEqual(playlists["By location"], expected)
+
+    def test_converter_reuse(self):
+        converter = Rekordbox2Traktor(dedup=Deduplicator("first"))
+        converter.convert_xml_to_nml(self.xml_file, self.path("dedup.nml"))
+        # The aliases of the previous conversion don't apply to the next one
+        converter.dedup = None
+        nml_file = self.path("all.nml")
+        converter.convert_xml_to_nml(self.xml_file, nml_file)
+        self.assertEqual(nml_playlists(backend.parse(nml_file))["By location"], self.keys)
+
+    def test_traktor_to_rekordbox(self):
+        # Fades are converted to hot cues, so the NML collection is written from the tracks without them
+        with open(self.xml_file, "w", encoding="utf-8") as file:
+            file.write(REKORDBOX_XML.replace(FADE.format("1.0"), "").replace(FADE.format("2.0"), ""))
+        nml_file = self.path("collection.nml")
+        Rekordbox2Traktor().convert_xml_to_nml(self.xml_file, nml_file)
+        for policy, survivor in SURVIVORS.items():
+            with self.subTest(policy=policy):
+                xml_file = self.path(f"{policy}.xml")
+                Traktor2Rekordbox(dedup=Deduplicator(policy)).stream_nml_to_xml(nml_file, xml_file)
+
+                root = backend.parse(xml_file)
+                tracks = root.findall("COLLECTION/TRACK")
+                self.assertEqual([track.get("Location") for track in tracks], [LOCATIONS[survivor], LOCATIONS[2]])
+                track_ids = [track.get("TrackID") for track in tracks]
+                playlists = {
+                    node.get("Name"): [track.get("Key") for track in node.iterfind("TRACK")]
+                    for node in root.iter("NODE")
+                    if node.get("Type") == "1"
+                }
+                expected = [track_ids[0], track_ids[0], track_ids[1]]
+                self.assertEqual(playlists["By id"], expected)
+                self.assertEqual(playlists["By location"], expected)
+
+
+def get_key(entry):
+    location = entry.find("LOCATION")
+    return location.get("VOLUME") + location.get("DIR") + location.get("FILE")
+
+
+def nml_playlists(root):
+    """PRIMARYKEY of the entries of each playlist of an NML, by playlist name."""
+    return {
+        node.get("NAME"): [key.get("KEY") for key in node.iterfind("PLAYLIST/ENTRY/PRIMARYKEY")]
+        for node in root.iter("NODE")
+        if node.get("TYPE") == "PLAYLIST"
+    }
+
+
+if __name__ == "__main__":
+    unittest.main()
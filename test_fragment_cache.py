@@ -0,0 +1,140 @@
+import tempfile
+import unittest
+from os.path import join
+
+from fragment_cache import FragmentCache
+from generate_collection import CollectionGenerator
+from nml_to_rekord import Traktor2Rekordbox
+from rekord_to_nml import Rekordbox2Traktor
+from xml_backend import backend
+
+ENTRY = (
+    '<ENTRY MODIFIED_DATE="2025/06/01" MODIFIED_TIME="0" AUDIO_ID="AWAW" TITLE="Atomic">'
+    '<LOCATION DIR="/:Music/:" FILE="Atomic.mp3" VOLUME="HD"/><INFO KEY="2m"/></ENTRY>'
+)
+
+
+def entry(**attributes):
+    """Parse ENTRY, with some of its (or its LOCATION's) attributes replaced."""
+    element = backend.fromstring(ENTRY)
+    for name, value in attributes.items():
+        target = element.find("LOCATION") if name in ("DIR", "FILE", "VOLUME") else element
+        if value is None:
+            del target.attrib[name]
+        else:
+            target.set(name, value)
+    return element
+
+
+class FragmentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, **kwargs):
+        return FragmentCache(self.path, "traktor>rekordbox", **kwargs)
+
+    def test_hits_and_misses(self):
+        with self.open() as cache:
+            key = cache.key(entry())
+            self.assertIsNone(cache.get(key))
+            cache.put(key, ("track", b"<TRACK/>"))
+            self.assertEqual(cache.get(key), ("track", b"<TRACK/>"))
+            self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+        # Fragments are kept across conversions
+        with self.open() as cache:
+            self.assertEqual(cache.get(cache.key(entry())), ("track", b"<TRACK/>"))
+
+    def test_content_key(self):
+        with self.open() as cache:
+            key = cache.key(entry())
+            self.assertEqual(cache.key(entry()), key)
+            self.assertNotEqual(cache.key(entry(TITLE="Atomic (Remix)")), key)
+
+            element = entry()
+            element.tail = "\n  "
+            self.assertEqual(cache.key(element), key)
+            self.assertEqual(element.tail, "\n  ")
+
+        with FragmentCache(self.path, "rekordbox>traktor") as cache:
+            self.assertNotEqual(cache.key(entry()), key)
+
+    def test_modified_key(self):
+        with self.open(key_mode="modified") as cache:
+            key = cache.key(entry())
+            # Only the stamp and location of the entry are read
+            self.assertEqual(cache.key(entry(TITLE="Atomic (Remix)")), key)
+            self.assertNotEqual(cache.key(entry(MODIFIED_TIME="3600")), key)
+            for attribute, value in (("FILE", "Denis.mp3"), ("DIR", "/:Mix/:"), ("VOLUME", "USB")):
+                self.assertNotEqual(cache.key(entry(**{attribute: value})), key)
+
+        with self.open() as content_cache:
+            with self.open(key_mode="modified") as cache:
+                # Entries without a complete stamp or location are keyed on their content
+                for element in (entry(AUDIO_ID=None), entry(MODIFIED_DATE=None), entry(FILE=None)):
+                    self.assertEqual(cache.key(element), content_cache.key(element))
+
+    def test_unknown_key_mode(self):
+        with self.assertRaises(ValueError):
+            self.open(key_mode="title")
+
+    def test_eviction(self):
+        value = b"x" * 1000
+        with self.open(max_bytes=5000) as cache:
+            keys = [cache.key(entry(FILE=f"{index}.mp3")) for index in range(6)]
+            for key in keys[:4]:
+                cache.put(key, value)
+            # The first fragment is now the most recently used one
+            self.assertIsNotNone(cache.get(keys[0]))
+            for key in keys[4:]:
+                cache.put(key, value)
+
+            self.assertEqual(cache.evictions, 2)
+            self.assertLessEqual(cache.size, 5000)
+            self.assertIsNotNone(cache.get(keys[0]))
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertIsNone(cache.get(keys[2]))
+            for key in keys[3:]:
+                self.assertIsNotNone(cache.get(key))
+
+
+class CachedConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Collections written by rekord_to_nml share their AUDIO_ID and MODIFIED_TIME,
+        # and generated dates repeat every 84 tracks
+        xml_file = self.path("collection.xml")
+        self.nml_file = self.path("collection.nml")
+        CollectionGenerator(100, cues=3).write_rekordbox(xml_file)
+        Rekordbox2Traktor().convert_xml_to_nml(xml_file, self.nml_file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return join(self.directory.name, name)
+
+    def convert(self, output, cache=None):
+        Traktor2Rekordbox().stream_nml_to_xml(self.nml_file, self.path(output), cache=cache)
+        with open(self.path(output), "rb") as file:
+            return file.read()
+
+    def test_cached_conversions(self):
+        expected = self.convert("expected.xml")
+        for key_mode in ("content", "modified"):
+            with self.subTest(key_mode=key_mode):
+                cache_file = self.path(f"{key_mode}.sqlite")
+                with FragmentCache(cache_file, "traktor>rekordbox", key_mode=key_mode) as cache:
+                    self.assertEqual(self.convert("first.xml", cache), expected)
+                    self.assertEqual(cache.hits, 0)
+                with FragmentCache(cache_file, "traktor>rekordbox", key_mode=key_mode) as cache:
+                    self.assertEqual(self.convert("second.xml", cache), expected)
+                    self.assertEqual(cache.stats(), {"hits": 100, "misses": 0, "evictions": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
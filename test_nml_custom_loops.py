@@ -0,0 +1,111 @@
+import os
+import stat
+import tempfile
+import unittest
+from os.path import join
+
+from expat_reader import index_collection
+from generate_collection import CollectionGenerator
+from nml_custom_loops import TraktorCustomLoops
+from xml_backend import backend
+
+LOOP = {"NAME": "Custom loop", "DISPL_ORDER": "0", "TYPE": "5", "START": "1000.0", "LEN": "4000.0", "HOTCUE": "-1"}
+
+
+class ThirdEntryLoops(TraktorCustomLoops):
+    """Define a loop on every third entry, so that patches are actually written."""
+
+    def process_entry(self, entry):
+        processed = super().process_entry(entry)
+        if processed is None or self.track_index % 3:
+            return processed
+        backend.SubElement(entry, "CUE_V2", LOOP)
+        self.added_loops += 1
+        return processed[0], True
+
+
+class CollectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.nml_file = join(self.directory.name, "collection.nml")
+        CollectionGenerator(30, cues=3).write_nml(self.nml_file)
+        os.chmod(self.nml_file, 0o640)
+        with open(self.nml_file, "rb") as file:
+            self.original = file.read()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self):
+        with open(self.nml_file, "rb") as file:
+            return file.read()
+
+
+class ProcessLoopsTest(CollectionTestCase):
+    def check_processed(self, jobs):
+        looper = ThirdEntryLoops()
+        looper.process_loops(self.nml_file, jobs=jobs)
+        self.assertEqual(looper.added_loops, 10)
+        self.assertEqual(looper.track_index, 30)
+
+        data = self.read()
+        root = backend.fromstring(data)
+        for index, entry in enumerate(root.iterfind("COLLECTION/ENTRY")):
+            self.assertEqual(len(entry.findall("CUE_V2[@NAME='Custom loop']")), 0 if index % 3 else 1)
+        return data
+
+    def test_process(self):
+        self.check_processed(jobs=1)
+
+    def test_process_shards(self):
+        sequential = self.check_processed(jobs=1)
+        with open(self.nml_file, "wb") as file:
+            file.write(self.original)
+        self.assertEqual(self.check_processed(jobs=2), sequential)
+
+
+class PatchLoopsTest(CollectionTestCase):
+    def check_patched(self, jobs):
+        looper = ThirdEntryLoops()
+        patched = looper.patch_loops(self.nml_file, jobs=jobs)
+        self.assertEqual(patched, 10)
+        self.assertEqual(looper.added_loops, 10)
+        self.assertEqual(looper.track_index, 30)
+
+        data = self.read()
+        self.assertEqual(stat.S_IMODE(os.stat(self.nml_file).st_mode), 0o640)
+        self.assertEqual(os.listdir(self.directory.name), ["collection.nml"])
+
+        # Bytes between entries and entries without loops are kept as they are
+        before, after = index_collection(self.original, "ENTRY"), index_collection(data, "ENTRY")
+        self.assertEqual(len(before), len(after))
+        self.assertEqual(self.original[:before[0][0]], data[:after[0][0]])
+        for index, ((start, end), (patched_start, patched_end)) in enumerate(zip(before, after)):
+            entry = data[patched_start:patched_end]
+            if index % 3:
+                self.assertEqual(self.original[start:end], entry)
+            else:
+                self.assertEqual(len(backend.fromstring(entry).findall("CUE_V2[@NAME='Custom loop']")), 1)
+            if index + 1 < len(before):
+                self.assertEqual(self.original[end:before[index + 1][0]], data[patched_end:after[index + 1][0]])
+        self.assertEqual(self.original[before[-1][1]:], data[after[-1][1]:])
+        return data
+
+    def test_patch(self):
+        self.check_patched(jobs=1)
+
+    def test_patch_shards(self):
+        sequential = self.check_patched(jobs=1)
+        with open(self.nml_file, "wb") as file:
+            file.write(self.original)
+        self.assertEqual(self.check_patched(jobs=2), sequential)
+
+    def test_unmodified(self):
+        modified = os.stat(self.nml_file).st_mtime_ns
+        self.assertEqual(TraktorCustomLoops().patch_loops(self.nml_file), 0)
+        self.assertEqual(self.read(), self.original)
+        self.assertEqual(os.stat(self.nml_file).st_mtime_ns, modified)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unicodedata
+import unittest
+
+from playlist_index import AMBIGUOUS, PlaylistKeyIndex
+
+CAFE = "Macintosh HD/:Music/:Café.mp3"  # Precomposed é (NFC), as written by Traktor on Windows
+
+
+class PlaylistKeyIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PlaylistKeyIndex()
+        self.index.add(CAFE, "1")
+        self.index.add("Macintosh HD/:Music/:Atomic.mp3", "2")
+        self.index.add("Macintosh HD/:Mix/:Denis.mp3", "3")
+
+    def test_exact(self):
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.resolve(CAFE), "1")
+        self.assertEqual(self.index.resolve("Macintosh HD/:Mix/:Denis.mp3"), "3")
+        self.assertIsNone(self.index.resolve("Macintosh HD/:Music/:Missing.mp3"))
+        self.assertNotIn("Macintosh HD/:Music/:Missing.mp3", self.index)
+
+    def test_normalized(self):
+        decomposed = unicodedata.normalize("NFD", CAFE)  # As written on macOS
+        self.assertNotEqual(decomposed, CAFE)
+        self.assertEqual(self.index.resolve(decomposed), "1")
+        self.assertEqual(self.index.resolve("macintosh hd/:MUSIC/:atomic.MP3"), "2")
+        # Same path on another volume
+        self.assertEqual(self.index.resolve("USB/:Music/:Atomic.mp3"), "2")
+        self.assertIn("USB/:Music/:Atomic.mp3", self.index)
+
+    def test_filename(self):
+        # Moved to another folder: only the file name matches
+        self.assertEqual(self.index.resolve("USB/:Sets/:2024/:ATOMIC.mp3"), "2")
+        self.assertEqual(self.index.resolve(unicodedata.normalize("NFD", "HD/:Old/:café.MP3")), "1")
+
+    def test_ambiguous_filename(self):
+        self.index.add("Macintosh HD/:Mix/:Atomic.mp3", "4")
+        self.assertIs(self.index.filenames["atomic.mp3"], AMBIGUOUS)
+        self.assertIsNone(self.index.resolve("USB/:Sets/:Atomic.mp3"))
+        self.assertNotIn("USB/:Sets/:Atomic.mp3", self.index)
+        # Each copy still resolves through its own path
+        self.assertEqual(self.index.resolve("Macintosh HD/:Music/:Atomic.mp3"), "2")
+        self.assertEqual(self.index.resolve("USB/:Mix/:ATOMIC.mp3"), "4")
+
+    def test_ambiguous_normalized(self):
+        # Two tracks whose paths only differ by case
+        self.index.add("Macintosh HD/:Music/:ATOMIC.mp3", "4")
+        self.assertEqual(self.index.resolve("Macintosh HD/:Music/:ATOMIC.mp3"), "4")
+        self.assertEqual(self.index.resolve("Macintosh HD/:Music/:Atomic.mp3"), "2")
+        self.assertIsNone(self.index.resolve("Macintosh HD/:Music/:atomic.mp3"))
+
+    def test_same_track_twice(self):
+        # The same TrackID added under two keys isn't ambiguous
+        self.index.add("USB/:Music/:Atomic.mp3", "2")
+        self.assertEqual(self.index.resolve("Other/:Atomic.mp3"), "2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from os.path import join
+
+from batch_convert import convert_file
+from generate_collection import CollectionGenerator
+from server import ConversionServer
+
+TIMEOUT = 30  # Seconds before a response that isn't closed fails the test
+
+
+class ConversionServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = ConversionServer(workers=1, work_dir=self.directory.name)
+        self.listener = await self.server.start(port=0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.server.close()
+        self.directory.cleanup()
+
+    async def request(self, method, url, body=b"", headers=None):
+        """
+        Returns:
+            tuple: (status, headers with lowercase names, body decoded from chunks when needed)
+        """
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        lines = [f"{method} {url} HTTP/1.1", "Host: localhost"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        # Responses end when the server closes the connection
+        response = await asyncio.wait_for(reader.read(), TIMEOUT)
+        writer.close()
+        await writer.wait_closed()
+
+        head, _, body = response.partition(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size, _, body = body.partition(b"\r\n")
+                size = int(size, 16)
+                if not size:
+                    break
+                chunks.append(body[:size])
+                body = body[size + 2:]
+            body = b"".join(chunks)
+        return int(status_line.split()[1]), headers, body
+
+    async def test_convert(self):
+        nml_file = join(self.directory.name, "collection.nml")
+        CollectionGenerator(20, cues=3, grid_markers=2).write_nml(nml_file)
+        expected_file = join(self.directory.name, "expected.xml")
+        self.assertEqual(convert_file(nml_file, expected_file), (20, None))
+        with open(nml_file, "rb") as file:
+            collection = file.read()
+        with open(expected_file, "rb") as file:
+            expected = file.read()
+
+        status, headers, body = await self.request(
+            "POST", "/convert?file=collection.nml", collection, {"Content-Length": len(collection)}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["x-converted-tracks"], "20")
+        self.assertEqual(headers["content-disposition"], 'attachment; filename="collection.xml"')
+        self.assertEqual(body, expected)
+
+    async def test_invalid_content_length(self):
+        for length in ("abc", "-1", ""):
+            with self.subTest(length=length):
+                status, _, body = await self.request("POST", "/convert?file=a.nml", b"<NML/>", {"Content-Length": length})
+                self.assertEqual(status, 400)
+                self.assertIn("Content-Length", json.loads(body)["error"])
+
+        status, _, _ = await self.request("POST", "/convert?file=a.nml", b"<NML/>")
+        self.assertEqual(status, 411)
+
+    async def test_unsupported_file(self):
+        for url in ("/convert?file=collection.txt", "/convert"):
+            with self.subTest(url=url):
+                status, _, _ = await self.request("POST", url, b"<NML/>", {"Content-Length": 6})
+                self.assertEqual(status, 400)
+
+    async def test_preflight(self):
+        status, headers, _ = await self.request("OPTIONS", "/convert")
+        self.assertEqual(status, 204)
+        self.assertEqual(headers["access-control-allow-origin"], "*")
+        self.assertIn("POST", headers["access-control-allow-methods"])
+        self.assertIn("Content-Type", headers["access-control-allow-headers"])
+
+    async def test_metrics(self):
+        await self.request("GET", "/health")
+        await self.request("POST", "/convert?file=a.nml", b"", {"Content-Length": "-1"})
+        await self.request("GET", "/missing")
+
+        status, headers, body = await self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-type"], "application/json")
+        report = json.loads(body)
+        self.assertEqual(report["in_flight"], 1)  # The /metrics request itself
+        routes = report["routes"]
+        self.assertEqual(routes["/health"]["statuses"], {"200": 1})
+        self.assertEqual(routes["/convert"]["statuses"], {"400": 1})
+        self.assertEqual(routes["/missing"]["statuses"], {"404": 1})
+        self.assertNotIn("/metrics", routes)
+        for route in routes.values():
+            self.assertLessEqual(route["latency"]["p50"], route["latency"]["max"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,21 @@
-import urllib.parse
 from xml.etree.ElementTree import Element
-from datetime import datetime
-from typing import Literal
+from typing import Literal, Optional
 
-from consts import DATE_FORMAT, COLOR_MAP, TONALITY_MAP, COLOR_NAME_TO_RGB, CUE_COLORS, RGB_TO_CUE_TYPE
+from consts import RGB_TO_CUE_TYPE
+from conversion import ConversionContext
+from locations import TraktorLocation
+from mappings import color_name
 
 softType = Literal["traktor", "rekordbox"]
 
-# VARIABLES TO BE DEFINED BY SPECIFIC SCRIPTS
-original: softType
-target: softType
+# Context of the helpers below when they aren't given one, set by scripts converting in a single direction
+default_context: Optional[ConversionContext] = None
+
 
 def set_conversion(o: softType, t: softType):
-    global original, target
-    original = o
-    target = t
+    global default_context
+    default_context = ConversionContext(o, t)
+    return default_context
 
 
 def get_attribute(element: Element, attribute):
@@ -32,155 +33,42 @@ def get_element(element: Element, sub_element):
         return None
 
 
-def format_date(date):
-    try:
-        return datetime.strptime(date, DATE_FORMAT.get(original)).strftime(DATE_FORMAT.get(target))
-    except Exception:
-        return date
+def format_date(date, context=None):
+    """Convert a date to the target format (returned as is if it can't be parsed), see DateTranscoder."""
+    return (context or default_context).format_date(date)
 
 
-def today():
+def today(context=None):
     """Get today's date in the target format."""
-    return datetime.now().strftime(DATE_FORMAT.get(target))
+    return (context or default_context).today()
 
 
-def _get_traktor_track_color(rgb_color):
-    """Convert Rekordbox RGB color to Traktor color number."""
-    return COLOR_MAP.get(rgb_color, "")
+def get_track_color(color, context=None):
+    return (context or default_context).get_track_color(color)
 
 
-def _get_rekordbox_track_color(color_nb):
-    """Convert Traktor color number to Rekordbox RGB color."""
-    # Reverse lookup in the COLOR_MAP
-    for rgb, num in COLOR_MAP.items():
-        if num == color_nb:
-            return rgb
-    return ""
-
-
-def get_track_color(color):
-    if target == "traktor":
-        return _get_traktor_track_color(color)
-    elif target == "rekordbox":
-        return _get_rekordbox_track_color(color)
-    return ""
+def get_cue_type(ctype, context=None):
+    return (context or default_context).get_cue_type(ctype)
 
 
-def _get_traktor_cue_type(rekordbox_type):
-    """Convert Rekordbox cue type to Traktor cue type."""
-    # Rekordbox: Cue = "0", Loop = "4"
-    # Traktor: Cue = "0", Fade-In = "1", Fade-Out = "2", Load = "3", AutoGrid / Grid = "4", Loop = "5"
-    return "5" if rekordbox_type == "4" else "0"
+def get_tonalikey(tonalikey, context=None):
+    return (context or default_context).get_tonalikey(tonalikey)
 
 
-def _get_rekordbox_cue_type(traktor_type):
-    """Convert Traktor cue type to Rekordbox cue type."""
-    # Traktor: Cue = "0", Fade-In = "1", Fade-Out = "2", Load = "3", AutoGrid / Grid = "4", Loop = "5"
-    # Rekordbox: Cue = "0", Loop = "4" (Fade-In "1", Fade-Out "2", Load "3" DON'T WORK)
-    return "4" if traktor_type == "5" else "0"
-
-
-def get_cue_type(ctype):
-    if target == "traktor":
-        return _get_traktor_cue_type(ctype)
-    elif target == "rekordbox":
-        return _get_rekordbox_cue_type(ctype)
-    return "0"
-
-
-def _get_traktor_key(tonality):
-    """Convert Rekordbox tonality to Traktor musical key."""
-    return TONALITY_MAP.get(tonality, "0")
-
-
-def _get_rekordbox_tonality(musical_key):
-    """Convert Traktor musical key to Rekordbox tonality."""
-    for ton, key in TONALITY_MAP.items():
-        if key == musical_key:
-            return ton
-    return ""
-
-
-def get_tonalikey(tonalikey):
-    if target == "rekordbox":
-        return _get_rekordbox_tonality(tonalikey)
-    elif target == "traktor":
-        return _get_traktor_key(tonalikey)
-    return ""
-
-
-def _get_traktor_location(location):
-    """Parse Rekordbox location to get directory, file and volume."""
-    is_unix = "Users" in location
-    volume = "Macintosh HD"  # TODO fix here for Windows
-
-    if not location or not location.startswith("file://localhost"):
-        return {
-            "DIR": "/:",
-            "FILE": "",
-            "VOLUME": volume
-        }
-
-    path = location.replace("file://localhost", "")
-    path = urllib.parse.unquote(path)
-
-    # Check if it's a Windows path (contains drive letter like /D:/ or /C:/)
-    if len(path) > 3 and path[0] == "/" and path[2] == ":":
-        # Windows path: /D:/folder/file.mp3
-        drive_letter = path[1].upper()
-        path_without_drive = path[3:]
-        parts = [p for p in path_without_drive.split("/") if p]  # Remove empty parts
-
-        file_name = parts[-1] if parts else ""
-        dir_parts = parts[:-1] if parts else []
-
-        dir_parts = [f"{drive_letter}:"] + dir_parts
-        dir_path = "/:".join([""] + dir_parts + [""])
-
-    else:
-        # Mac/Unix path: /Users/DJ/file.mp3
-        parts = [p for p in path.split("/") if p]  # Remove empty parts
-
-        if not parts:
-            return {
-                "DIR": "/:",
-                "FILE": "",
-                "VOLUME": volume
-            }
-
-        file_name = parts[-1] if parts else ""
-        dir_parts = parts[:-1]
-        dir_path = "/:".join([""] + dir_parts + [""])
-
-    return {
-        "DIR": dir_path,
-        "FILE": file_name,
-        "VOLUME": volume
-    }
-
-
-def _get_rekordbox_location(location):
-    """Get Rekordbox location path from directory, file and volume."""
-    if location is not None:
-        dir_path = location.get("DIR").replace("/:","/")
-        file_name = location.get("FILE")
-        volume = get_attribute(location, "VOLUME")
-        disk = f"/{volume}" if not "Mac" in volume else ""
-        return f"file://localhost{disk}{dir_path}{file_name}".replace(" ", "%20")
-    return ""
-
-
-def get_location(location):
-    if target == "traktor":
-        return _get_traktor_location(location)
-    elif target == "rekordbox":
-        return _get_rekordbox_location(location)
-    return ""
+def get_location(location, context=None):
+    """
+    Convert a location: Rekordbox URL to a {"DIR", "FILE", "VOLUME"} dict of LOCATION attributes,
+    or Traktor LOCATION element to Rekordbox URL.
+    """
+    converted = (context or default_context).get_location(location)
+    if isinstance(converted, TraktorLocation):
+        return {"DIR": converted.dir, "FILE": converted.file, "VOLUME": converted.volume}
+    return converted
 
 
 def map_to_color(ctype):
-    ctype = str(ctype).lower().replace(" ", "").replace("-", "")
-    return CUE_COLORS.get(ctype, "blue")
+    """Color name of a cue type or name (case, spaces and dashes ignored)."""
+    return color_name(ctype)
 
 
 def color_distance(color1, color2):
@@ -208,6 +96,7 @@ def find_closest_color(target_rgb, color_map):
 
 
 def get_cue_color_values(r, g, b):
+    """Traktor cue type of a Rekordbox cue color: its type in the palette, or the type of the closest palette color."""
     rgb_key = f"{r}-{g}-{b}"
     if rgb_key in RGB_TO_CUE_TYPE:
         return RGB_TO_CUE_TYPE[rgb_key]
@@ -216,30 +105,13 @@ def get_cue_color_values(r, g, b):
 
     return closest_type or "0"
 
-def _set_traktor_cue_color(cue, r, g, b):
-    ctype = get_cue_color_values(r, g, b)
-    # cue.set("Type", ctype)
-    # if ctype in ["1", "2"]: # Only for fade-in/fade-out which need color
-    #     cue.set("COLOR", f"#{int(r):02X}{int(g):02X}{int(b):02X}")
-    return cue
 
-def _set_rekordbox_cue_color(cue, ctype, cname):
-    if ctype == "0" and cname != "n.n.":
-        ctype = cname
+def get_cue_color(context=None, **kwargs):
+    """Get the color attributes of a cue in the target format (empty when it has none)."""
+    return (context or default_context).get_cue_color(**kwargs)
 
-    color = map_to_color(ctype)
-    rgb = COLOR_NAME_TO_RGB.get(color, "")
-    if rgb:
-        cue.set("Red", rgb["R"])
-        cue.set("Green", rgb["G"])
-        cue.set("Blue", rgb["B"])
-    return cue
 
-def set_cue_color(cue, **kwargs):
-    if target == "traktor":
-        r, g, b = kwargs.get("r"), kwargs.get("g"), kwargs.get("b")
-        return _set_traktor_cue_color(cue, r, g, b)
-    elif target == "rekordbox":
-        ctype, cname = kwargs.get("ctype"), kwargs.get("cname")
-        return _set_rekordbox_cue_color(cue, ctype, cname)
+def set_cue_color(cue, context=None, **kwargs):
+    for attribute, value in get_cue_color(context, **kwargs).items():
+        cue.set(attribute, value)
     return cue
@@ -0,0 +1,104 @@
+import re
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+BACKENDS = ("auto", "stdlib", "lxml")
+DECLARATION = b"<?xml version='1.0' encoding='utf-8'?>\n"
+
+# Serialization differences between libxml2 and ElementTree, for documents made of attributes only
+# ("<" and ">" are always escaped in attribute values, so they only appear as tag delimiters)
+LXML_EMPTY_ELEMENT = re.compile(rb"<([^\s/>]+)([^>]*)/>")
+LXML_TAB = b"&#9;"
+STDLIB_TAB = b"&#09;"
+
+
+def _stdlib_parse(source):
+    return ET.parse(source).getroot()
+
+
+def _stdlib_tostring(element, short_empty_elements=True):
+    return ET.tostring(element, encoding="utf-8", short_empty_elements=short_empty_elements)
+
+
+def _stdlib_write(element, path, short_empty_elements=True):
+    tree = ET.ElementTree(element)
+    tree.write(path, encoding="utf-8", xml_declaration=True, short_empty_elements=short_empty_elements)
+
+
+def _lxml_parse(source):
+    return lxml_etree.parse(source, lxml_etree.XMLParser(huge_tree=True)).getroot()
+
+
+def _lxml_iterparse(source, events=("end",)):
+    return lxml_etree.iterparse(source, events=events, huge_tree=True)
+
+
+def _lxml_tostring(element, short_empty_elements=True):
+    """Serialize with libxml2, then normalize the output to what ElementTree writes."""
+    data = lxml_etree.tostring(element, encoding="utf-8", xml_declaration=False)
+    if short_empty_elements:
+        data = data.replace(b"/>", b" />")
+    else:
+        data = LXML_EMPTY_ELEMENT.sub(rb"<\1\2></\1>", data)
+    return data.replace(LXML_TAB, STDLIB_TAB)
+
+
+def _lxml_write(element, path, short_empty_elements=True):
+    with open(path, "wb") as file:
+        file.write(DECLARATION)
+        file.write(_lxml_tostring(element, short_empty_elements))
+
+
+class XmlBackend:
+    """
+    XML parsing and serialization functions used by the converters.
+
+    Attributes are swapped in place by `load`, so that modules importing `backend` always use
+    the selected implementation without any indirection. Both implementations write the same bytes:
+        - parse(source): root element of a document
+        - iterparse(source, events): incremental parsing events
+        - Element, SubElement, fromstring: element factories
+        - tostring(element, short_empty_elements=True): UTF-8 bytes, without declaration
+        - write(element, path, short_empty_elements=True): full document, with declaration
+    """
+
+    def __init__(self, name="auto"):
+        self.load(name)
+
+    def load(self, name="auto"):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown XML backend {name!r}, expected one of {BACKENDS}")
+        if name == "lxml" and lxml_etree is None:
+            raise ValueError("The lxml backend requires lxml to be installed (pip install lxml)")
+        if name == "auto":
+            name = "lxml" if lxml_etree is not None else "stdlib"
+
+        self.name = name
+        if name == "lxml":
+            self.parse = _lxml_parse
+            self.iterparse = _lxml_iterparse
+            self.Element = lxml_etree.Element
+            self.SubElement = lxml_etree.SubElement
+            self.fromstring = lxml_etree.fromstring
+            self.tostring = _lxml_tostring
+            self.write = _lxml_write
+        else:
+            self.parse = _stdlib_parse
+            self.iterparse = ET.iterparse
+            self.Element = ET.Element
+            self.SubElement = ET.SubElement
+            self.fromstring = ET.fromstring
+            self.tostring = _stdlib_tostring
+            self.write = _stdlib_write
+
+
+backend = XmlBackend()
+
+
+def use_backend(name):
+    """Select the XML backend ("auto": lxml when installed, else stdlib)."""
+    backend.load(name)